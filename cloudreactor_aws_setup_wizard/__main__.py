@@ -1,10 +1,34 @@
 import argparse
+import contextlib
+import functools
+import json
 import logging
 import os
+import sys
+from typing import Any, Optional
 
-import jsonpickle
-
+from .aws_calls import AwsCallPolicy
+from .batch import EXAMPLE_SPEC, STATUS_SUCCEEDED, BatchRun, load_batch_spec
+from .fanout import (
+    DEFAULT_MAX_API_CALLS_PER_SECOND,
+    DEFAULT_MAX_WORKERS,
+    DEFAULT_MAX_WORKERS_PER_ACCOUNT,
+    BatchFanout,
+    PrefixedOutput,
+    make_assumed_role_sessions,
+    make_target_specs,
+    print_result_table,
+)
+from .rate_limiter import TokenBucket
+from .tracing import (
+    EXPORT_FORMATS,
+    FORMAT_JSON_LINES,
+    TIMING_ENV_VAR,
+    TIMING_EXPORT_ENV_VAR,
+    configure_tracing,
+)
 from .wizard import SAVED_STATE_DIRECTORY, SAVED_STATE_FILENAME, Wizard
+from .wizard_state import WizardState
 
 DEFAULT_LOG_LEVEL = "ERROR"
 
@@ -21,27 +45,39 @@ BANNER = r"""
 """
 
 
-def run():
-    parser = argparse.ArgumentParser()
+def make_argument_parser(**kwargs) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(**kwargs)
 
     parser.add_argument("--api-base-url", help="CloudReactor API base URL")
     parser.add_argument("--environment", help="CloudReactor deployment environment")
+    parser.add_argument(
+        "--max-list-pages",
+        type=int,
+        help="Maximum number of pages to fetch when listing AWS resources. Defaults to no limit.",
+    )
     parser.add_argument(
         "--log-level",
         help=f"Log level (DEBUG, INFO, WARNING, ERROR, CRITICAL). Defaults to {DEFAULT_LOG_LEVEL}.",
     )
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        help=f"Print a table of the time spent in AWS calls, CloudReactor API calls and other steps at exit. Can also be enabled by setting {TIMING_ENV_VAR}.",
+    )
+    parser.add_argument(
+        "--timing-export",
+        help=f"File to write the timed spans to at exit. Implies --timing. Defaults to the value of {TIMING_EXPORT_ENV_VAR}.",
+    )
+    parser.add_argument(
+        "--timing-format",
+        choices=EXPORT_FORMATS,
+        help=f"Format of the exported spans: JSON lines, or OpenTelemetry spans in OTLP/JSON. Defaults to {FORMAT_JSON_LINES}.",
+    )
 
-    args = parser.parse_args()
-
-    api_base_url = args.api_base_url
+    return parser
 
-    cloudreactor_deployment_environment = args.environment or "production"
-
-    if cloudreactor_deployment_environment != "production":
-        print(
-            f"Using CloudReactor deployment environment '{cloudreactor_deployment_environment}'"
-        )
 
+def configure_logging(args: argparse.Namespace) -> None:
     log_level = (
         args.log_level or os.environ.get("WIZARD_LOG_LEVEL", DEFAULT_LOG_LEVEL)
     ).upper()
@@ -53,6 +89,31 @@ def run():
         numeric_log_level = getattr(logging, DEFAULT_LOG_LEVEL, None)
 
     logging.basicConfig(level=numeric_log_level, format="%(levelname)s: %(message)s")
+
+
+def configure_timing(args: argparse.Namespace) -> None:
+    configure_tracing(
+        enabled=args.timing,
+        export_filename=args.timing_export,
+        export_format=args.timing_format,
+    )
+
+
+def run():
+    parser = make_argument_parser()
+    args = parser.parse_args()
+
+    api_base_url = args.api_base_url
+
+    cloudreactor_deployment_environment = args.environment or "production"
+
+    if cloudreactor_deployment_environment != "production":
+        print(
+            f"Using CloudReactor deployment environment '{cloudreactor_deployment_environment}'"
+        )
+
+    configure_logging(args)
+    configure_timing(args)
     print(BANNER)
 
     print(
@@ -76,12 +137,16 @@ Tips:
     if os.path.isfile(SAVED_STATE_FILENAME):
         try:
             with open(SAVED_STATE_FILENAME) as f:
-                wizard = jsonpickle.decode(f.read())
-                wizard.set_options(
-                    api_base_url=api_base_url,
-                    cloudreactor_deployment_environment=cloudreactor_deployment_environment,
-                )
+                saved_state = WizardState.decode(f.read())
+
+            wizard = Wizard(
+                api_base_url=api_base_url,
+                cloudreactor_deployment_environment=cloudreactor_deployment_environment,
+                max_list_pages=args.max_list_pages,
+            )
+            wizard.restore_saved_state(saved_state)
         except Exception:
+            logging.debug("Failed to read save file", exc_info=True)
             print("Couldn't read save file, starting over. Sorry about that!")
     else:
         print("No save file found, starting a new save file.")
@@ -93,10 +158,112 @@ Tips:
         wizard = Wizard(
             api_base_url=api_base_url,
             cloudreactor_deployment_environment=cloudreactor_deployment_environment,
+            max_list_pages=args.max_list_pages,
         )
 
     wizard.run()
 
 
+def run_batch(argv: Optional[list[str]] = None):
+    parser = make_argument_parser(
+        description="Set up an AWS environment for CloudReactor without prompts, using the settings in a YAML or JSON spec file.",
+        epilog="Example spec file:\n" + EXAMPLE_SPEC,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("spec_file", help="YAML or JSON file with the settings")
+    parser.add_argument(
+        "--output",
+        help="File to write the JSON results to. Defaults to standard output.",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"Maximum number of accounts and regions to set up at the same time, if the spec has several. Defaults to {DEFAULT_MAX_WORKERS}.",
+    )
+    parser.add_argument(
+        "--max-workers-per-account",
+        type=int,
+        default=DEFAULT_MAX_WORKERS_PER_ACCOUNT,
+        help=f"Maximum number of regions of the same account to set up at the same time. Defaults to {DEFAULT_MAX_WORKERS_PER_ACCOUNT}.",
+    )
+    parser.add_argument(
+        "--max-api-calls-per-second",
+        type=float,
+        default=DEFAULT_MAX_API_CALLS_PER_SECOND,
+        help=f"Maximum rate of AWS API calls, shared by all accounts. 0 means no limit. Defaults to {DEFAULT_MAX_API_CALLS_PER_SECOND}.",
+    )
+
+    args = parser.parse_args(argv)
+    configure_logging(args)
+    configure_timing(args)
+
+    try:
+        spec = load_batch_spec(args.spec_file)
+    except Exception as ex:
+        parser.error(f"Can't read spec file '{args.spec_file}': {ex}")
+
+    rate_limiter: Optional[TokenBucket] = None
+    if args.max_api_calls_per_second > 0:
+        rate_limiter = TokenBucket(args.max_api_calls_per_second)
+
+    try:
+        assumed_role_sessions = make_assumed_role_sessions(spec, rate_limiter)
+    except ValueError as ex:
+        parser.error(str(ex))
+
+    def make_wizard(target_spec: dict[str, Any]) -> Wizard:
+        account_id = (target_spec.get("aws") or {}).get("account_id")
+        boto_session_factory = None
+
+        if assumed_role_sessions and account_id:
+            boto_session_factory = functools.partial(
+                assumed_role_sessions.make_session, str(account_id)
+            )
+
+        return Wizard(
+            api_base_url=args.api_base_url,
+            cloudreactor_deployment_environment=args.environment or "production",
+            max_list_pages=args.max_list_pages,
+            interactive=False,
+            state_filename=None,
+            boto_session_factory=boto_session_factory,
+            # The rate limit is shared by all accounts and regions
+            aws_call_policy=AwsCallPolicy(rate_limiter=rate_limiter),
+        )
+
+    target_specs = make_target_specs(spec)
+
+    # Keep standard output for the results, so they can be piped
+    if target_specs:
+        output = PrefixedOutput(sys.stderr)
+        with contextlib.redirect_stdout(output):
+            results = BatchFanout(
+                target_specs=target_specs,
+                make_wizard=make_wizard,
+                max_workers=args.max_workers,
+                max_workers_per_account=args.max_workers_per_account,
+                output=output,
+            ).run()
+
+        print_result_table(results)
+    else:
+        with contextlib.redirect_stdout(sys.stderr):
+            results = BatchRun(spec, make_wizard(spec)).run()
+
+    encoded_results = json.dumps(results, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(encoded_results + "\n")
+    else:
+        print(encoded_results)
+
+    sys.exit(0 if results["status"] == STATUS_SUCCEEDED else 1)
+
+
 if __name__ == "__main__":
-    run()
+    if sys.argv[1:2] == ["batch"]:
+        run_batch(sys.argv[2:])
+    else:
+        run()
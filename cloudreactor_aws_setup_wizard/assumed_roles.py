@@ -0,0 +1,138 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from .rate_limiter import TokenBucket
+
+if TYPE_CHECKING:
+    import boto3
+    from botocore.credentials import RefreshableCredentials
+
+DEFAULT_ROLE_SESSION_NAME = "cloudreactor-aws-setup-wizard"
+DEFAULT_DURATION_SECONDS = 3600
+
+
+# Makes boto3 Sessions for other accounts by assuming a role in each of them,
+# starting from the credentials of a source Session. The temporary
+# credentials of each account are cached and shared by all of its Sessions,
+# and are refreshed by botocore shortly before they expire.
+class AssumedRoleSessions(object):
+    def __init__(
+        self,
+        source_session_factory: Callable[[], "boto3.Session"],
+        role_name: str,
+        external_id: Optional[str] = None,
+        role_session_name: str = DEFAULT_ROLE_SESSION_NAME,
+        duration_seconds: int = DEFAULT_DURATION_SECONDS,
+        rate_limiter: Optional[TokenBucket] = None,
+    ) -> None:
+        self.source_session_factory = source_session_factory
+        self.role_name = role_name
+        self.external_id = external_id
+        self.role_session_name = role_session_name
+        self.duration_seconds = duration_seconds
+        self.rate_limiter = rate_limiter
+        self.sts_client: Any = None
+        self.partition: Optional[str] = None
+        self.account_id_to_credentials: dict[str, "RefreshableCredentials"] = {}
+        self.account_id_to_lock: dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+        self.sts_lock = threading.Lock()
+
+    def make_session(self, account_id: str, region: Optional[str]) -> "boto3.Session":
+        import boto3
+        from botocore.session import get_session
+
+        botocore_session = get_session()
+        botocore_session.get_component("credential_provider").insert_before(
+            "env", make_credential_provider(self.get_credentials(account_id))
+        )
+
+        if region:
+            botocore_session.set_config_variable("region", region)
+
+        # Calls made with the session are limited by the AwsCallPolicy of the
+        # Wizard that uses it; rate_limiter only applies to assuming roles
+        return boto3.Session(botocore_session=botocore_session)
+
+    def get_credentials(self, account_id: str) -> "RefreshableCredentials":
+        with self.lock:
+            account_lock = self.account_id_to_lock.setdefault(
+                account_id, threading.Lock()
+            )
+
+        # Accounts are assumed in parallel, but each one only once
+        with account_lock:
+            credentials = self.account_id_to_credentials.get(account_id)
+
+            if credentials is None:
+                from botocore.credentials import RefreshableCredentials
+
+                credentials = RefreshableCredentials.create_from_metadata(
+                    metadata=self.fetch_credentials(account_id),
+                    refresh_using=lambda: self.fetch_credentials(account_id),
+                    method="sts-assume-role",
+                )
+                self.account_id_to_credentials[account_id] = credentials
+
+            return credentials
+
+    def fetch_credentials(self, account_id: str) -> dict[str, str]:
+        role_arn = self.make_role_arn(account_id)
+        logging.info(f"Assuming role {role_arn} ...")
+
+        kwargs: dict[str, Any] = {
+            "RoleArn": role_arn,
+            "RoleSessionName": self.role_session_name,
+            "DurationSeconds": self.duration_seconds,
+        }
+
+        if self.external_id:
+            kwargs["ExternalId"] = self.external_id
+
+        credentials = self.get_sts_client().assume_role(**kwargs)["Credentials"]
+
+        return {
+            "access_key": credentials["AccessKeyId"],
+            "secret_key": credentials["SecretAccessKey"],
+            "token": credentials["SessionToken"],
+            "expiry_time": credentials["Expiration"].isoformat(),
+        }
+
+    def make_role_arn(self, account_id: str) -> str:
+        sts_client = self.get_sts_client()
+
+        with self.sts_lock:
+            if self.partition is None:
+                # GovCloud and China regions use their own partitions
+                caller_arn = sts_client.get_caller_identity()["Arn"]
+                self.partition = caller_arn.split(":")[1]
+
+        return f"arn:{self.partition}:iam::{account_id}:role/{self.role_name}"
+
+    def get_sts_client(self):
+        with self.sts_lock:
+            if self.sts_client is None:
+                session = self.source_session_factory()
+
+                if self.rate_limiter:
+                    self.rate_limiter.attach_to_session(session)
+
+                self.sts_client = session.client("sts")
+
+            return self.sts_client
+
+
+# Makes a botocore credential provider that returns the given credentials. It
+# goes first in the provider chain, so the environment and config files of the
+# source account aren't used instead.
+def make_credential_provider(credentials: "RefreshableCredentials") -> Any:
+    from botocore.credentials import CredentialProvider
+
+    class AssumedRoleCredentialProvider(CredentialProvider):
+        METHOD = "sts-assume-role"
+
+        def load(self) -> "RefreshableCredentials":
+            return credentials
+
+    return AssumedRoleCredentialProvider()
@@ -0,0 +1,96 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .cloudreactor_api_client import CloudReactorApiClient, make_pool_manager
+from .token_cache import TokenCache
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+# An asyncio version of CloudReactorApiClient, for registering many Run
+# Environments at once. Each request runs the synchronous client in a worker
+# thread: the client is thread safe, logs in only once, and its pool manager,
+# sized to the concurrency limit, keeps connections to the server alive
+# between requests. A semaphore limits how many requests are in flight.
+#
+# Use it as an async context manager, so the worker threads and connections
+# are released:
+#
+#     async with AsyncCloudReactorApiClient(username, password) as client:
+#         await asyncio.gather(*[client.create_run_environment(d) for d in ...])
+class AsyncCloudReactorApiClient(object):
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        api_base_url: Optional[str] = None,
+        cloudreactor_deployment_environment: Optional[str] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        token_cache: Optional[TokenCache] = None,
+        client: Optional[CloudReactorApiClient] = None,
+    ) -> None:
+        self.max_concurrency = max(max_concurrency, 1)
+        self.client = client or CloudReactorApiClient(
+            username=username,
+            password=password,
+            api_base_url=api_base_url,
+            cloudreactor_deployment_environment=cloudreactor_deployment_environment,
+            http=make_pool_manager(max_pool_size=self.max_concurrency),
+            token_cache=token_cache,
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    async def __aenter__(self) -> "AsyncCloudReactorApiClient":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+        self.client.http.clear()
+
+    async def list_groups(self) -> dict[str, Any]:
+        return await self.call(self.client.list_groups)
+
+    async def create_group(self, data: dict[str, Any]) -> dict[str, Any]:
+        return await self.call(self.client.create_group, data)
+
+    async def list_run_environments(self, group_id: int) -> dict[str, Any]:
+        return await self.call(self.client.list_run_environments, group_id)
+
+    async def create_run_environment(self, data: dict[str, Any]) -> dict[str, Any]:
+        return await self.call(self.client.create_run_environment, data)
+
+    async def update_run_environment(
+        self, uuid: str, data: dict[str, Any]
+    ) -> dict[str, Any]:
+        return await self.call(self.client.update_run_environment, uuid, data)
+
+    async def create_or_update_run_environment(
+        self, uuid: Optional[str], data: dict[str, Any]
+    ) -> dict[str, Any]:
+        return await self.call(self.client.create_or_update_run_environment, uuid, data)
+
+    async def call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.get_executor(), functools.partial(fn, *args)
+            )
+
+    # The default executor of the event loop may have fewer threads than the
+    # concurrency limit, so the client has its own
+    def get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix="cloudreactor-api-async",
+            )
+
+        return self.executor
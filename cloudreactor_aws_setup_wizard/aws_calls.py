@@ -0,0 +1,308 @@
+import threading
+from typing import TYPE_CHECKING, Any, Optional
+
+from .rate_limiter import TokenBucket
+from .tracing import (
+    ATTRIBUTE_BYTES_RECEIVED,
+    ATTRIBUTE_BYTES_SENT,
+    ATTRIBUTE_RETRIES,
+    SPAN_KIND_CLIENT,
+    get_tracer,
+)
+
+if TYPE_CHECKING:
+    import boto3
+    from botocore.config import Config
+
+ERROR_THROTTLING = "throttling"
+ERROR_FATAL = "fatal"
+ERROR_TRANSIENT = "transient"
+
+THROTTLING_ERROR_CODES = set(
+    [
+        "Throttling",
+        "ThrottlingException",
+        "ThrottledException",
+        "RequestThrottled",
+        "RequestThrottledException",
+        "TooManyRequestsException",
+        "RequestLimitExceeded",
+        "ProvisionedThroughputExceededException",
+        "TransactionInProgressException",
+        "BandwidthLimitExceeded",
+        "SlowDown",
+        "EC2ThrottledException",
+        "PriorRequestNotComplete",
+    ]
+)
+
+# Errors that won't go away by trying again with the same credentials and
+# arguments
+FATAL_ERROR_CODES = set(
+    [
+        "AccessDenied",
+        "AccessDeniedException",
+        "AuthFailure",
+        "InvalidAccessKeyId",
+        "InvalidClientTokenId",
+        "InvalidParameterCombination",
+        "InvalidParameterValue",
+        "MissingParameter",
+        "OptInRequired",
+        "SignatureDoesNotMatch",
+        "UnauthorizedOperation",
+        "UnrecognizedClientException",
+        "ValidationError",
+        "ValidationException",
+    ]
+)
+
+DEFAULT_MAX_ATTEMPTS = 8
+
+# Requests per second for each service, below the documented API rate
+# limits, which are shared by everything else using the same account
+DEFAULT_SERVICE_RATES = {
+    "cloudformation": 4.0,
+    "ec2": 20.0,
+    "ecs": 10.0,
+    "iam": 5.0,
+    "sts": 10.0,
+}
+DEFAULT_SERVICE_RATE = 10.0
+
+# The key of the span of a call in the botocore request context
+SPAN_CONTEXT_KEY = "wizard_span"
+
+
+def get_error_code(ex: BaseException) -> Optional[str]:
+    response = getattr(ex, "response", None)
+
+    if not isinstance(response, dict):
+        return None
+
+    return (response.get("Error") or {}).get("Code")
+
+
+def is_throttling_error(ex: BaseException) -> bool:
+    return get_error_code(ex) in THROTTLING_ERROR_CODES
+
+
+def classify_error(ex: BaseException) -> str:
+    code = get_error_code(ex)
+
+    if code in THROTTLING_ERROR_CODES:
+        return ERROR_THROTTLING
+
+    if code in FATAL_ERROR_CODES:
+        return ERROR_FATAL
+
+    # Includes network errors, which have no code
+    return ERROR_TRANSIENT
+
+
+# Counts AWS API calls, retries and throttling per service. Updated from
+# botocore event handlers, which may run in several threads at once.
+class AwsCallMetrics(object):
+    def __init__(self) -> None:
+        self.service_to_counts: dict[str, dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def add(self, service: str, name: str, amount: float = 1) -> None:
+        with self.lock:
+            counts = self.service_to_counts.setdefault(
+                service,
+                {"calls": 0, "retries": 0, "throttled": 0, "throttled_seconds": 0.0},
+            )
+            counts[name] += amount
+
+    def to_dict(self) -> dict[str, dict[str, float]]:
+        with self.lock:
+            return {
+                service: dict(counts)
+                for service, counts in sorted(self.service_to_counts.items())
+            }
+
+    def format_summary(self) -> str:
+        return ", ".join(
+            f"{service}: {int(counts['calls'])} calls, {int(counts['retries'])} retries, {int(counts['throttled'])} throttled ({counts['throttled_seconds']:.1f}s)"
+            for service, counts in self.to_dict().items()
+        )
+
+
+# The policy applied to every AWS API call the wizard makes. Clients use
+# botocore's adaptive retry mode, which backs off and slows down after
+# throttling errors, and a token bucket per service keeps each session under
+# the API rate limits to begin with. Event handlers record the metrics, and a
+# span per call if tracing is enabled, so no call site needs to change.
+# rate_limiter, if given, limits calls of all services, and may be shared
+# with other policies, for example to limit the rate across accounts.
+class AwsCallPolicy(object):
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        service_rates: Optional[dict[str, float]] = None,
+        default_rate: float = DEFAULT_SERVICE_RATE,
+        metrics: Optional[AwsCallMetrics] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.service_rates = (
+            DEFAULT_SERVICE_RATES if service_rates is None else service_rates
+        )
+        self.default_rate = default_rate
+        self.metrics = metrics or AwsCallMetrics()
+        self.rate_limiter = rate_limiter
+        self.service_to_bucket: dict[str, TokenBucket] = {}
+        self.config: Optional["Config"] = None
+        self.lock = threading.Lock()
+
+    def make_client(self, session: "boto3.Session", service_name: str):
+        return session.client(service_name, config=self.get_config())
+
+    def get_config(self) -> "Config":
+        if self.config is None:
+            from botocore.config import Config
+
+            self.config = Config(
+                retries={"mode": "adaptive", "max_attempts": self.max_attempts}
+            )
+
+        return self.config
+
+    def get_bucket(self, service: str) -> TokenBucket:
+        with self.lock:
+            bucket = self.service_to_bucket.get(service)
+
+            if bucket is None:
+                bucket = TokenBucket(self.service_rates.get(service, self.default_rate))
+                self.service_to_bucket[service] = bucket
+
+            return bucket
+
+    # Must be called before clients of the session are created
+    def attach_to_session(self, session: "boto3.Session") -> None:
+        events = session.events
+        events.register("before-call", self.handle_before_call)
+        events.register("needs-retry", self.handle_needs_retry)
+        events.register("after-call", self.handle_after_call)
+        events.register("after-call-error", self.handle_after_call_error)
+
+    def handle_before_call(
+        self,
+        event_name: str,
+        params: Optional[dict[str, Any]] = None,
+        context: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        service = get_service_from_event_name(event_name)
+        tracer = get_tracer()
+        span = None
+
+        # Started before waiting for the rate limit, which is part of the
+        # time the call takes
+        if tracer.enabled and (context is not None):
+            span = tracer.start_span(
+                "aws." + event_name.split(".", 1)[-1],
+                {
+                    "region": context.get("client_region"),
+                    ATTRIBUTE_BYTES_SENT: get_request_size(params),
+                },
+                kind=SPAN_KIND_CLIENT,
+            )
+            context[SPAN_CONTEXT_KEY] = span
+
+        waited = self.get_bucket(service).acquire()
+
+        if self.rate_limiter:
+            waited += self.rate_limiter.acquire()
+
+        if waited > 0:
+            self.metrics.add(service, "throttled_seconds", waited)
+
+            if span is not None:
+                span.attributes["throttled_seconds"] = waited
+
+    # Only observes responses; botocore's retry handler decides whether to
+    # retry
+    def handle_needs_retry(
+        self, event_name: str, response: Any = None, **kwargs: Any
+    ) -> None:
+        if not response:
+            return None
+
+        code = (response[1].get("Error") or {}).get("Code")
+
+        if code in THROTTLING_ERROR_CODES:
+            self.metrics.add(get_service_from_event_name(event_name), "throttled")
+
+        return None
+
+    def handle_after_call(
+        self,
+        event_name: str,
+        http_response: Any = None,
+        parsed: Optional[dict[str, Any]] = None,
+        model: Any = None,
+        context: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        service = get_service_from_event_name(event_name)
+        self.metrics.add(service, "calls")
+
+        retries = ((parsed or {}).get("ResponseMetadata") or {}).get("RetryAttempts")
+        if retries:
+            self.metrics.add(service, "retries", retries)
+
+        span = (context or {}).pop(SPAN_CONTEXT_KEY, None)
+        if span is None:
+            return
+
+        span.attributes[ATTRIBUTE_RETRIES] = retries or 0
+
+        if http_response is not None:
+            span.attributes["status_code"] = http_response.status_code
+
+            # Reading a streaming body here would consume it
+            if not getattr(model, "has_streaming_output", False):
+                span.attributes[ATTRIBUTE_BYTES_RECEIVED] = len(
+                    http_response.content or b""
+                )
+
+        error_code = ((parsed or {}).get("Error") or {}).get("Code")
+        if error_code:
+            span.error = error_code
+
+        get_tracer().end_span(span)
+
+    # Called instead of handle_after_call if no response was received
+    def handle_after_call_error(
+        self,
+        event_name: str,
+        exception: Optional[BaseException] = None,
+        context: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        span = (context or {}).pop(SPAN_CONTEXT_KEY, None)
+
+        if span is not None:
+            get_tracer().end_span(span, error=exception)
+
+
+# Query protocol requests, like EC2's, have their parameters in a dict until
+# they are sent, so their size is estimated
+def get_request_size(params: Optional[dict[str, Any]]) -> int:
+    body = (params or {}).get("body")
+
+    if isinstance(body, dict):
+        return sum(len(str(k)) + len(str(v)) + 2 for k, v in body.items())
+
+    if isinstance(body, (bytes, str)):
+        return len(body)
+
+    return 0
+
+
+# Event names look like "before-call.ec2.DescribeVpcs"
+def get_service_from_event_name(event_name: str) -> str:
+    parts = event_name.split(".")
+    return parts[1] if len(parts) > 1 else ""
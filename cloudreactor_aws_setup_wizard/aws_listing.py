@@ -0,0 +1,86 @@
+import logging
+from typing import Any, Iterator, Optional
+
+# All stack statuses except DELETE_COMPLETE and DELETE_FAILED, passed as
+# StackStatusFilter so deleted stacks are filtered out by CloudFormation
+# instead of being downloaded.
+ACTIVE_CLOUDFORMATION_STACK_STATUSES = [
+    "CREATE_IN_PROGRESS",
+    "CREATE_FAILED",
+    "CREATE_COMPLETE",
+    "ROLLBACK_IN_PROGRESS",
+    "ROLLBACK_FAILED",
+    "ROLLBACK_COMPLETE",
+    "DELETE_IN_PROGRESS",
+    "UPDATE_IN_PROGRESS",
+    "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS",
+    "UPDATE_COMPLETE",
+    "UPDATE_FAILED",
+    "UPDATE_ROLLBACK_IN_PROGRESS",
+    "UPDATE_ROLLBACK_FAILED",
+    "UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS",
+    "UPDATE_ROLLBACK_COMPLETE",
+    "REVIEW_IN_PROGRESS",
+    "IMPORT_IN_PROGRESS",
+    "IMPORT_COMPLETE",
+    "IMPORT_ROLLBACK_IN_PROGRESS",
+    "IMPORT_ROLLBACK_FAILED",
+    "IMPORT_ROLLBACK_COMPLETE",
+]
+
+PAGINATION_TOKEN_KEYS = ["NextToken", "nextToken"]
+
+
+# Streams the items of a paginated AWS list or describe operation, using the
+# botocore paginator for the operation. If max_pages is set, iteration stops
+# after that many pages and truncated is set, so callers can warn that the
+# listing is incomplete.
+class PagedListing(object):
+    def __init__(
+        self,
+        client,
+        operation_name: str,
+        result_key: str,
+        max_pages: Optional[int] = None,
+        page_size: Optional[int] = None,
+        **kwargs: Any,
+    ) -> None:
+        self.client = client
+        self.operation_name = operation_name
+        self.result_key = result_key
+        self.max_pages = max_pages
+        self.page_size = page_size
+        self.kwargs = kwargs
+        self.page_count = 0
+        self.truncated = False
+
+    def pages(self) -> Iterator[dict[str, Any]]:
+        self.page_count = 0
+        self.truncated = False
+
+        pagination_config: dict[str, Any] = {}
+        if self.page_size:
+            pagination_config["PageSize"] = self.page_size
+
+        paginator = self.client.get_paginator(self.operation_name)
+
+        for page in paginator.paginate(
+            PaginationConfig=pagination_config, **self.kwargs
+        ):
+            self.page_count += 1
+            yield page
+
+            if (self.max_pages is not None) and (self.page_count >= self.max_pages):
+                self.truncated = any(
+                    page.get(token_key) for token_key in PAGINATION_TOKEN_KEYS
+                )
+
+                if self.truncated:
+                    logging.warning(
+                        f"Stopped {self.operation_name} after {self.page_count} page(s)"
+                    )
+                return
+
+    def __iter__(self) -> Iterator[Any]:
+        for page in self.pages():
+            yield from page.get(self.result_key) or []
@@ -0,0 +1,406 @@
+import logging
+import os
+from typing import Any, Callable, Optional
+
+from .cidr_allocator import DEFAULT_POOL, DEFAULT_PREFIX_LENGTH, to_network
+from .stack_index import find_stack
+from .wizard import (
+    CLOUDFORMATION_STACK_NAME_REGEX,
+    DEPLOYMENT_ENVIRONMENT_REGEX,
+    NO_ACCESS_KEY,
+    Wizard,
+)
+
+CLOUDREACTOR_USERNAME_ENV_VAR = "CLOUDREACTOR_USERNAME"
+CLOUDREACTOR_PASSWORD_ENV_VAR = "CLOUDREACTOR_PASSWORD"
+
+# Endpoints always added to private subnets, as in the interactive VPC creator
+FREE_VPC_ENDPOINTS = ["S3", "DynamoDB"]
+DEFAULT_VPC_ENDPOINTS = ["ECR_DKR", "CloudWatch"]
+
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+EXAMPLE_SPEC = """
+aws:
+  region: us-west-2
+  # Optional, the default AWS credential chain is used if omitted
+  access_key: AKIA...
+  secret_key: ...
+deployment_environment: staging
+cluster:
+  # An existing cluster with this name is used, otherwise one is created
+  name: staging
+vpc:
+  # Either use an existing VPC:
+  id: vpc-0123456789abcdef0
+  subnets: [subnet-0123456789abcdef0]
+  security_groups: [sg-0123456789abcdef0]
+  # or create / update one with a CloudFormation stack:
+  create:
+    stack_name: ECS-VPC-staging
+    # Optional. Without it, an update keeps the CIDR block of the stack's
+    # VPC, and a new VPC gets the first block of prefix_length in cidr_pool
+    # that doesn't overlap another VPC in the region.
+    cidr: 10.0.0.0/16
+    # Defaults to 16
+    prefix_length: 16
+    # Defaults to 10.0.0.0/8
+    cidr_pool: 10.0.0.0/8
+    public_azs: [us-west-2a, us-west-2b]
+    private_azs: [us-west-2a, us-west-2b]
+    # Defaults to the private AZs that also have a public subnet
+    nat_azs: [us-west-2a]
+    # Defaults to ECR_DKR and CloudWatch. S3 and DynamoDB are always added.
+    vpc_endpoints: [ECR_DKR, CloudWatch]
+# Defaults to the name the interactive wizard suggests
+stack_name: CloudReactor-staging
+# To assume a role in each of several accounts, starting from the
+# credentials above, list the accounts and give the role to assume. Settings
+# given for an account override the ones above, like for regions.
+accounts:
+  - "111111111111"
+  - "222222222222"
+assume_role:
+  role_name: OrganizationAccountAccessRole
+  # Optional
+  external_id: ...
+# To set up several regions at once, list them here instead of aws.region.
+# Settings given for a region override the ones above. Availability zones
+# can be given as letters, like [a, b], to use the same layout everywhere.
+regions:
+  us-west-2:
+  us-east-1:
+    vpc:
+      create:
+        cidr: 10.1.0.0/16
+cloudreactor:
+  # Or set CLOUDREACTOR_USERNAME and CLOUDREACTOR_PASSWORD
+  username: me@example.com
+  password: ...
+  group: My Group
+  # Defaults to the deployment environment
+  run_environment: staging
+"""
+
+
+def load_batch_spec(filename: str) -> dict[str, Any]:
+    # JSON is a subset of YAML, so one parser reads both formats
+    import yaml
+
+    with open(filename) as f:
+        spec = yaml.safe_load(f)
+
+    if not isinstance(spec, dict):
+        raise ValueError(f"The spec file '{filename}' must contain a mapping")
+
+    return spec
+
+
+# Runs the wizard steps for one spec without prompting. Each step records a
+# result, and the run stops at the first step that fails. Messages from the
+# steps are printed as usual; the results are returned as plain data so they
+# can be output as JSON.
+class BatchRun(object):
+    def __init__(self, spec: dict[str, Any], wizard: Wizard) -> None:
+        self.spec = spec
+        self.wizard = wizard
+        self.steps: list[dict[str, Any]] = []
+
+    def run(self) -> dict[str, Any]:
+        steps: list[tuple[str, Callable[[], Optional[str]]]] = [
+            ("aws_credentials", self.validate_aws_access),
+            ("ecs_cluster", self.set_up_cluster),
+            ("vpc", self.set_up_vpc),
+            ("role_stack", self.install_role_stack),
+            ("run_environment", self.save_run_environment),
+        ]
+
+        failed = False
+        for name, step in steps:
+            if failed:
+                self.steps.append({"name": name, "status": STATUS_SKIPPED})
+                continue
+
+            try:
+                detail = step()
+                status = STATUS_SUCCEEDED
+            except Exception as ex:
+                logging.debug(f"Batch step '{name}' failed", exc_info=True)
+                detail = str(ex)
+                status = STATUS_FAILED
+                failed = True
+
+            self.steps.append({"name": name, "status": status, "detail": detail})
+
+        self.wizard.stop_aws_discovery()
+
+        return {
+            "status": STATUS_FAILED if failed else STATUS_SUCCEEDED,
+            "steps": self.steps,
+            "outputs": self.make_outputs(),
+            "aws_calls": self.wizard.aws_call_policy.metrics.to_dict(),
+        }
+
+    def validate_aws_access(self) -> Optional[str]:
+        aws_spec = self.spec.get("aws") or {}
+        region = aws_spec.get("region")
+
+        if not region:
+            raise ValueError("aws.region is required")
+
+        wizard = self.wizard
+        wizard.aws_region = region
+
+        # With a session factory, the access key is only used to assume roles
+        if wizard.boto_session_factory is None:
+            wizard.aws_access_key = aws_spec.get("access_key") or NO_ACCESS_KEY
+            wizard.aws_secret_key = aws_spec.get("secret_key") or NO_ACCESS_KEY
+        else:
+            wizard.aws_access_key = NO_ACCESS_KEY
+            wizard.aws_secret_key = NO_ACCESS_KEY
+
+        if not wizard.validate_aws_access():
+            raise RuntimeError("The AWS credentials are not valid")
+
+        account_id = aws_spec.get("account_id")
+        if account_id and (str(account_id) != wizard.aws_account_id):
+            raise RuntimeError(
+                f"The AWS credentials are for account {wizard.aws_account_id}, not {account_id}"
+            )
+
+        deployment_environment = self.spec.get("deployment_environment")
+        if deployment_environment is None:
+            deployment_environment = wizard.make_default_deployment_environment_name()
+
+        if DEPLOYMENT_ENVIRONMENT_REGEX.fullmatch(deployment_environment) is None:
+            raise ValueError(
+                f"'{deployment_environment}' is not a valid deployment environment name"
+            )
+
+        wizard.deployment_environment = deployment_environment
+        return wizard.aws_account_id
+
+    def set_up_cluster(self) -> Optional[str]:
+        cluster_spec = self.spec.get("cluster") or {}
+        cluster_name = cluster_spec.get("name")
+
+        if not cluster_name:
+            raise ValueError("cluster.name is required")
+
+        wizard = self.wizard
+        ecs_client = wizard.make_boto_client("ecs")
+
+        for cluster_arn in wizard.fetch_cluster_arns(ecs_client):
+            if (cluster_arn == cluster_name) or cluster_arn.endswith(
+                "/" + cluster_name
+            ):
+                wizard.cluster_arn = cluster_arn
+                print(f"Using ECS cluster '{cluster_arn}'.\n")
+                return cluster_arn
+
+        if not wizard.create_cluster(ecs_client, cluster_name=cluster_name):
+            raise RuntimeError(f"Failed to create ECS cluster '{cluster_name}'")
+
+        return wizard.cluster_arn
+
+    def set_up_vpc(self) -> Optional[str]:
+        vpc_spec = self.spec.get("vpc") or {}
+        wizard = self.wizard
+        create_spec = vpc_spec.get("create")
+
+        if create_spec is None:
+            wizard.vpc_id = vpc_spec.get("id")
+            wizard.subnets = vpc_spec.get("subnets") or None
+            wizard.security_groups = vpc_spec.get("security_groups") or None
+            return wizard.vpc_id
+
+        public_azs = create_spec.get("public_azs") or []
+        private_azs = create_spec.get("private_azs") or []
+
+        if not (public_azs or private_azs):
+            raise ValueError("vpc.create needs public_azs or private_azs")
+
+        private_azs_with_nat = create_spec.get("nat_azs")
+        if private_azs_with_nat is None:
+            private_azs_with_nat = [az for az in private_azs if az in public_azs]
+
+        vpc_endpoints: list[str] = []
+        if private_azs:
+            vpc_endpoints = create_spec.get("vpc_endpoints", DEFAULT_VPC_ENDPOINTS)
+            vpc_endpoints = list(vpc_endpoints) + FREE_VPC_ENDPOINTS
+
+        vpc_stack_name = create_spec.get("stack_name") or "ECS-VPC-" + (
+            wizard.deployment_environment or "staging"
+        )
+        cf_client = wizard.make_boto_client("cloudformation")
+        vpc_stack_id_to_update = self.find_stack_id_to_update(vpc_stack_name, cf_client)
+
+        vpc_template = wizard.make_vpc_template(
+            public_azs=public_azs,
+            private_azs=private_azs,
+            private_azs_with_nat=private_azs_with_nat,
+            vpc_cidr=self.choose_vpc_cidr(
+                create_spec, vpc_stack_id_to_update, cf_client
+            ),
+            vpc_endpoints=vpc_endpoints,
+        )
+
+        if not wizard.install_vpc_stack(
+            vpc_stack_name=vpc_stack_name,
+            vpc_stack_id_to_update=vpc_stack_id_to_update,
+            vpc_template=vpc_template,
+            cf_client=cf_client,
+        ):
+            raise RuntimeError(f"Failed to install VPC stack '{vpc_stack_name}'")
+
+        return wizard.vpc_id
+
+    # Uses the CIDR block given in the spec, or the one of the VPC the stack
+    # already has, so updates don't replace the VPC. Otherwise allocates the
+    # first block in the pool that doesn't overlap an existing VPC.
+    def choose_vpc_cidr(
+        self, create_spec: dict[str, Any], vpc_stack_id: Optional[str], cf_client
+    ) -> str:
+        if create_spec.get("cidr"):
+            return str(to_network(create_spec["cidr"]))
+
+        if "second_octet" in create_spec:
+            second_octet = int(create_spec["second_octet"])
+            if (second_octet < 0) or (second_octet > 255):
+                raise ValueError("vpc.create.second_octet should be between 0 and 255")
+
+            return f"10.{second_octet}.0.0/16"
+
+        if vpc_stack_id:
+            vpc_cidr = self.find_stack_output(vpc_stack_id, "CidrBlock", cf_client)
+            if vpc_cidr:
+                return vpc_cidr
+
+        wizard = self.wizard
+        ec2_client = wizard.make_boto_client("ec2")
+        rv = None if ec2_client is None else wizard.load_vpc_cidr_index(ec2_client)
+
+        if rv is None:
+            raise RuntimeError("Can't list the existing VPCs to allocate a CIDR block")
+
+        pool = create_spec.get("cidr_pool") or DEFAULT_POOL
+        prefix_length = int(create_spec.get("prefix_length", DEFAULT_PREFIX_LENGTH))
+        free_cidr = rv[1].find_free(prefix_length=prefix_length, pool=pool)
+
+        if free_cidr is None:
+            raise RuntimeError(f"No free /{prefix_length} CIDR block is left in {pool}")
+
+        logging.info(f"Allocated CIDR block {free_cidr} for the VPC")
+        return str(free_cidr)
+
+    def find_stack_output(
+        self, stack_id: str, output_key: str, cf_client
+    ) -> Optional[str]:
+        stacks = cf_client.describe_stacks(StackName=stack_id).get("Stacks") or []
+
+        for stack in stacks:
+            for output in stack.get("Outputs") or []:
+                if output["OutputKey"] == output_key:
+                    return output["OutputValue"]
+
+        return None
+
+    def install_role_stack(self) -> Optional[str]:
+        wizard = self.wizard
+        stack_name = (
+            self.spec.get("stack_name") or wizard.make_default_role_stack_name()
+        )
+
+        if CLOUDFORMATION_STACK_NAME_REGEX.fullmatch(stack_name) is None:
+            raise ValueError(f"'{stack_name}' is not a valid CloudFormation stack name")
+
+        cf_client = wizard.make_boto_client("cloudformation")
+
+        wizard.clear_stack_upload_state()
+        wizard.stack_name = stack_name
+        wizard.stack_id_to_update = self.find_stack_id_to_update(stack_name, cf_client)
+
+        if not wizard.start_role_cloudformation_template_upload(cf_client=cf_client):
+            raise RuntimeError(f"Failed to start installing stack '{stack_name}'")
+
+        if not wizard.wait_for_role_stack_upload(cf_client=cf_client):
+            raise RuntimeError(f"Failed to install stack '{stack_name}'")
+
+        return wizard.uploaded_stack_id
+
+    def save_run_environment(self) -> Optional[str]:
+        cloudreactor_spec = self.spec.get("cloudreactor")
+
+        if not cloudreactor_spec:
+            return None
+
+        username = cloudreactor_spec.get("username") or os.environ.get(
+            CLOUDREACTOR_USERNAME_ENV_VAR
+        )
+        password = cloudreactor_spec.get("password") or os.environ.get(
+            CLOUDREACTOR_PASSWORD_ENV_VAR
+        )
+
+        if not (username and password):
+            raise ValueError("CloudReactor username and password are required")
+
+        wizard = self.wizard
+
+        if not wizard.validate_cloudreactor_credentials(username, password):
+            raise RuntimeError("The CloudReactor credentials are not valid")
+
+        group_name = cloudreactor_spec.get("group")
+        if not group_name:
+            raise ValueError("cloudreactor.group is required")
+
+        if not wizard.use_cloudreactor_group(group_name):
+            raise RuntimeError(f"Failed to use CloudReactor Group '{group_name}'")
+
+        run_environment_name = (
+            cloudreactor_spec.get("run_environment")
+            or wizard.make_default_run_environment_name()
+        )
+
+        if not wizard.create_or_update_run_environment(
+            run_environment_name=run_environment_name
+        ):
+            raise RuntimeError(
+                f"Failed to save Run Environment '{run_environment_name}'"
+            )
+
+        return wizard.saved_run_environment_uuid
+
+    def find_stack_id_to_update(self, stack_name: str, cf_client) -> Optional[str]:
+        summary = find_stack(cf_client, stack_name)
+
+        if summary is None:
+            return None
+
+        if summary.status.find("PROGRESS") >= 0:
+            raise RuntimeError(
+                f"Stack '{stack_name}' is still in progress with status '{summary.status}'"
+            )
+
+        return summary.stack_id
+
+    def make_outputs(self) -> dict[str, Any]:
+        wizard = self.wizard
+        return {
+            "aws_account_id": wizard.aws_account_id,
+            "aws_region": wizard.aws_region,
+            "deployment_environment": wizard.deployment_environment,
+            "cluster_arn": wizard.cluster_arn,
+            "vpc_id": wizard.vpc_id,
+            "subnets": wizard.subnets,
+            "security_groups": wizard.security_groups,
+            "stack_name": wizard.stack_name,
+            "stack_id": wizard.uploaded_stack_id,
+            "assumable_role_arn": wizard.assumable_role_arn,
+            "task_execution_role_arn": wizard.task_execution_role_arn,
+            "workflow_starter_arn": wizard.workflow_starter_arn,
+            "run_environment_uuid": wizard.saved_run_environment_uuid,
+            "run_environment_name": wizard.saved_run_environment_name,
+            "run_environment_url": wizard.make_run_environment_url(),
+        }
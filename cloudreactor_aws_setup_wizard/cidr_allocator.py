@@ -0,0 +1,179 @@
+import bisect
+import ipaddress
+import math
+from typing import Iterable, Optional, Union
+
+DEFAULT_POOL = "10.0.0.0/8"
+DEFAULT_PREFIX_LENGTH = 16
+
+# The VPC template has always split a /16 into 8 slots of one public and one
+# private /20, so VPCs with up to 8 AZs keep their subnets
+MIN_AZ_SLOTS = 8
+
+IPV4_BITS = 32
+
+# The largest VPC CIDR block AWS allows
+MIN_VPC_PREFIX_LENGTH = 16
+
+# The smallest subnet AWS allows, a /28
+MAX_SUBNET_PREFIX_LENGTH = 28
+
+CidrLike = Union[str, ipaddress.IPv4Network]
+
+
+def to_network(cidr: CidrLike) -> ipaddress.IPv4Network:
+    network = ipaddress.ip_network(cidr, strict=False)
+
+    if not isinstance(network, ipaddress.IPv4Network):
+        raise ValueError(f"{cidr} is not an IPv4 CIDR block")
+
+    return network
+
+
+def to_interval(network: ipaddress.IPv4Network) -> tuple[int, int]:
+    return int(network.network_address), int(network.broadcast_address)
+
+
+# Returns the size of the largest block aligned to its size that fits between
+# start and end, inclusive
+def find_largest_aligned_block_size(start: int, end: int) -> int:
+    for bits in range(IPV4_BITS, -1, -1):
+        size = 1 << bits
+        aligned_start = -(-start // size) * size
+
+        if aligned_start + size - 1 <= end:
+            return size
+
+    return 0
+
+
+# The CIDR blocks in use, kept as sorted, merged intervals of addresses, so
+# checking a block for conflicts takes one binary search. For each pool that
+# blocks are allocated from, the gaps between the intervals are indexed by
+# the running maximum of the largest aligned block that fits in each, so the
+# first gap with room for a block of a given size is also found with one
+# binary search, in O(log n) for n blocks in use.
+class CidrIndex(object):
+    def __init__(self, cidrs: Iterable[CidrLike] = ()) -> None:
+        intervals = sorted(to_interval(to_network(cidr)) for cidr in cidrs)
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+
+        for start, end in intervals:
+            if self.ends and (start <= self.ends[-1] + 1):
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+        self.pool_to_gaps: dict[
+            ipaddress.IPv4Network, tuple[list[int], list[int], list[int]]
+        ] = {}
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def add(self, cidr: CidrLike) -> None:
+        start, end = to_interval(to_network(cidr))
+        i = bisect.bisect_left(self.ends, start - 1)
+        j = bisect.bisect_right(self.starts, end + 1)
+
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+        self.pool_to_gaps.clear()
+
+    def overlaps(self, cidr: CidrLike) -> bool:
+        start, end = to_interval(to_network(cidr))
+        i = bisect.bisect_right(self.starts, end) - 1
+        return (i >= 0) and (self.ends[i] >= start)
+
+    # Returns the first block with the prefix length in the pool that doesn't
+    # overlap any block in use, or None if the pool is full
+    def find_free(
+        self,
+        prefix_length: int = DEFAULT_PREFIX_LENGTH,
+        pool: CidrLike = DEFAULT_POOL,
+    ) -> Optional[ipaddress.IPv4Network]:
+        pool_network = to_network(pool)
+
+        if not (pool_network.prefixlen <= prefix_length <= IPV4_BITS):
+            raise ValueError(
+                f"A /{prefix_length} block can't be allocated from {pool_network}"
+            )
+
+        size = 1 << (IPV4_BITS - prefix_length)
+        gap_starts, gap_ends, max_block_sizes = self.get_gaps(pool_network)
+        i = bisect.bisect_left(max_block_sizes, size)
+
+        if i == len(max_block_sizes):
+            return None
+
+        start = -(-gap_starts[i] // size) * size
+        return ipaddress.IPv4Network((start, prefix_length))
+
+    def get_gaps(
+        self, pool: ipaddress.IPv4Network
+    ) -> tuple[list[int], list[int], list[int]]:
+        gaps = self.pool_to_gaps.get(pool)
+
+        if gaps is not None:
+            return gaps
+
+        pool_start, pool_end = to_interval(pool)
+        gap_starts: list[int] = []
+        gap_ends: list[int] = []
+        max_block_sizes: list[int] = []
+        start = pool_start
+
+        i = max(bisect.bisect_right(self.starts, pool_start) - 1, 0)
+        for used_start, used_end in zip(self.starts[i:], self.ends[i:]):
+            if used_start > pool_end:
+                break
+
+            if used_start > start:
+                gap_starts.append(start)
+                gap_ends.append(used_start - 1)
+
+            start = max(start, used_end + 1)
+
+        if start <= pool_end:
+            gap_starts.append(start)
+            gap_ends.append(pool_end)
+
+        largest = 0
+        for gap_start, gap_end in zip(gap_starts, gap_ends):
+            largest = max(largest, find_largest_aligned_block_size(gap_start, gap_end))
+            max_block_sizes.append(largest)
+
+        gaps = (gap_starts, gap_ends, max_block_sizes)
+        self.pool_to_gaps[pool] = gaps
+        return gaps
+
+
+# Splits a VPC block into one slot per AZ, each with a public subnet in its
+# first half and a private subnet in its second half. Returns the public and
+# private subnet blocks for each AZ, in order.
+def split_vpc_cidr(vpc_cidr: CidrLike, az_count: int) -> list[tuple[str, str]]:
+    network = to_network(vpc_cidr)
+    slot_bits = math.ceil(math.log2(max(az_count, MIN_AZ_SLOTS)))
+
+    if network.prefixlen < MIN_VPC_PREFIX_LENGTH:
+        raise ValueError(
+            f"{network} is larger than the /{MIN_VPC_PREFIX_LENGTH} limit for VPCs"
+        )
+
+    if network.prefixlen + slot_bits + 1 > MAX_SUBNET_PREFIX_LENGTH:
+        raise ValueError(f"{network} is too small for subnets in {az_count} AZs")
+
+    slots = list(network.subnets(prefixlen_diff=slot_bits))[:az_count]
+
+    subnet_cidrs: list[tuple[str, str]] = []
+    for slot in slots:
+        public_subnet, private_subnet = slot.subnets(prefixlen_diff=1)
+        subnet_cidrs.append((str(public_subnet), str(private_subnet)))
+
+    return subnet_cidrs
@@ -1,9 +1,100 @@
+import base64
 import json
 import logging
 import os
-from typing import Any, Optional, cast
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional, cast
 
 import urllib3
+from urllib3.connection import HTTPConnection
+
+from .token_cache import TokenCache
+from .tracing import (
+    ATTRIBUTE_BYTES_RECEIVED,
+    ATTRIBUTE_BYTES_SENT,
+    ATTRIBUTE_RETRIES,
+    SPAN_KIND_CLIENT,
+    get_tracer,
+)
+
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 5.0
+DEFAULT_READ_TIMEOUT_SECONDS = 30.0
+DEFAULT_MAX_POOL_SIZE = 4
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+# Gateway errors are retried for idempotent methods only, since the request
+# may have been processed
+RETRY_STATUS_CODES = [502, 503, 504]
+
+# The server didn't process the request, so it is safe to retry for any method
+TOO_MANY_REQUESTS_STATUS_CODE = 429
+
+UNAUTHORIZED_STATUS_CODE = 401
+
+# Tokens are renewed this long before they expire, so they don't expire
+# between being checked and being used
+TOKEN_REFRESH_MARGIN_SECONDS = 60.0
+
+
+class ApiRetry(urllib3.Retry):
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        if status_code == TOO_MANY_REQUESTS_STATUS_CODE:
+            return bool(self.total)
+
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+# Makes a pool manager that can be shared by all API clients, so connections
+# to the API server are kept alive and reused between requests. Requests are
+# retried with exponential backoff, waiting as long as the server asks to in
+# a Retry-After header.
+def make_pool_manager(
+    max_pool_size: int = DEFAULT_MAX_POOL_SIZE,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT_SECONDS,
+    read_timeout: float = DEFAULT_READ_TIMEOUT_SECONDS,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+    accept_gzip: bool = True,
+) -> urllib3.PoolManager:
+    headers = {}
+    if accept_gzip:
+        # urllib3 decompresses the response body
+        headers["Accept-Encoding"] = "gzip"
+
+    return urllib3.PoolManager(
+        maxsize=max_pool_size,
+        headers=headers,
+        timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+        retries=ApiRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=ApiRetry.DEFAULT_ALLOWED_METHODS,
+            respect_retry_after_header=True,
+            # Return the last response, so the error message includes it
+            raise_on_status=False,
+        ),
+        # Detects connections dropped while idle between requests
+        socket_options=HTTPConnection.default_socket_options
+        + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)],
+    )
+
+
+# Returns when a JWT expires, as a Unix timestamp, without verifying it
+def decode_jwt_expiration(token: str) -> Optional[float]:
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        logging.debug("Can't decode expiration of JWT", exc_info=True)
+        return None
 
 
 class CloudReactorApiClient(object):
@@ -15,6 +106,9 @@ class CloudReactorApiClient(object):
         password: str,
         api_base_url: Optional[str] = None,
         cloudreactor_deployment_environment: Optional[str] = None,
+        http: Optional[urllib3.PoolManager] = None,
+        token_cache: Optional[TokenCache] = None,
+        clock: Callable[[], float] = time.time,
     ) -> None:
         if not api_base_url:
             api_base_url = os.environ.get("CLOUDREACTOR_API_BASE_URL")
@@ -36,7 +130,14 @@ class CloudReactorApiClient(object):
         self.username = username
         self.password = password
         self.access_token: Optional[str] = None
-        self.http = urllib3.PoolManager()
+        self.refresh_token: Optional[str] = None
+        self.http = http or make_pool_manager()
+        self.token_cache = token_cache
+        self.clock = clock
+        self.token_lock = threading.Lock()
+        self.loaded_cached_tokens = False
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.executor_lock = threading.Lock()
 
     def authenticate(self):
         data = {
@@ -44,32 +145,114 @@ class CloudReactorApiClient(object):
             "password": self.password,
         }
 
+        response_data = self.send_auth_request("/auth/jwt/create/", data)
+        self.set_tokens(response_data)
+
+    def refresh_access_token(self) -> None:
+        response_data = self.send_auth_request(
+            "/auth/jwt/refresh/", {"refresh": self.refresh_token}
+        )
+        self.set_tokens(response_data)
+
+    def send_auth_request(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
         r = self.http.request(
             "POST",
-            self.api_base_url + "/auth/jwt/create/",
+            self.api_base_url + path,
             body=json.dumps(data),
-            headers={"Accept": "application/json", "Content-Type": "application/json"},
-            timeout=10.0,
+            headers=self.make_headers(
+                {"Accept": "application/json", "Content-Type": "application/json"}
+            ),
         )
 
         response_status = cast(int, r.status)
 
         if (response_status >= 200) and (response_status < 300):
             response_body = cast(str, r.data.decode("utf-8"))
-            response_data = json.loads(response_body)
-            self.access_token = cast(str, response_data["access"])
+            return json.loads(response_body)
         else:
             raise RuntimeError(f"Bad authentication response code: {response_status}")
 
+    def set_tokens(self, response_data: dict[str, Any]) -> None:
+        self.access_token = cast(str, response_data["access"])
+
+        # Only returned when refresh tokens are rotated
+        if response_data.get("refresh"):
+            self.refresh_token = response_data["refresh"]
+
+        if self.token_cache:
+            tokens = {"access": self.access_token}
+            if self.refresh_token:
+                tokens["refresh"] = self.refresh_token
+
+            self.token_cache.store(
+                self.api_base_url, self.username, self.password, tokens
+            )
+
+    def load_cached_tokens(self) -> None:
+        self.loaded_cached_tokens = True
+
+        if not self.token_cache:
+            return
+
+        tokens = self.token_cache.load(self.api_base_url, self.username, self.password)
+
+        if tokens:
+            self.access_token = tokens.get("access")
+            self.refresh_token = tokens.get("refresh")
+
+    def is_token_expiring(self, token: Optional[str]) -> bool:
+        if not token:
+            return True
+
+        expiration = decode_jwt_expiration(token)
+
+        # Tokens without a known expiration are used until they are rejected
+        return (expiration is not None) and (
+            expiration - TOKEN_REFRESH_MARGIN_SECONDS <= self.clock()
+        )
+
+    def renew_access_token(self) -> None:
+        if not self.is_token_expiring(self.refresh_token):
+            try:
+                self.refresh_access_token()
+                return
+            except Exception:
+                logging.info("Can't refresh access token, logging in again ...")
+
+        self.authenticate()
+
+    # Headers given to a request replace the default headers of the pool
+    # manager, like Accept-Encoding, instead of being added to them
+    def make_headers(self, headers: dict[str, str]) -> dict[str, str]:
+        return {**self.http.headers, **headers}
+
     def make_authentication_header(self):
-        if self.access_token is None:
-            self.authenticate()
+        with self.token_lock:
+            if not self.loaded_cached_tokens:
+                self.load_cached_tokens()
 
-        return "JWT " + self.access_token
+            if self.is_token_expiring(self.access_token):
+                self.renew_access_token()
+
+            return "JWT " + cast(str, self.access_token)
 
     def list_groups(self) -> dict[str, Any]:
         return self.send_and_load_json("groups/")
 
+    def iterate_groups(
+        self, name: Optional[str] = None, prefetch: bool = True
+    ) -> Iterator[dict[str, Any]]:
+        params = {"name": name} if name else None
+        return self.iterate("groups/", params=params, prefetch=prefetch)
+
+    def find_group_by_name(self, name: str) -> Optional[dict[str, Any]]:
+        # The name is also checked here, in case the server ignores the filter
+        for group in self.iterate_groups(name=name):
+            if group["name"] == name:
+                return group
+
+        return None
+
     def create_group(self, data: dict[str, Any]) -> dict[str, Any]:
         return self.send_and_load_json(path="groups/", method="POST", data=data)
 
@@ -78,6 +261,24 @@ class CloudReactorApiClient(object):
             "run_environments/", params={"created_by_group__id": group_id}
         )
 
+    def iterate_run_environments(
+        self, group_id: int, name: Optional[str] = None, prefetch: bool = True
+    ) -> Iterator[dict[str, Any]]:
+        params: dict[str, Any] = {"created_by_group__id": group_id}
+        if name:
+            params["name"] = name
+
+        return self.iterate("run_environments/", params=params, prefetch=prefetch)
+
+    def find_run_environment_by_name(
+        self, group_id: int, name: str
+    ) -> Optional[dict[str, Any]]:
+        for run_environment in self.iterate_run_environments(group_id, name=name):
+            if run_environment["name"] == name:
+                return run_environment
+
+        return None
+
     def create_run_environment(self, data: dict[str, Any]) -> dict[str, Any]:
         return self.create_or_update_run_environment(None, data)
 
@@ -95,6 +296,46 @@ class CloudReactorApiClient(object):
 
         return self.send_and_load_json(path=path, method=method, data=data)
 
+    # Yields the items of a paginated list, following the next links of the
+    # pages. Unless prefetch is False, the next page is fetched in the
+    # background while the items of the current one are consumed.
+    def iterate(
+        self,
+        path: str,
+        params: Optional[dict[str, Any]] = None,
+        prefetch: bool = True,
+    ) -> Iterator[dict[str, Any]]:
+        page = self.send_and_load_json(path, params=params)
+
+        while True:
+            next_url = page.get("next")
+            next_page_future: Optional[Future] = None
+
+            if next_url and prefetch:
+                next_page_future = self.get_executor().submit(
+                    self.send_and_load_json, next_url
+                )
+
+            yield from page.get("results") or []
+
+            if not next_url:
+                return
+
+            if next_page_future:
+                page = next_page_future.result()
+            else:
+                page = self.send_and_load_json(next_url)
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="cloudreactor-api"
+                )
+
+            return self.executor
+
+    # path is relative to the API root, or a full URL like a next link
     def send_and_load_json(
         self,
         path: str,
@@ -102,24 +343,30 @@ class CloudReactorApiClient(object):
         params: Optional[dict[str, Any]] = None,
         data: Optional[dict[str, Any]] = None,
     ) -> Any:
-        headers = {
-            "Authorization": self.make_authentication_header(),
-            "Accept": "application/json",
-        }
-
-        body = None
-        if data is not None:
-            headers["Content-Type"] = "application/json"
-            body = json.dumps(data)
-
-        r = self.http.request(
-            method,
-            self.api_base_url + "/api/v1/" + path,
-            fields=params,
-            headers=headers,
-            body=body,
-            timeout=10.0,
-        )
+        with get_tracer().span(
+            "cloudreactor_api." + method, kind=SPAN_KIND_CLIENT, path=path
+        ) as span:
+            r = self.send(path, method, params, data)
+
+            # The token may have been revoked, or the clock may be off
+            if r.status == UNAUTHORIZED_STATUS_CODE:
+                logging.info("Access token was rejected, renewing it ...")
+
+                with self.token_lock:
+                    self.access_token = None
+                    self.renew_access_token()
+
+                r = self.send(path, method, params, data)
+
+            if span is not None:
+                span.attributes.update(
+                    {
+                        "status_code": r.status,
+                        ATTRIBUTE_RETRIES: len(r.retries.history) if r.retries else 0,
+                        ATTRIBUTE_BYTES_SENT: len(json.dumps(data)) if data else 0,
+                        ATTRIBUTE_BYTES_RECEIVED: len(r.data),
+                    }
+                )
 
         response_status = r.status
         response_body = r.data.decode("utf-8")
@@ -135,6 +382,37 @@ class CloudReactorApiClient(object):
 
             raise RuntimeError(message)
 
+    def send(
+        self,
+        path: str,
+        method: str,
+        params: Optional[dict[str, Any]],
+        data: Optional[dict[str, Any]],
+    ):
+        headers = self.make_headers(
+            {
+                "Authorization": self.make_authentication_header(),
+                "Accept": "application/json",
+            }
+        )
+
+        body = None
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+            body = json.dumps(data)
+
+        url = path
+        if not path.startswith(("https://", "http://")):
+            url = self.api_base_url + "/api/v1/" + path
+
+        return self.http.request(
+            method,
+            url,
+            fields=params,
+            headers=headers,
+            body=body,
+        )
+
 
 if __name__ == "__main__":
     client = CloudReactorApiClient(
@@ -142,13 +420,13 @@ if __name__ == "__main__":
         password=os.environ["CLOUDREACTOR_PASSWORD"],
     )
 
-    groups = client.list_groups()["results"]
+    groups = list(client.iterate_groups())
 
     print(f"{groups=}")
 
     if len(groups) == 0:
         print("No groups found, not listing Run Environments.")
 
-    run_environments = client.list_run_environments(groups[0]["id"])
+    run_environments = list(client.iterate_run_environments(groups[0]["id"]))
 
     print(f"{run_environments=}")
@@ -0,0 +1,138 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, Iterable, Optional
+
+
+# Runs deployments, like CloudFormation stack installations, in background
+# threads, so the wizard can keep asking questions while they finish. Each
+# deployment has a name and lists the wizard properties it will set, so those
+# aren't asked for in the meantime. The threads are daemons: quitting the
+# wizard doesn't wait for them, and AWS keeps installing the stacks anyway.
+# Finished deployments are put on a queue with their futures, so the wizard
+# can handle each of them once between prompts, even if another deployment
+# with the same name was started since.
+class DeploymentScheduler(object):
+    def __init__(self) -> None:
+        self.name_to_future: dict[str, Future] = {}
+        self.name_to_properties: dict[str, frozenset[str]] = {}
+        self.completed: queue.SimpleQueue[tuple[str, Future]] = queue.SimpleQueue()
+        # Deployments whose results are no longer wanted
+        self.abandoned_futures: set[Future] = set()
+        self.lock = threading.Lock()
+
+    # Only one deployment with the same name runs at a time. Returns None
+    # without starting anything if one is still running.
+    def start(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        properties: Iterable[str] = (),
+        **kwargs: Any,
+    ) -> Optional[Future]:
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        with self.lock:
+            running_future = self.name_to_future.get(name)
+            if (running_future is not None) and not running_future.done():
+                return None
+
+            self.name_to_future[name] = future
+            self.name_to_properties[name] = frozenset(properties)
+
+        def run() -> None:
+            result = None
+            error: Optional[BaseException] = None
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as ex:
+                logging.warning(f"Deployment '{name}' failed", exc_info=True)
+                error = ex
+
+            # Queued before the future is done, so once wait_all() returns,
+            # pop_completed() finds every deployment
+            self.completed.put((name, future))
+
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+        threading.Thread(target=run, name=f"deployment-{name}", daemon=True).start()
+        return future
+
+    def is_running(self, name: str) -> bool:
+        with self.lock:
+            future = self.name_to_future.get(name)
+            return (future is not None) and not future.done()
+
+    def is_any_running(self) -> bool:
+        with self.lock:
+            return any(not future.done() for future in self.name_to_future.values())
+
+    def has_deployments(self) -> bool:
+        with self.lock:
+            return bool(self.name_to_future)
+
+    def is_property_pending(self, property_name: str) -> bool:
+        with self.lock:
+            return any(
+                (property_name in self.name_to_properties[name]) and not future.done()
+                for name, future in self.name_to_future.items()
+            )
+
+    # Forgets a deployment, so it no longer counts as running and its result
+    # is never returned. The thread keeps running until it finishes.
+    def abandon(self, name: str) -> None:
+        with self.lock:
+            future = self.name_to_future.pop(name, None)
+            self.name_to_properties.pop(name, None)
+
+            if future is not None:
+                self.abandoned_futures.add(future)
+
+    # Returns the names and results of the deployments that finished since
+    # the last call, in the order they finished, and forgets them. The result
+    # is None if a deployment failed.
+    def pop_completed(self) -> list[tuple[str, Any]]:
+        names_and_results: list[tuple[str, Any]] = []
+
+        while True:
+            try:
+                name, future = self.completed.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                # Only waits for the thread to set the result
+                result = future.result()
+            except Exception:
+                result = None
+
+            with self.lock:
+                if self.name_to_future.get(name) is future:
+                    del self.name_to_future[name]
+                    del self.name_to_properties[name]
+
+                if future in self.abandoned_futures:
+                    self.abandoned_futures.remove(future)
+                    continue
+
+            names_and_results.append((name, result))
+
+        return names_and_results
+
+    def wait_all(self) -> None:
+        with self.lock:
+            futures = list(self.name_to_future.values())
+
+        for future in futures:
+            # Polls, so Ctrl-C stops the wait
+            while not future.done():
+                try:
+                    future.exception(timeout=0.5)
+                except TimeoutError:
+                    pass
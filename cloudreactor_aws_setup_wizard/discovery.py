@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+if TYPE_CHECKING:
+    from .discovery_cache import DiscoveryCache
+
+
+@dataclass
+class DiscoverySnapshot:
+    value: Any
+    fetched_at: float
+
+
+# Fetches AWS and CloudReactor resource lists on a thread pool so prompts can
+# read the results later without waiting on the network. Each key keeps the
+# most recent successful result along with the time it was fetched. Stale
+# results are still returned, while a fresh copy is fetched in the background.
+class AwsDiscovery(object):
+    CLUSTER_ARNS = "cluster_arns"
+    STACKS = "stacks"
+    VPCS = "vpcs"
+    AVAILABILITY_ZONES = "availability_zones"
+    # Per VPC, the key is followed by ":" and the VPC ID
+    SUBNETS = "subnets"
+    SECURITY_GROUPS = "security_groups"
+    GROUPS = "groups"
+    # Per Group, the key is followed by ":" and the Group ID
+    RUN_ENVIRONMENTS = "run_environments"
+
+    DEFAULT_MAX_AGE_SECONDS = 120.0
+    MAX_AGE_SECONDS_BY_KEY = {
+        CLUSTER_ARNS: 600.0,
+        STACKS: 120.0,
+        VPCS: 600.0,
+        AVAILABILITY_ZONES: 7 * 24 * 3600.0,
+        SUBNETS: 600.0,
+        SECURITY_GROUPS: 600.0,
+        GROUPS: 600.0,
+        RUN_ENVIRONMENTS: 300.0,
+    }
+    DEFAULT_MAX_WORKERS = 4
+
+    def __init__(
+        self,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        clock: Callable[[], float] = time.time,
+        cache: Optional["DiscoveryCache"] = None,
+    ) -> None:
+        self.max_age_seconds = max_age_seconds
+        self.max_workers = max_workers
+        self.clock = clock
+        self.cache: Optional["DiscoveryCache"] = None
+        self.snapshots: dict[str, DiscoverySnapshot] = {}
+        self.fetchers: dict[str, Callable[[], Any]] = {}
+        self.futures: dict[str, Future] = {}
+        # Bumped on invalidation so fetches started earlier don't store
+        # results that are already out of date
+        self.generations: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+        if cache is not None:
+            self.attach_cache(cache)
+
+    @staticmethod
+    def make_key(key: str, qualifier: Any) -> str:
+        return f"{key}:{qualifier}"
+
+    def attach_cache(self, cache: "DiscoveryCache") -> None:
+        self.cache = cache
+
+        with self.lock:
+            for key, (value, fetched_at) in cache.load().items():
+                if key not in self.snapshots:
+                    self.snapshots[key] = DiscoverySnapshot(
+                        value=value, fetched_at=fetched_at
+                    )
+
+    def prefetch(self, fetchers: dict[str, Callable[[], Any]]) -> None:
+        for key, fetcher in fetchers.items():
+            self.fetchers[key] = fetcher
+
+            if (key not in self.snapshots) or self.is_stale(key):
+                self.start_fetch(key)
+
+    def start_fetch(self, key: str) -> Future:
+        with self.lock:
+            future = self.futures.get(key)
+            if (future is not None) and not future.done():
+                return future
+
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="aws-discovery",
+                )
+
+            future = self.executor.submit(
+                self.fetch, key, self.fetchers[key], self.generations.get(key, 0)
+            )
+            self.futures[key] = future
+            return future
+
+    def fetch(self, key: str, fetcher: Callable[[], Any], generation: int) -> Any:
+        value = fetcher()
+
+        with self.lock:
+            if self.generations.get(key, 0) != generation:
+                return value
+
+            snapshot = DiscoverySnapshot(value=value, fetched_at=self.clock())
+            self.snapshots[key] = snapshot
+
+        if self.cache is not None:
+            self.cache.store(key, value, snapshot.fetched_at)
+
+        return value
+
+    def get(self, key: str, fetcher: Optional[Callable[[], Any]] = None) -> Any:
+        if fetcher is not None:
+            self.fetchers[key] = fetcher
+
+        snapshot = self.snapshots.get(key)
+
+        if snapshot is not None:
+            if self.is_stale(key) and (key in self.fetchers):
+                self.start_fetch(key)
+
+            return snapshot.value
+
+        return self.wait_for(key)
+
+    def peek(self, key: str) -> Any:
+        snapshot = self.snapshots.get(key)
+        return None if snapshot is None else snapshot.value
+
+    def refresh(self, key: str) -> Any:
+        self.invalidate(key)
+        return self.wait_for(key)
+
+    def wait_for(self, key: str) -> Any:
+        if key not in self.fetchers:
+            return None
+
+        try:
+            return self.start_fetch(key).result()
+        except Exception:
+            logging.warning(f"Failed to discover {key}", exc_info=True)
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        with self.lock:
+            snapshot = DiscoverySnapshot(value=value, fetched_at=self.clock())
+            self.snapshots[key] = snapshot
+
+        if self.cache is not None:
+            self.cache.store(key, value, snapshot.fetched_at)
+
+    def invalidate(self, *keys: str) -> None:
+        with self.lock:
+            for key in keys:
+                self.snapshots.pop(key, None)
+                self.futures.pop(key, None)
+                self.generations[key] = self.generations.get(key, 0) + 1
+
+        if self.cache is not None:
+            self.cache.remove(*keys)
+
+    def invalidate_prefix(self, key: str) -> None:
+        prefix = key + ":"
+        self.invalidate(
+            *[k for k in list(self.snapshots) if (k == key) or k.startswith(prefix)]
+        )
+
+    def age(self, key: str) -> Optional[float]:
+        snapshot = self.snapshots.get(key)
+
+        if snapshot is None:
+            return None
+
+        return self.clock() - snapshot.fetched_at
+
+    def max_age_for(self, key: str) -> float:
+        return AwsDiscovery.MAX_AGE_SECONDS_BY_KEY.get(
+            key.split(":")[0], self.max_age_seconds
+        )
+
+    def is_stale(self, key: str) -> bool:
+        age = self.age(key)
+        return (age is not None) and (age > self.max_age_for(key))
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
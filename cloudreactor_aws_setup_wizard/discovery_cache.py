@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import threading
+from typing import Any
+
+from .discovery import AwsDiscovery
+from .file_utils import write_file_atomically
+from .stack_index import StackIndex, StackSummary
+
+
+# Keeps discovery results on disk, in one file per AWS account and region, so
+# a resumed session can show choices before anything is fetched again.
+class DiscoveryCache(object):
+    DIRECTORY_NAME = "discovery_cache"
+    FORMAT_VERSION = 2
+
+    # CloudReactor Groups and Run Environments depend on the API server,
+    # deployment environment and user, not on the AWS account and region of
+    # the file, so they are only kept in memory
+    MEMORY_ONLY_KEYS = [AwsDiscovery.GROUPS, AwsDiscovery.RUN_ENVIRONMENTS]
+
+    def __init__(self, directory: str, account_id: str, region: str) -> None:
+        self.filename = os.path.join(
+            directory, DiscoveryCache.DIRECTORY_NAME, f"{account_id}-{region}.json"
+        )
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def load(self) -> dict[str, tuple[Any, float]]:
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logging.warning(
+                f"Can't read discovery cache file '{self.filename}'", exc_info=True
+            )
+            return {}
+
+        if data.get("version") != DiscoveryCache.FORMAT_VERSION:
+            return {}
+
+        loaded: dict[str, tuple[Any, float]] = {}
+
+        with self.lock:
+            self.entries = data.get("entries") or {}
+
+            # Files written by older versions may have memory-only keys
+            self.entries = {
+                key: entry
+                for key, entry in self.entries.items()
+                if self.is_cacheable(key)
+            }
+
+            for key, entry in self.entries.items():
+                loaded[key] = (
+                    self.decode_value(key, entry["value"]),
+                    entry["fetched_at"],
+                )
+
+        return loaded
+
+    def store(self, key: str, value: Any, fetched_at: float) -> None:
+        if not self.is_cacheable(key):
+            return
+
+        with self.lock:
+            self.entries[key] = {
+                "value": self.encode_value(key, value),
+                "fetched_at": fetched_at,
+            }
+            self.write()
+
+    def remove(self, *keys: str) -> None:
+        with self.lock:
+            removed = [key for key in keys if self.entries.pop(key, None)]
+
+            if removed:
+                self.write()
+
+    def write(self) -> None:
+        try:
+            write_file_atomically(
+                self.filename,
+                json.dumps(
+                    {"version": DiscoveryCache.FORMAT_VERSION, "entries": self.entries}
+                ),
+                fsync=False,
+            )
+        except Exception:
+            logging.warning(
+                f"Can't write discovery cache file '{self.filename}'", exc_info=True
+            )
+
+    def is_cacheable(self, key: str) -> bool:
+        return key.split(":")[0] not in DiscoveryCache.MEMORY_ONLY_KEYS
+
+    def encode_value(self, key: str, value: Any) -> Any:
+        if key == AwsDiscovery.STACKS:
+            return {
+                "summaries": [list(summary) for summary in value],
+                "truncated": value.truncated,
+            }
+
+        return value
+
+    def decode_value(self, key: str, value: Any) -> Any:
+        if key == AwsDiscovery.STACKS:
+            return StackIndex(
+                (StackSummary(*summary) for summary in value["summaries"]),
+                truncated=value["truncated"],
+            )
+
+        return value
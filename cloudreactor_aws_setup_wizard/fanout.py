@@ -0,0 +1,293 @@
+import copy
+import logging
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain, zip_longest
+from typing import Any, Callable, Optional, TextIO
+
+from .assumed_roles import DEFAULT_DURATION_SECONDS, AssumedRoleSessions
+from .batch import STATUS_FAILED, STATUS_SUCCEEDED, BatchRun
+from .rate_limiter import TokenBucket
+from .wizard import Wizard
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_WORKERS_PER_ACCOUNT = 2
+
+# Stays well below the CloudFormation and EC2 throttling limits
+DEFAULT_MAX_API_CALLS_PER_SECOND = 10.0
+
+
+# Writes lines to a stream with a prefix for the thread that wrote them, so
+# output from several accounts and regions running at once can be told
+# apart. Partial lines are buffered per thread until they are complete.
+class PrefixedOutput(object):
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def set_prefix(self, prefix: Optional[str]) -> None:
+        self.flush()
+        self.local.prefix = prefix
+
+    def write(self, s: str) -> int:
+        buffer = getattr(self.local, "buffer", "") + s
+        lines = buffer.split("\n")
+        self.local.buffer = lines.pop()
+
+        if lines:
+            self.write_lines(lines)
+
+        return len(s)
+
+    def flush(self) -> None:
+        buffer = getattr(self.local, "buffer", "")
+        if buffer:
+            self.local.buffer = ""
+            self.write_lines([buffer])
+
+        self.stream.flush()
+
+    def write_lines(self, lines: list[str]) -> None:
+        prefix = getattr(self.local, "prefix", None)
+        if prefix:
+            lines = [f"[{prefix}] {line}" if line else "" for line in lines]
+
+        with self.lock:
+            self.stream.write("\n".join(lines) + "\n")
+
+
+def merge_spec(base: dict[str, Any], overrides: dict[str, Any]) -> dict[str, Any]:
+    merged = copy.deepcopy(base)
+
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_spec(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+
+    return merged
+
+
+def expand_spec(
+    spec: dict[str, Any], key: str, aws_key: str
+) -> Optional[dict[str, dict[str, Any]]]:
+    values = spec.get(key)
+
+    if not values:
+        return None
+
+    if isinstance(values, list):
+        values = {value: None for value in values}
+
+    base_spec = {k: v for k, v in spec.items() if k != key}
+    expanded_specs: dict[str, dict[str, Any]] = {}
+
+    for value, overrides in values.items():
+        expanded_spec = merge_spec(base_spec, overrides or {})
+        expanded_spec["aws"] = dict(expanded_spec.get("aws") or {})
+        expanded_spec["aws"][aws_key] = str(value)
+        expanded_specs[str(value)] = expanded_spec
+
+    return expanded_specs
+
+
+# Returns the spec for each account and region to set up, keyed by a label
+# like "111111111111/us-west-2", if the spec lists several "accounts" or
+# "regions". Each is either a list, or a mapping to settings that override
+# the rest of the spec.
+def make_target_specs(spec: dict[str, Any]) -> Optional[dict[str, dict[str, Any]]]:
+    account_specs = expand_spec(spec, "accounts", "account_id")
+    target_specs: dict[str, dict[str, Any]] = {}
+
+    for account_id, account_spec in (account_specs or {"": spec}).items():
+        region_specs = expand_spec(account_spec, "regions", "region")
+
+        if region_specs is None:
+            if account_id:
+                target_specs[account_id] = account_spec
+            continue
+
+        for region, region_spec in region_specs.items():
+            label = f"{account_id}/{region}" if account_id else region
+            target_specs[label] = region_spec
+
+    return target_specs or None
+
+
+def make_assumed_role_sessions(
+    spec: dict[str, Any], rate_limiter: Optional[TokenBucket] = None
+) -> Optional[AssumedRoleSessions]:
+    assume_role_spec = spec.get("assume_role")
+
+    if not spec.get("accounts"):
+        return None
+
+    if not (assume_role_spec and assume_role_spec.get("role_name")):
+        raise ValueError("assume_role.role_name is required to set up accounts")
+
+    aws_spec = spec.get("aws") or {}
+
+    def make_source_session():
+        import boto3
+
+        return boto3.Session(
+            aws_access_key_id=aws_spec.get("access_key"),
+            aws_secret_access_key=aws_spec.get("secret_key"),
+            region_name=aws_spec.get("region"),
+        )
+
+    return AssumedRoleSessions(
+        source_session_factory=make_source_session,
+        role_name=assume_role_spec["role_name"],
+        external_id=assume_role_spec.get("external_id"),
+        duration_seconds=int(
+            assume_role_spec.get("duration_seconds", DEFAULT_DURATION_SECONDS)
+        ),
+        rate_limiter=rate_limiter,
+    )
+
+
+# Runs a batch spec for several accounts and regions at once. Each target
+# gets its own Wizard, so sessions, clients and discovered resources are not
+# shared, and the slowest target determines how long the whole run takes.
+# At most max_workers_per_account targets of the same account run at once.
+class BatchFanout(object):
+    def __init__(
+        self,
+        target_specs: dict[str, dict[str, Any]],
+        make_wizard: Callable[[dict[str, Any]], Wizard],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_workers_per_account: int = DEFAULT_MAX_WORKERS_PER_ACCOUNT,
+        output: Optional[PrefixedOutput] = None,
+    ) -> None:
+        self.target_specs = target_specs
+        self.make_wizard = make_wizard
+        self.max_workers = max_workers
+        self.max_workers_per_account = max_workers_per_account
+        self.output = output
+        self.account_semaphores: dict[str, threading.Semaphore] = {}
+
+    def run(self) -> dict[str, Any]:
+        target_results: dict[str, dict[str, Any]] = {}
+        target_count = len(self.target_specs)
+
+        account_id_to_labels: dict[str, list[str]] = defaultdict(list)
+        for label, spec in self.target_specs.items():
+            account_id = (spec.get("aws") or {}).get("account_id")
+
+            if account_id:
+                self.account_semaphores.setdefault(
+                    account_id,
+                    threading.Semaphore(max(self.max_workers_per_account, 1)),
+                )
+
+            account_id_to_labels[account_id or ""].append(label)
+
+        # Alternate between accounts, so workers are rarely left waiting for
+        # the limit of one account while other accounts have work
+        ordered_labels = [
+            label
+            for label in chain.from_iterable(
+                zip_longest(*account_id_to_labels.values())
+            )
+            if label is not None
+        ]
+
+        with ThreadPoolExecutor(
+            max_workers=max(min(self.max_workers, target_count), 1),
+            thread_name_prefix="batch",
+        ) as executor:
+            future_to_label = {
+                executor.submit(self.run_target, label, self.target_specs[label]): label
+                for label in ordered_labels
+            }
+
+            for future in as_completed(future_to_label):
+                label = future_to_label[future]
+                result = future.result()
+                target_results[label] = result
+                print(
+                    f"{label} {result['status']} ({len(target_results)}/{target_count} done)"
+                )
+
+        failed = any(
+            result["status"] != STATUS_SUCCEEDED for result in target_results.values()
+        )
+
+        return {
+            "status": STATUS_FAILED if failed else STATUS_SUCCEEDED,
+            # In the order the targets were given
+            "targets": {label: target_results[label] for label in self.target_specs},
+        }
+
+    def run_target(self, label: str, spec: dict[str, Any]) -> dict[str, Any]:
+        account_id = (spec.get("aws") or {}).get("account_id")
+        semaphore = self.account_semaphores.get(account_id or "")
+
+        if semaphore:
+            semaphore.acquire()
+
+        if self.output:
+            self.output.set_prefix(label)
+
+        try:
+            return BatchRun(spec, self.make_wizard(spec)).run()
+        except Exception as ex:
+            logging.warning(f"Batch run for {label} failed", exc_info=True)
+            return {"status": STATUS_FAILED, "steps": [], "error": str(ex)}
+        finally:
+            if self.output:
+                self.output.set_prefix(None)
+
+            if semaphore:
+                semaphore.release()
+
+
+def format_result_table(results: dict[str, Any]) -> str:
+    header = [
+        "Target",
+        "Status",
+        "Failed step",
+        "ECS cluster",
+        "VPC",
+        "Run Environment",
+    ]
+    rows = [header]
+
+    for label, result in results["targets"].items():
+        outputs = result.get("outputs") or {}
+        failed_steps = [
+            step for step in result["steps"] if step["status"] == STATUS_FAILED
+        ]
+        failed_step = ""
+        if failed_steps:
+            failed_step = f"{failed_steps[0]['name']}: {failed_steps[0]['detail']}"
+        elif result.get("error"):
+            failed_step = result["error"]
+
+        rows.append(
+            [
+                label,
+                result["status"],
+                failed_step,
+                (outputs.get("cluster_arn") or "").split("/")[-1],
+                outputs.get("vpc_id") or "",
+                outputs.get("run_environment_name") or "",
+            ]
+        )
+
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+
+    return "\n".join(
+        "  ".join(str(v).ljust(widths[i]) for i, v in enumerate(row)).rstrip()
+        for row in rows
+    )
+
+
+def print_result_table(results: dict[str, Any], stream: TextIO = sys.stderr) -> None:
+    print(file=stream)
+    print(format_result_table(results), file=stream)
+    print(file=stream)
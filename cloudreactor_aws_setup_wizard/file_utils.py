@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+
+# Writes to a temporary file in the same directory, then renames it over the
+# destination, so readers see either the old or the new contents but never a
+# partially written file.
+def write_file_atomically(filename: str, contents: str, fsync: bool = True) -> None:
+    directory = os.path.dirname(filename) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_filename = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(filename) + ".", suffix=".tmp"
+    )
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(contents)
+
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        os.replace(temp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,54 @@
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+# A token bucket shared by threads. Tokens are added at a fixed rate up to
+# the capacity, and acquire() blocks until a token is available, so bursts up
+# to the capacity are allowed but the average rate is limited.
+class TokenBucket(object):
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+
+                delay = (tokens - self.tokens) / self.rate
+
+            self.sleep(delay)
+            waited += delay
+
+    # Registers the bucket so each API call made by clients of the session
+    # waits for a token. Must be called before the clients are created.
+    def attach_to_session(self, session) -> None:
+        session.events.register("before-call", self.handle_before_call)
+
+    def handle_before_call(self, **kwargs: Any) -> None:
+        self.acquire()
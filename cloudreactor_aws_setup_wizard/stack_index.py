@@ -0,0 +1,88 @@
+import logging
+from typing import Any, Iterable, Iterator, NamedTuple, Optional
+
+from .aws_listing import ACTIVE_CLOUDFORMATION_STACK_STATUSES, PagedListing
+
+
+class StackSummary(NamedTuple):
+    name: str
+    stack_id: str
+    status: str
+
+
+# The names, IDs and statuses of the active CloudFormation stacks in a region,
+# indexed by name so name conflicts can be checked without a scan. If the
+# listing stopped at the page limit, truncated is set, and a name missing from
+# the index may still be taken.
+class StackIndex(object):
+    def __init__(
+        self, summaries: Iterable[StackSummary] = (), truncated: bool = False
+    ) -> None:
+        self.by_name: dict[str, StackSummary] = {}
+        self.truncated = truncated
+
+        for summary in summaries:
+            self.add(summary)
+
+    @classmethod
+    def load(cls, cf_client, max_pages: Optional[int] = None) -> "StackIndex":
+        stack_summaries = PagedListing(
+            cf_client,
+            "list_stacks",
+            "StackSummaries",
+            max_pages=max_pages,
+            StackStatusFilter=ACTIVE_CLOUDFORMATION_STACK_STATUSES,
+        )
+
+        stack_index = cls(
+            StackSummary(
+                name=summary["StackName"],
+                stack_id=summary["StackId"],
+                status=summary["StackStatus"],
+            )
+            for summary in stack_summaries
+        )
+        stack_index.truncated = stack_summaries.truncated
+        return stack_index
+
+    def add(self, summary: StackSummary) -> None:
+        self.by_name[summary.name] = summary
+
+    def get(self, name: str) -> Optional[StackSummary]:
+        return self.by_name.get(name)
+
+    def names(self) -> list[str]:
+        return list(self.by_name.keys())
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.by_name
+
+    def __iter__(self) -> Iterator[StackSummary]:
+        return iter(self.by_name.values())
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+
+def find_stack(cf_client, stack_name: str) -> Optional[StackSummary]:
+    try:
+        resp = cf_client.describe_stacks(StackName=stack_name)
+    except Exception as ex:
+        # CloudFormation reports a missing stack as a ValidationError
+        if str(ex).find("does not exist") >= 0:
+            return None
+
+        raise
+
+    stacks: list[dict[str, Any]] = resp.get("Stacks") or []
+
+    for stack in stacks:
+        if stack["StackStatus"] in ACTIVE_CLOUDFORMATION_STACK_STATUSES:
+            return StackSummary(
+                name=stack["StackName"],
+                stack_id=stack["StackId"],
+                status=stack["StackStatus"],
+            )
+
+    logging.debug(f"Stack '{stack_name}' was found but is deleted")
+    return None
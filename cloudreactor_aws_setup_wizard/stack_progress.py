@@ -0,0 +1,128 @@
+import logging
+import shutil
+import sys
+import threading
+import time
+from typing import Callable, NamedTuple, Optional, TextIO
+
+
+class StackProgress(NamedTuple):
+    label: str
+    started_at: float
+    message: Optional[str] = None
+    finished_at: Optional[float] = None
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+
+    return f"{seconds}s"
+
+
+# Keeps the latest progress message of each stack being installed in the
+# background, so it can be shown in a status line instead of being printed
+# in the middle of a prompt.
+class StackProgressTracker(object):
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.name_to_progress: dict[str, StackProgress] = {}
+        self.lock = threading.Lock()
+
+    # Returns the function that the stack waiter should report progress to
+    def start(self, name: str, label: str) -> Callable[[str], None]:
+        with self.lock:
+            self.name_to_progress[name] = StackProgress(
+                label=label, started_at=self.clock()
+            )
+
+        return lambda message: self.report(name, message)
+
+    def report(self, name: str, message: str) -> None:
+        logging.info(message)
+
+        with self.lock:
+            progress = self.name_to_progress.get(name)
+            if progress is not None:
+                self.name_to_progress[name] = progress._replace(message=message.strip())
+
+    def finish(self, name: str) -> None:
+        with self.lock:
+            progress = self.name_to_progress.get(name)
+            if progress is not None:
+                self.name_to_progress[name] = progress._replace(
+                    finished_at=self.clock()
+                )
+
+    # Forgets a stack, returning its last progress message
+    def pop_message(self, name: str) -> Optional[str]:
+        with self.lock:
+            progress = self.name_to_progress.pop(name, None)
+
+        return progress.message if progress else None
+
+    def format_status_line(self) -> Optional[str]:
+        now = self.clock()
+
+        with self.lock:
+            parts = [
+                f"{progress.label} ({format_duration(now - progress.started_at)})"
+                + (f": {progress.message}" if progress.message else "")
+                for progress in self.name_to_progress.values()
+                if progress.finished_at is None
+            ]
+
+        return " | ".join(parts) or None
+
+
+# Shows a line of text that is redrawn in place until the block exits. If the
+# stream isn't a terminal, nothing is shown, since the line can't be redrawn.
+class StatusLine(object):
+    DEFAULT_INTERVAL_SECONDS = 0.5
+
+    def __init__(
+        self,
+        get_text: Callable[[], Optional[str]],
+        stream: TextIO = sys.stdout,
+        interval: float = DEFAULT_INTERVAL_SECONDS,
+    ) -> None:
+        self.get_text = get_text
+        self.stream = stream
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "StatusLine":
+        isatty = getattr(self.stream, "isatty", None)
+
+        if isatty and isatty():
+            self.thread = threading.Thread(
+                target=self.run, name="status-line", daemon=True
+            )
+            self.thread.start()
+
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.thread is None:
+            return
+
+        self.stop_event.set()
+        self.thread.join()
+        self.stream.write("\r\x1b[K")
+        self.stream.flush()
+
+    def run(self) -> None:
+        while True:
+            self.draw()
+
+            if self.stop_event.wait(self.interval):
+                return
+
+    def draw(self) -> None:
+        width = shutil.get_terminal_size().columns - 1
+        text = (self.get_text() or "")[:width]
+        self.stream.write("\r\x1b[K" + text)
+        self.stream.flush()
@@ -0,0 +1,300 @@
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+
+from .stack_waiter import CLOUDFORMATION_SUCCESSFUL_STATUSES, PollingSchedule
+
+UPDATE_STARTED = "started"
+UPDATE_UNCHANGED = "unchanged"
+UPDATE_CANCELLED = "cancelled"
+
+CHANGE_SET_PENDING_STATUSES = set(["CREATE_PENDING", "CREATE_IN_PROGRESS"])
+
+# CloudFormation reports an update without changes as a failed change set,
+# with one of these status reasons
+NO_CHANGES_STATUS_REASONS = [
+    "didn't contain changes",
+    "No updates are to be performed",
+]
+
+DEFAULT_CHANGE_SET_TIMEOUT_SECONDS = 300.0
+
+
+class StackUpdateResult(NamedTuple):
+    status: str
+    stack_id: str
+    template_hash: str
+    changes: tuple[dict[str, Any], ...] = ()
+    # Set if the stack was found to be up to date without a change set
+    stack: Optional[dict[str, Any]] = None
+
+
+# Identifies the template and parameters applied to a stack. Parameters that
+# use their previous values are included as such, so the hash doesn't contain
+# any secret values.
+def make_template_hash(
+    template_body: Optional[str] = None,
+    template_url: Optional[str] = None,
+    parameters: Iterable[dict[str, Any]] = (),
+    capabilities: Iterable[str] = (),
+) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            {
+                "template_body": template_body,
+                "template_url": template_url,
+                "parameters": sorted(
+                    (json.dumps(p, sort_keys=True) for p in parameters)
+                ),
+                "capabilities": sorted(capabilities),
+            },
+            sort_keys=True,
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+# The stack is identified by the time of its last update, so a change made
+# outside the wizard invalidates the saved hash
+def get_stack_version(stack: dict[str, Any]) -> Optional[str]:
+    updated_at = stack.get("LastUpdatedTime") or stack.get("CreationTime")
+    return str(updated_at) if updated_at else None
+
+
+# template_body_hash identifies the template in a TemplateStore
+def make_template_hash_entry(
+    template_hash: str,
+    stack: dict[str, Any],
+    template_body_hash: Optional[str] = None,
+) -> dict[str, Optional[str]]:
+    return {
+        "template_hash": template_hash,
+        "stack_version": get_stack_version(stack),
+        "template_body_hash": template_body_hash,
+    }
+
+
+def format_change(change: dict[str, Any]) -> str:
+    resource_change = change.get("ResourceChange") or {}
+    message = f"  {resource_change.get('Action')} {resource_change.get('LogicalResourceId')} ({resource_change.get('ResourceType')})"
+
+    replacement = resource_change.get("Replacement")
+    if replacement == "True":
+        message += ", replaces the resource"
+    elif replacement == "Conditional":
+        message += ", may replace the resource"
+
+    return message
+
+
+# Updates CloudFormation stacks through change sets, so the changes can be
+# shown, and confirmed, before they are made. A change set without changes
+# is deleted instead of being executed. template_hashes maps stack IDs to
+# entries made by make_template_hash_entry() after earlier updates; if the
+# template and parameters hash to the saved value, and the stack hasn't been
+# updated since, a single describe call is enough to find the stack is up to
+# date. Otherwise a template without parameters is compared with the deployed
+# one. Templates given by URL can change without the URL changing, so they
+# always go through a change set.
+class StackUpdater(object):
+    def __init__(
+        self,
+        cf_client,
+        template_hashes: Optional[dict[str, dict[str, Optional[str]]]] = None,
+        report: Callable[[str], None] = print,
+        confirm: Optional[Callable[[list[dict[str, Any]]], bool]] = None,
+        schedule: Optional[PollingSchedule] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        timeout: float = DEFAULT_CHANGE_SET_TIMEOUT_SECONDS,
+    ) -> None:
+        self.cf_client = cf_client
+        self.template_hashes = template_hashes or {}
+        self.report = report
+        self.confirm = confirm
+        self.schedule = schedule or PollingSchedule(initial_delay=1.0, max_delay=5.0)
+        self.clock = clock
+        self.sleep = sleep
+        self.timeout = timeout
+
+    def update(
+        self,
+        stack_id: str,
+        template_body: Optional[str] = None,
+        template_url: Optional[str] = None,
+        parameters: Iterable[dict[str, Any]] = (),
+        capabilities: Iterable[str] = (),
+    ) -> StackUpdateResult:
+        parameters = list(parameters)
+        capabilities = list(capabilities)
+        template_hash = make_template_hash(
+            template_body, template_url, parameters, capabilities
+        )
+
+        if template_body is not None:
+            stack = self.find_up_to_date_stack(
+                stack_id, template_hash, template_body, bool(parameters)
+            )
+
+            if stack is not None:
+                return StackUpdateResult(
+                    status=UPDATE_UNCHANGED,
+                    stack_id=stack["StackId"],
+                    template_hash=template_hash,
+                    stack=stack,
+                )
+
+        kwargs: dict[str, Any] = {
+            "StackName": stack_id,
+            "ChangeSetName": f"cloudreactor-wizard-{uuid.uuid4().hex}",
+            "ChangeSetType": "UPDATE",
+            "Parameters": parameters,
+            "Capabilities": capabilities,
+        }
+
+        if template_body is not None:
+            kwargs["TemplateBody"] = template_body
+        else:
+            kwargs["TemplateURL"] = template_url
+
+        resp = self.cf_client.create_change_set(**kwargs)
+        change_set_id = resp["Id"]
+        stack_id = resp.get("StackId") or stack_id
+
+        try:
+            change_set = self.wait_for_change_set(change_set_id)
+        except Exception:
+            self.delete_change_set(change_set_id)
+            raise
+
+        if change_set["Status"] != "CREATE_COMPLETE":
+            self.delete_change_set(change_set_id)
+            reason = change_set.get("StatusReason") or ""
+
+            if any(r in reason for r in NO_CHANGES_STATUS_REASONS):
+                return StackUpdateResult(
+                    status=UPDATE_UNCHANGED,
+                    stack_id=stack_id,
+                    template_hash=template_hash,
+                )
+
+            raise RuntimeError(
+                f"Can't create change set for stack '{stack_id}': {reason}"
+            )
+
+        changes = self.fetch_changes(change_set)
+
+        self.report(f"The stack will be updated with {len(changes)} change(s):")
+        for change in changes:
+            self.report(format_change(change))
+
+        if self.confirm and not self.confirm(changes):
+            self.delete_change_set(change_set_id)
+            return StackUpdateResult(
+                status=UPDATE_CANCELLED,
+                stack_id=stack_id,
+                template_hash=template_hash,
+                changes=tuple(changes),
+            )
+
+        self.cf_client.execute_change_set(ChangeSetName=change_set_id)
+
+        return StackUpdateResult(
+            status=UPDATE_STARTED,
+            stack_id=stack_id,
+            template_hash=template_hash,
+            changes=tuple(changes),
+        )
+
+    # Returns the described stack if it already has the template. Without a
+    # saved hash for the stack, or if the stack was updated since the hash
+    # was saved, the deployed template is fetched and compared, which only
+    # works for templates without parameters.
+    def find_up_to_date_stack(
+        self,
+        stack_id: str,
+        template_hash: str,
+        template_body: str,
+        has_parameters: bool,
+    ) -> Optional[dict[str, Any]]:
+        entry = self.template_hashes.get(stack_id)
+
+        # The template changed since it was last applied
+        if entry and (entry.get("template_hash") != template_hash):
+            return None
+
+        if has_parameters and not entry:
+            return None
+
+        try:
+            stacks = self.cf_client.describe_stacks(StackName=stack_id)["Stacks"]
+        except Exception:
+            logging.info("Can't describe stack, using a change set", exc_info=True)
+            return None
+
+        if (not stacks) or (
+            stacks[0]["StackStatus"] not in CLOUDFORMATION_SUCCESSFUL_STATUSES
+        ):
+            return None
+
+        stack = stacks[0]
+
+        if entry and (get_stack_version(stack) == entry.get("stack_version")):
+            return stack
+
+        if has_parameters:
+            return None
+
+        try:
+            deployed_template_body = self.cf_client.get_template(
+                StackName=stack_id, TemplateStage="Original"
+            ).get("TemplateBody")
+        except Exception:
+            logging.info("Can't get stack template, using a change set", exc_info=True)
+            return None
+
+        # JSON templates are returned parsed, so they never match
+        if deployed_template_body == template_body:
+            return stack
+
+        return None
+
+    def wait_for_change_set(self, change_set_id: str) -> dict[str, Any]:
+        started_at = self.clock()
+        delays = self.schedule.delays()
+
+        while True:
+            change_set = self.cf_client.describe_change_set(ChangeSetName=change_set_id)
+
+            if change_set["Status"] not in CHANGE_SET_PENDING_STATUSES:
+                return change_set
+
+            delay = next(delays)
+
+            if self.clock() - started_at + delay > self.timeout:
+                raise RuntimeError(
+                    f"Timed out waiting for change set after {round(self.clock() - started_at)} seconds"
+                )
+
+            self.sleep(delay)
+
+    def fetch_changes(self, change_set: dict[str, Any]) -> list[dict[str, Any]]:
+        changes = list(change_set.get("Changes") or [])
+        next_token = change_set.get("NextToken")
+
+        while next_token:
+            resp = self.cf_client.describe_change_set(
+                ChangeSetName=change_set["ChangeSetId"], NextToken=next_token
+            )
+            changes.extend(resp.get("Changes") or [])
+            next_token = resp.get("NextToken")
+
+        return changes
+
+    def delete_change_set(self, change_set_id: str) -> None:
+        try:
+            self.cf_client.delete_change_set(ChangeSetName=change_set_id)
+        except Exception:
+            logging.warning(f"Can't delete change set {change_set_id}", exc_info=True)
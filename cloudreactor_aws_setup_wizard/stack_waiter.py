@@ -0,0 +1,228 @@
+import logging
+import random
+import time
+from typing import Any, Callable, Iterator, Optional
+
+from .aws_calls import ERROR_FATAL, ERROR_THROTTLING, classify_error
+
+CLOUDFORMATION_IN_PROGRESS_STATUSES = set(
+    [
+        "CREATE_IN_PROGRESS",
+        "UPDATE_IN_PROGRESS",
+        "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS",
+        "IMPORT_IN_PROGRESS",
+    ]
+)
+CLOUDFORMATION_SUCCESSFUL_STATUSES = set(
+    ["CREATE_COMPLETE", "UPDATE_COMPLETE", "IMPORT_COMPLETE"]
+)
+
+CLOUDFORMATION_STACK_RESOURCE_TYPE = "AWS::CloudFormation::Stack"
+
+
+class PollingSchedule(object):
+    DEFAULT_INITIAL_DELAY_SECONDS = 2.0
+    DEFAULT_MULTIPLIER = 1.5
+    DEFAULT_MAX_DELAY_SECONDS = 15.0
+    DEFAULT_JITTER = 0.2
+
+    def __init__(
+        self,
+        initial_delay: float = DEFAULT_INITIAL_DELAY_SECONDS,
+        multiplier: float = DEFAULT_MULTIPLIER,
+        max_delay: float = DEFAULT_MAX_DELAY_SECONDS,
+        jitter: float = DEFAULT_JITTER,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def delays(self) -> Iterator[float]:
+        delay = self.initial_delay
+        while True:
+            spread = delay * self.jitter
+            yield min(
+                max(delay + self.rng.uniform(-spread, spread), 0.0), self.max_delay
+            )
+            delay = min(delay * self.multiplier, self.max_delay)
+
+
+# Waits for a CloudFormation stack operation to finish. Each poll only fetches
+# stack events newer than the last one seen, and the stack itself is only
+# described when a stack-level event shows the operation may have finished,
+# or after max_polls_between_checks polls as a safety net.
+class StackWaiter(object):
+    DEFAULT_MAX_POLLS_BETWEEN_CHECKS = 6
+
+    def __init__(
+        self,
+        cf_client,
+        schedule: Optional[PollingSchedule] = None,
+        refresh_client: Optional[Callable[[], Any]] = None,
+        report: Callable[[str], None] = print,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        timeout: Optional[float] = None,
+        max_polls_between_checks: int = DEFAULT_MAX_POLLS_BETWEEN_CHECKS,
+    ) -> None:
+        self.cf_client = cf_client
+        self.schedule = schedule or PollingSchedule()
+        self.refresh_client = refresh_client
+        self.report = report
+        self.clock = clock
+        self.sleep = sleep
+        self.timeout = timeout
+        self.max_polls_between_checks = max_polls_between_checks
+
+    def wait(self, stack_id: str, stack_name: str) -> Optional[dict[str, Any]]:
+        started_at = self.clock()
+        delays = self.schedule.delays()
+
+        # Establish the event baseline before describing the stack, so an
+        # operation finishing in between is still seen as a new event.
+        last_event_id: Optional[str] = None
+        try:
+            last_event_id = self.fetch_latest_event_id(stack_id)
+        except Exception:
+            logging.warning("Can't fetch CloudFormation stack events", exc_info=True)
+
+        should_describe = True
+        polls_since_describe = 0
+
+        while True:
+            if should_describe:
+                polls_since_describe = 0
+                stack: Optional[dict[str, Any]] = None
+                try:
+                    stacks = self.cf_client.describe_stacks(StackName=stack_id)[
+                        "Stacks"
+                    ]
+
+                    if len(stacks) == 0:
+                        self.report(
+                            f"CloudFormation stack '{stack_name}' was deleted, please check your settings and try again.\n"
+                        )
+                        return None
+
+                    stack = stacks[0]
+                except Exception as ex:
+                    # Includes a stack that no longer exists
+                    if classify_error(ex) == ERROR_FATAL:
+                        logging.warning(
+                            "Can't describe CloudFormation stack", exc_info=True
+                        )
+                        self.report(
+                            f"Can't check the status of CloudFormation stack '{stack_name}': {ex}\n"
+                        )
+                        return None
+
+                    self.handle_client_error(ex)
+
+                if stack is not None:
+                    status = stack["StackStatus"]
+                    if status not in CLOUDFORMATION_IN_PROGRESS_STATUSES:
+                        return stack
+
+                    self.report(
+                        f"CloudFormation stack installation is still in progress ({status}) ..."
+                    )
+
+            delay = next(delays)
+
+            if (self.timeout is not None) and (
+                self.clock() - started_at + delay > self.timeout
+            ):
+                self.report(
+                    f"Timed out waiting for CloudFormation stack '{stack_name}' after {round(self.clock() - started_at)} seconds.\n"
+                )
+                return None
+
+            self.sleep(delay)
+            polls_since_describe += 1
+
+            try:
+                events = self.fetch_new_events(stack_id, last_event_id)
+            except Exception as ex:
+                self.handle_client_error(ex)
+                should_describe = True
+                continue
+
+            if events:
+                last_event_id = events[0]["EventId"]
+
+                # Events are returned newest first
+                for event in reversed(events):
+                    self.report(self.format_event(event))
+
+            should_describe = any(
+                self.is_finished_stack_event(event) for event in events
+            ) or (polls_since_describe >= self.max_polls_between_checks)
+
+    def fetch_latest_event_id(self, stack_id: str) -> Optional[str]:
+        resp = self.cf_client.describe_stack_events(StackName=stack_id)
+        events = resp.get("StackEvents") or []
+
+        if events:
+            return events[0]["EventId"]
+
+        return None
+
+    def fetch_new_events(
+        self, stack_id: str, last_event_id: Optional[str]
+    ) -> list[dict[str, Any]]:
+        new_events: list[dict[str, Any]] = []
+        next_token: Optional[str] = None
+
+        while True:
+            kwargs: dict[str, Any] = {"StackName": stack_id}
+            if next_token:
+                kwargs["NextToken"] = next_token
+
+            resp = self.cf_client.describe_stack_events(**kwargs)
+
+            for event in resp.get("StackEvents") or []:
+                if event["EventId"] == last_event_id:
+                    return new_events
+
+                new_events.append(event)
+
+            next_token = resp.get("NextToken")
+
+            # Without a baseline, the first page is enough to detect progress
+            if (not next_token) or (last_event_id is None):
+                return new_events
+
+    def is_finished_stack_event(self, event: dict[str, Any]) -> bool:
+        return (
+            (event.get("ResourceType") == CLOUDFORMATION_STACK_RESOURCE_TYPE)
+            and (event.get("PhysicalResourceId") == event.get("StackId"))
+            and (event.get("ResourceStatus") not in CLOUDFORMATION_IN_PROGRESS_STATUSES)
+        )
+
+    def format_event(self, event: dict[str, Any]) -> str:
+        message = f"  {event.get('LogicalResourceId')} ({event.get('ResourceType')}): {event.get('ResourceStatus')}"
+
+        reason = event.get("ResourceStatusReason")
+        if reason:
+            message += f" - {reason}"
+
+        return message
+
+    def handle_client_error(self, ex: Exception) -> None:
+        # botocore already retried with backoff, and a new client would start
+        # over without the backoff state, so just wait for the next poll
+        if classify_error(ex) == ERROR_THROTTLING:
+            logging.info(f"CloudFormation is throttling requests: {ex}")
+            return
+
+        logging.warning(
+            "CloudFormation request failed, re-creating client ...", exc_info=True
+        )
+
+        if self.refresh_client:
+            cf_client = self.refresh_client()
+            if cf_client is not None:
+                self.cf_client = cf_client
@@ -0,0 +1,73 @@
+import atexit
+import logging
+import threading
+from typing import Callable, Optional
+
+from .file_utils import write_file_atomically
+from .tracing import get_tracer
+
+
+# Saves the wizard state to a file without blocking the caller. A save request
+# only marks the state as dirty and starts a short timer, so back-to-back
+# requests made while answering one prompt result in a single write. Writes are
+# atomic, so the file always holds either the previous or the new state. Any
+# pending write is flushed when the process exits.
+class StateStore(object):
+    DEFAULT_DELAY_SECONDS = 0.25
+
+    def __init__(
+        self,
+        filename: str,
+        encode: Callable[[], str],
+        delay: float = DEFAULT_DELAY_SECONDS,
+    ) -> None:
+        self.filename = filename
+        self.encode = encode
+        self.delay = delay
+        self.dirty = False
+        self.timer: Optional[threading.Timer] = None
+        self.lock = threading.Lock()
+        # Held while encoding and writing, so writes never interleave
+        self.write_lock = threading.Lock()
+
+        atexit.register(self.flush)
+
+    def request_save(self) -> None:
+        with self.lock:
+            self.dirty = True
+
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self) -> None:
+        with self.write_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+
+                if not self.dirty:
+                    return
+
+                # Cleared before encoding, so a save requested while this
+                # write is in progress schedules another one
+                self.dirty = False
+
+            try:
+                with get_tracer().span("state_store.write"):
+                    write_file_atomically(self.filename, self.encode())
+            except Exception:
+                logging.warning(
+                    f"Can't write saved state file '{self.filename}'", exc_info=True
+                )
+
+                # Written by the next flush, at the latest when the process
+                # exits, unless that fails too
+                with self.lock:
+                    self.dirty = True
+
+    def close(self) -> None:
+        self.flush()
+        atexit.unregister(self.flush)
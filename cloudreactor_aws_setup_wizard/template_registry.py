@@ -0,0 +1,78 @@
+import functools
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import jinja2
+
+# If set, compiled templates are cached in this directory between runs
+TEMPLATE_CACHE_DIRECTORY_ENV_VAR = "WIZARD_TEMPLATE_CACHE_DIRECTORY"
+
+VPC_TEMPLATE_NAME = "vpc.yml.j2"
+
+_environment: Optional["jinja2.Environment"] = None
+_environment_lock = threading.Lock()
+
+
+# Returns the Jinja environment shared by the whole process. Templates are
+# packaged with the wizard and never change while it runs, so each one is
+# compiled on first use only, without checking the file again afterwards.
+def get_environment() -> "jinja2.Environment":
+    global _environment
+
+    with _environment_lock:
+        if _environment is None:
+            from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+
+            bytecode_cache = None
+            cache_directory = os.environ.get(TEMPLATE_CACHE_DIRECTORY_ENV_VAR)
+            if cache_directory:
+                try:
+                    os.makedirs(cache_directory, exist_ok=True)
+                    bytecode_cache = FileSystemBytecodeCache(cache_directory)
+                except OSError:
+                    logging.warning(
+                        f"Can't use template cache directory '{cache_directory}'",
+                        exc_info=True,
+                    )
+
+            _environment = Environment(
+                loader=PackageLoader("cloudreactor_aws_setup_wizard", "templates"),
+                bytecode_cache=bytecode_cache,
+                auto_reload=False,
+            )
+
+        return _environment
+
+
+def get_template(name: str) -> "jinja2.Template":
+    return get_environment().get_template(name)
+
+
+# Renders the VPC template. Arguments must already be normalized (sorted
+# tuples without duplicates), so equivalent selections share a cache entry
+# and a repeated render returns the cached text. subnet_cidrs has the public
+# and private subnet blocks for each AZ in all_az_letters.
+@functools.lru_cache(maxsize=256)
+def render_vpc_template(
+    all_az_letters: tuple[str, ...],
+    public_az_letters: tuple[str, ...],
+    private_az_letters: tuple[str, ...],
+    private_az_with_nat_letters: tuple[str, ...],
+    vpc_cidr: str,
+    subnet_cidrs: tuple[tuple[str, str], ...],
+    vpc_endpoints: tuple[str, ...],
+) -> str:
+    return get_template(VPC_TEMPLATE_NAME).render(
+        {
+            "all_az_letters": list(all_az_letters),
+            "public_az_letters": list(public_az_letters),
+            "private_az_letters": list(private_az_letters),
+            "private_az_with_nat_letters": list(private_az_with_nat_letters),
+            "vpc_cidr": vpc_cidr,
+            "subnet_cidrs": list(subnet_cidrs),
+            "vpc_endpoints": list(vpc_endpoints),
+        }
+    )
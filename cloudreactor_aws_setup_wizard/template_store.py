@@ -0,0 +1,52 @@
+import hashlib
+import logging
+import os
+from typing import Optional
+
+from .file_utils import write_file_atomically
+
+
+def hash_template_body(template_body: str) -> str:
+    return hashlib.sha256(template_body.encode("utf-8")).hexdigest()
+
+
+# Keeps rendered CloudFormation templates in files named by the hash of their
+# contents, so the template deployed to each stack can be found from the hash
+# saved for it, and a template used by several stacks is stored once. Files
+# are never changed after they are written.
+class TemplateStore(object):
+    SUBDIRECTORY = "templates"
+
+    def __init__(self, directory: str) -> None:
+        self.directory = os.path.join(directory, TemplateStore.SUBDIRECTORY)
+
+    def put(self, template_body: str) -> str:
+        template_hash = hash_template_body(template_body)
+        filename = self.make_filename(template_hash)
+
+        if not os.path.exists(filename):
+            try:
+                write_file_atomically(filename, template_body, fsync=False)
+            except OSError:
+                logging.warning(
+                    f"Can't write template file '{filename}'", exc_info=True
+                )
+
+        return template_hash
+
+    def get(self, template_hash: str) -> Optional[str]:
+        try:
+            with open(self.make_filename(template_hash)) as f:
+                template_body = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Ignores files that were changed or truncated
+        if hash_template_body(template_body) != template_hash:
+            logging.warning(f"Stored template {template_hash} is corrupt, ignoring it")
+            return None
+
+        return template_body
+
+    def make_filename(self, template_hash: str) -> str:
+        return os.path.join(self.directory, template_hash + ".yml")
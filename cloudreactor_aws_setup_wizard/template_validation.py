@@ -0,0 +1,271 @@
+import functools
+import ipaddress
+import re
+from typing import Any, Iterator, Optional
+
+SUB_VARIABLE_REGEX = re.compile(r"\$\{([^}!][^}]*)\}")
+
+DEFAULT_ROUTE_CIDR = "0.0.0.0/0"
+
+
+class TemplateValidationError(ValueError):
+    def __init__(self, problems: list[str]) -> None:
+        super().__init__("Invalid template: " + "; ".join(problems))
+        self.problems = problems
+
+
+# Loads a CloudFormation YAML template, turning short form intrinsic functions
+# like "!Ref X" into their long form, like {"Ref": "X"}
+def load_template(template_body: str) -> dict[str, Any]:
+    import yaml
+
+    # The C loader is several times faster, if libyaml is available
+    class TemplateLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):  # type: ignore[misc]
+        pass
+
+    def construct_intrinsic(loader, tag_suffix: str, node) -> dict[str, Any]:
+        if isinstance(node, yaml.ScalarNode):
+            value: Any = loader.construct_scalar(node)
+        elif isinstance(node, yaml.SequenceNode):
+            value = loader.construct_sequence(node, deep=True)
+        else:
+            value = loader.construct_mapping(node, deep=True)
+
+        if tag_suffix == "Ref":
+            return {"Ref": value}
+
+        if (tag_suffix == "GetAtt") and isinstance(value, str):
+            value = value.split(".", 1)
+
+        return {"Fn::" + tag_suffix: value}
+
+    TemplateLoader.add_multi_constructor("!", construct_intrinsic)
+
+    template = yaml.load(template_body, Loader=TemplateLoader)
+
+    if not isinstance(template, dict):
+        raise TemplateValidationError(["The template is not a mapping"])
+
+    return template
+
+
+def iterate_intrinsics(value: Any) -> Iterator[tuple[str, Any]]:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if (k == "Ref") or k.startswith("Fn::"):
+                yield k, v
+
+            yield from iterate_intrinsics(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from iterate_intrinsics(v)
+
+
+def get_ref(value: Any) -> Optional[str]:
+    if isinstance(value, dict) and isinstance(value.get("Ref"), str):
+        return value["Ref"]
+
+    return None
+
+
+# Returns the CIDR block of a property that is a literal, or a Sub without
+# variables
+def get_literal_cidr(
+    value: Any,
+) -> Optional[ipaddress.IPv4Network | ipaddress.IPv6Network]:
+    if isinstance(value, dict) and isinstance(value.get("Fn::Sub"), str):
+        value = value["Fn::Sub"]
+
+    if (not isinstance(value, str)) or SUB_VARIABLE_REGEX.search(value):
+        return None
+
+    return ipaddress.ip_network(value)
+
+
+def check_references(template: dict[str, Any]) -> list[str]:
+    resources = template.get("Resources") or {}
+    names = set(resources) | set(template.get("Parameters") or {})
+    problems: list[str] = []
+
+    def check_name(source: str, kind: str, name: Any) -> None:
+        if not isinstance(name, str):
+            problems.append(f"{source}: {kind} target {name!r} is not a name")
+        elif (not name.startswith("AWS::")) and (name not in names):
+            problems.append(f"{source}: {kind} target '{name}' does not exist")
+
+    for section in ["Resources", "Outputs", "Conditions"]:
+        for source, value in (template.get(section) or {}).items():
+            for function, arg in iterate_intrinsics(value):
+                if function == "Ref":
+                    check_name(source, "Ref", arg)
+                elif function == "Fn::GetAtt":
+                    if isinstance(arg, list) and (len(arg) == 2):
+                        if arg[0] not in resources:
+                            problems.append(
+                                f"{source}: GetAtt target '{arg[0]}' is not a resource"
+                            )
+                    else:
+                        problems.append(f"{source}: GetAtt {arg!r} is malformed")
+                elif function == "Fn::Sub":
+                    text = arg[0] if isinstance(arg, list) else arg
+                    local_names = (
+                        set(arg[1]) if isinstance(arg, list) and len(arg) > 1 else set()
+                    )
+
+                    for variable in SUB_VARIABLE_REGEX.findall(str(text)):
+                        name = variable.split(".", 1)[0]
+                        if name not in local_names:
+                            check_name(source, "Sub", name)
+
+            if section != "Resources":
+                continue
+
+            depends_on = value.get("DependsOn") or []
+            for name in [depends_on] if isinstance(depends_on, str) else depends_on:
+                if name not in resources:
+                    problems.append(
+                        f"{source}: DependsOn target '{name}' does not exist"
+                    )
+
+    return problems
+
+
+def find_resources(template: dict[str, Any], resource_type: str) -> dict[str, Any]:
+    return {
+        name: resource.get("Properties") or {}
+        for name, resource in (template.get("Resources") or {}).items()
+        if resource.get("Type") == resource_type
+    }
+
+
+# Checks that subnets are in the CIDR block of their VPC and don't overlap.
+# Sorting by network address means only neighbors need to be compared.
+def check_cidrs(template: dict[str, Any]) -> list[str]:
+    problems: list[str] = []
+    vpc_cidrs: dict[str, Any] = {}
+
+    try:
+        for name, properties in find_resources(template, "AWS::EC2::VPC").items():
+            cidr = get_literal_cidr(properties.get("CidrBlock"))
+            if cidr is not None:
+                vpc_cidrs[name] = cidr
+
+        subnet_cidrs: list[tuple[Any, str]] = []
+        for name, properties in find_resources(template, "AWS::EC2::Subnet").items():
+            cidr = get_literal_cidr(properties.get("CidrBlock"))
+            if cidr is None:
+                continue
+
+            vpc_cidr = vpc_cidrs.get(get_ref(properties.get("VpcId")) or "")
+            if (vpc_cidr is not None) and not (
+                (cidr.version == vpc_cidr.version) and cidr.subnet_of(vpc_cidr)
+            ):
+                problems.append(f"{name}: {cidr} is outside of the VPC's {vpc_cidr}")
+
+            subnet_cidrs.append((cidr, name))
+    except ValueError as ex:
+        return problems + [f"Invalid CIDR block: {ex}"]
+
+    subnet_cidrs.sort(key=lambda t: (t[0].version, t[0].network_address))
+
+    for (cidr, name), (next_cidr, next_name) in zip(subnet_cidrs, subnet_cidrs[1:]):
+        if (cidr.version == next_cidr.version) and cidr.overlaps(next_cidr):
+            problems.append(f"{name} ({cidr}) overlaps {next_name} ({next_cidr})")
+
+    return problems
+
+
+# Checks that each NAT gateway is in a public subnet, that is, a subnet whose
+# route table sends traffic to an internet gateway, and that private route
+# tables don't route through a NAT gateway in the same subnet.
+def check_nat_gateways(template: dict[str, Any]) -> list[str]:
+    problems: list[str] = []
+    internet_gateways = set(find_resources(template, "AWS::EC2::InternetGateway"))
+
+    subnet_to_route_tables: dict[str, set[str]] = {}
+    for association in find_resources(
+        template, "AWS::EC2::SubnetRouteTableAssociation"
+    ).values():
+        subnet = get_ref(association.get("SubnetId"))
+        route_table = get_ref(association.get("RouteTableId"))
+        if subnet and route_table:
+            subnet_to_route_tables.setdefault(subnet, set()).add(route_table)
+
+    route_tables_with_internet_route: set[str] = set()
+    nat_routes: list[tuple[str, str, str]] = []
+    for name, route in find_resources(template, "AWS::EC2::Route").items():
+        route_table = get_ref(route.get("RouteTableId"))
+
+        if get_ref(route.get("GatewayId")) in internet_gateways:
+            if route.get("DestinationCidrBlock") == DEFAULT_ROUTE_CIDR:
+                route_tables_with_internet_route.add(route_table or "")
+
+        nat_gateway = get_ref(route.get("NatGatewayId"))
+        if nat_gateway and route_table:
+            nat_routes.append((name, route_table, nat_gateway))
+
+    nat_gateway_to_subnet: dict[str, str] = {}
+    for name, properties in find_resources(template, "AWS::EC2::NatGateway").items():
+        subnet = get_ref(properties.get("SubnetId"))
+
+        if not subnet:
+            problems.append(f"{name}: NAT gateway has no subnet")
+            continue
+
+        nat_gateway_to_subnet[name] = subnet
+
+        if not (
+            subnet_to_route_tables.get(subnet, set()) & route_tables_with_internet_route
+        ):
+            problems.append(
+                f"{name}: NAT gateway subnet '{subnet}' has no route to an internet gateway"
+            )
+
+    for name, route_table, nat_gateway in nat_routes:
+        subnet = nat_gateway_to_subnet.get(nat_gateway)
+
+        if subnet and (route_table in subnet_to_route_tables.get(subnet, set())):
+            problems.append(
+                f"{name}: routes the NAT gateway's own subnet '{subnet}' through it"
+            )
+
+    return problems
+
+
+# Returns the problems found in a template, without calling AWS. Results are
+# cached, since the same rendered template is usually validated again when
+# the wizard is re-run with the same settings.
+@functools.lru_cache(maxsize=32)
+def find_template_problems(template_body: str) -> tuple[str, ...]:
+    try:
+        template = load_template(template_body)
+    except TemplateValidationError as ex:
+        return tuple(ex.problems)
+    except Exception as ex:
+        return (f"The template is not valid YAML: {ex}",)
+
+    resources = template.get("Resources")
+    if not (isinstance(resources, dict) and resources):
+        return ("The template has no resources",)
+
+    problems = [
+        f"{name}: has no Type"
+        for name, resource in resources.items()
+        if not (isinstance(resource, dict) and resource.get("Type"))
+    ]
+
+    if problems:
+        return tuple(problems)
+
+    return tuple(
+        check_references(template)
+        + check_cidrs(template)
+        + check_nat_gateways(template)
+    )
+
+
+def validate_template(template_body: str) -> None:
+    problems = find_template_problems(template_body)
+
+    if problems:
+        raise TemplateValidationError(list(problems))
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Optional
+
+from .file_utils import write_file_atomically
+
+
+# Keeps CloudReactor API tokens between runs, so a new run can skip logging
+# in. Tokens are stored in the system keyring if the keyring package is
+# installed and has a backend, otherwise in a file that only the current user
+# can read. Each entry has a fingerprint of the password, so tokens are only
+# reused by someone who knows the password they were created with.
+class TokenCache(object):
+    FILENAME = "cloudreactor_tokens.json"
+    KEYRING_SERVICE_NAME = "cloudreactor-aws-setup-wizard"
+    FINGERPRINT_ITERATIONS = 100000
+
+    def __init__(self, directory: str, use_keyring: bool = True) -> None:
+        self.filename = os.path.join(directory, TokenCache.FILENAME)
+        self.use_keyring = use_keyring
+        self.lock = threading.Lock()
+
+    def load(
+        self, api_base_url: str, username: str, password: str
+    ) -> Optional[dict[str, str]]:
+        key = self.make_key(api_base_url, username)
+        entry: Optional[dict[str, Any]] = None
+
+        keyring = self.get_keyring()
+        if keyring:
+            try:
+                value = keyring.get_password(TokenCache.KEYRING_SERVICE_NAME, key)
+                entry = json.loads(value) if value else None
+            except Exception:
+                logging.info("Can't read tokens from the keyring", exc_info=True)
+        else:
+            entry = self.load_entries().get(key)
+
+        if (not entry) or (
+            entry.get("fingerprint")
+            != self.make_fingerprint(api_base_url, username, password)
+        ):
+            return None
+
+        return entry.get("tokens")
+
+    def store(
+        self, api_base_url: str, username: str, password: str, tokens: dict[str, str]
+    ) -> None:
+        key = self.make_key(api_base_url, username)
+        entry = {
+            "fingerprint": self.make_fingerprint(api_base_url, username, password),
+            "tokens": tokens,
+        }
+
+        keyring = self.get_keyring()
+        if keyring:
+            try:
+                keyring.set_password(
+                    TokenCache.KEYRING_SERVICE_NAME, key, json.dumps(entry)
+                )
+            except Exception:
+                logging.info("Can't save tokens in the keyring", exc_info=True)
+
+            return
+
+        with self.lock:
+            entries = self.load_entries()
+            entries[key] = entry
+
+            try:
+                # The temporary file is created readable by the owner only,
+                # and renaming keeps its permissions
+                write_file_atomically(self.filename, json.dumps(entries))
+            except OSError:
+                logging.warning(
+                    f"Can't write token cache file '{self.filename}'", exc_info=True
+                )
+
+    def load_entries(self) -> dict[str, Any]:
+        try:
+            with open(self.filename) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logging.warning(
+                f"Can't read token cache file '{self.filename}'", exc_info=True
+            )
+            return {}
+
+    def get_keyring(self):
+        if not self.use_keyring:
+            return None
+
+        try:
+            import keyring
+            from keyring.backends.fail import Keyring as FailKeyring
+        except ImportError:
+            return None
+
+        if isinstance(keyring.get_keyring(), FailKeyring):
+            return None
+
+        return keyring
+
+    def make_key(self, api_base_url: str, username: str) -> str:
+        return f"{username}@{api_base_url}"
+
+    def make_fingerprint(self, api_base_url: str, username: str, password: str) -> str:
+        return hashlib.pbkdf2_hmac(
+            "sha256",
+            password.encode("utf-8"),
+            self.make_key(api_base_url, username).encode("utf-8"),
+            TokenCache.FINGERPRINT_ITERATIONS,
+        ).hex()
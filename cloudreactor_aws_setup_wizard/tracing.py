@@ -0,0 +1,415 @@
+import atexit
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional, TextIO, TypeVar
+
+from .file_utils import write_file_atomically
+
+# If set, spans are recorded and a summary table is printed at exit
+TIMING_ENV_VAR = "WIZARD_TIMING"
+# If set, spans are also written to this file at exit
+TIMING_EXPORT_ENV_VAR = "WIZARD_TIMING_EXPORT"
+TIMING_FORMAT_ENV_VAR = "WIZARD_TIMING_FORMAT"
+
+FORMAT_JSON_LINES = "jsonl"
+# The OTLP/JSON encoding of OpenTelemetry spans, as sent to a collector's
+# /v1/traces endpoint
+FORMAT_OTLP = "otlp"
+EXPORT_FORMATS = [FORMAT_JSON_LINES, FORMAT_OTLP]
+
+# Attributes that are added up in the summary
+ATTRIBUTE_RETRIES = "retries"
+ATTRIBUTE_BYTES_SENT = "bytes_sent"
+ATTRIBUTE_BYTES_RECEIVED = "bytes_received"
+
+# Only this many spans are kept for export, so long batch runs don't use
+# unbounded memory. The summary includes all spans.
+DEFAULT_MAX_EXPORTED_SPANS = 100000
+
+SERVICE_NAME = "cloudreactor-aws-setup-wizard"
+
+# OpenTelemetry span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_span_id: Optional[str]
+    # Seconds since the epoch
+    start_time: float
+    # Seconds
+    duration: float = 0.0
+    kind: int = SPAN_KIND_INTERNAL
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    started_at: float = 0.0
+
+
+class SpanStats(object):
+    def __init__(self) -> None:
+        self.durations: list[float] = []
+        self.error_count = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def add(self, span: Span) -> None:
+        self.durations.append(span.duration)
+
+        if span.error:
+            self.error_count += 1
+
+        attributes = span.attributes
+        self.retries += int(attributes.get(ATTRIBUTE_RETRIES) or 0)
+        self.bytes_sent += int(attributes.get(ATTRIBUTE_BYTES_SENT) or 0)
+        self.bytes_received += int(attributes.get(ATTRIBUTE_BYTES_RECEIVED) or 0)
+
+    def percentile(self, fraction: float) -> float:
+        durations = sorted(self.durations)
+        return durations[min(int(fraction * len(durations)), len(durations) - 1)]
+
+
+# Records timed spans of work, like AWS API calls, nested by thread. Spans
+# started while another span is open in the same thread are its children.
+# A disabled tracer records nothing, and costs a single attribute check per
+# span, so instrumented code paths can stay instrumented.
+class Tracer(object):
+    def __init__(
+        self,
+        enabled: bool = False,
+        export_filename: Optional[str] = None,
+        export_format: str = FORMAT_JSON_LINES,
+        max_exported_spans: int = DEFAULT_MAX_EXPORTED_SPANS,
+        clock: Callable[[], float] = time.perf_counter,
+        wall_clock: Callable[[], float] = time.time,
+    ) -> None:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown span export format '{export_format}'")
+
+        self.enabled = enabled
+        self.export_filename = export_filename
+        self.export_format = export_format
+        self.max_exported_spans = max_exported_spans
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.trace_id = os.urandom(16).hex()
+        self.name_to_stats: dict[str, SpanStats] = {}
+        self.spans: list[Span] = []
+        self.dropped_span_count = 0
+        self.closed = False
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[dict[str, Any]] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+    ) -> Span:
+        stack = self.get_stack()
+
+        span = Span(
+            name=name,
+            span_id=os.urandom(8).hex(),
+            parent_span_id=stack[-1].span_id if stack else None,
+            start_time=self.wall_clock(),
+            kind=kind,
+            attributes=attributes or {},
+            started_at=self.clock(),
+        )
+
+        stack.append(span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None) -> None:
+        span.duration = self.clock() - span.started_at
+
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+
+        stack = self.get_stack()
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] is span:
+                del stack[i]
+                break
+
+        with self.lock:
+            stats = self.name_to_stats.get(span.name)
+            if stats is None:
+                stats = SpanStats()
+                self.name_to_stats[span.name] = stats
+
+            stats.add(span)
+
+            if self.export_filename:
+                if len(self.spans) < self.max_exported_spans:
+                    self.spans.append(span)
+                else:
+                    self.dropped_span_count += 1
+
+    @contextlib.contextmanager
+    def span(
+        self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any
+    ) -> Iterator[Optional[Span]]:
+        if not self.enabled:
+            yield None
+            return
+
+        span = self.start_span(name, attributes, kind=kind)
+        try:
+            yield span
+        except BaseException as ex:
+            self.end_span(span, error=ex)
+            raise
+        else:
+            self.end_span(span)
+
+    def get_stack(self) -> list[Span]:
+        stack = getattr(self.local, "stack", None)
+
+        if stack is None:
+            stack = []
+            self.local.stack = stack
+
+        return stack
+
+    def format_summary(self) -> str:
+        header = [
+            "Span",
+            "Count",
+            "Errors",
+            "Total s",
+            "Mean ms",
+            "p95 ms",
+            "Max ms",
+            "Retries",
+            "Sent",
+            "Received",
+        ]
+        rows: list[list[Any]] = [header]
+
+        with self.lock:
+            name_to_stats = sorted(
+                self.name_to_stats.items(), key=lambda t: -sum(t[1].durations)
+            )
+
+            for name, stats in name_to_stats:
+                total = sum(stats.durations)
+                rows.append(
+                    [
+                        name,
+                        len(stats.durations),
+                        stats.error_count,
+                        f"{total:.2f}",
+                        f"{1000 * total / len(stats.durations):.1f}",
+                        f"{1000 * stats.percentile(0.95):.1f}",
+                        f"{1000 * max(stats.durations):.1f}",
+                        stats.retries,
+                        format_byte_count(stats.bytes_sent),
+                        format_byte_count(stats.bytes_received),
+                    ]
+                )
+
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+
+        # Numbers are right-aligned
+        return "\n".join(
+            "  ".join(
+                str(v).ljust(widths[i]) if i == 0 else str(v).rjust(widths[i])
+                for i, v in enumerate(row)
+            ).rstrip()
+            for row in rows
+        )
+
+    def print_summary(self, stream: TextIO = sys.stderr) -> None:
+        if not self.name_to_stats:
+            return
+
+        print(file=stream)
+        print("Time spent:", file=stream)
+        print(self.format_summary(), file=stream)
+        print(file=stream)
+
+    def export(self) -> None:
+        if not self.export_filename:
+            return
+
+        with self.lock:
+            spans = list(self.spans)
+
+        if self.dropped_span_count:
+            logging.warning(
+                f"Only exporting the first {len(spans)} spans, {self.dropped_span_count} were dropped"
+            )
+
+        if self.export_format == FORMAT_OTLP:
+            contents = json.dumps(self.to_otlp(spans)) + "\n"
+        else:
+            contents = "".join(
+                json.dumps(self.to_json_line(span), default=str) + "\n"
+                for span in spans
+            )
+
+        try:
+            write_file_atomically(self.export_filename, contents, fsync=False)
+        except OSError:
+            logging.warning(
+                f"Can't write spans to '{self.export_filename}'", exc_info=True
+            )
+
+    def close(self) -> None:
+        if self.closed or not self.enabled:
+            return
+
+        self.closed = True
+        self.export()
+        self.print_summary()
+
+    def to_json_line(self, span: Span) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_span_id,
+            "name": span.name,
+            "start_time": span.start_time,
+            "duration_ms": round(1000 * span.duration, 3),
+            "attributes": span.attributes,
+            "error": span.error,
+        }
+
+    def to_otlp(self, spans: list[Span]) -> dict[str, Any]:
+        otlp_spans: list[dict[str, Any]] = []
+
+        for span in spans:
+            start_nanos = int(span.start_time * 1e9)
+            otlp_span: dict[str, Any] = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": span.kind,
+                "startTimeUnixNano": str(start_nanos),
+                "endTimeUnixNano": str(start_nanos + int(span.duration * 1e9)),
+                "attributes": [
+                    {"key": key, "value": to_otlp_value(value)}
+                    for key, value in span.attributes.items()
+                    if value is not None
+                ],
+                "status": {"code": 1},
+            }
+
+            if span.parent_span_id:
+                otlp_span["parentSpanId"] = span.parent_span_id
+
+            if span.error:
+                otlp_span["status"] = {"code": 2, "message": span.error}
+
+            otlp_spans.append(otlp_span)
+
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": SERVICE_NAME},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": __package__}, "spans": otlp_spans}
+                    ],
+                }
+            ]
+        }
+
+
+def to_otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+
+    if isinstance(value, int):
+        # 64-bit integers are strings in OTLP/JSON
+        return {"intValue": str(value)}
+
+    if isinstance(value, float):
+        return {"doubleValue": value}
+
+    return {"stringValue": str(value)}
+
+
+def format_byte_count(byte_count: int) -> str:
+    if byte_count < 1024:
+        return f"{byte_count} B"
+
+    if byte_count < 1024 * 1024:
+        return f"{byte_count / 1024:.1f} KiB"
+
+    return f"{byte_count / (1024 * 1024):.1f} MiB"
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+# Replaces the tracer used by the whole process. Spans are exported and the
+# summary is printed when the process exits.
+def configure_tracing(
+    enabled: bool = False,
+    export_filename: Optional[str] = None,
+    export_format: Optional[str] = None,
+) -> Tracer:
+    global _tracer
+
+    enabled = enabled or bool(os.environ.get(TIMING_ENV_VAR))
+    export_filename = export_filename or os.environ.get(TIMING_EXPORT_ENV_VAR)
+    export_format = (
+        export_format or os.environ.get(TIMING_FORMAT_ENV_VAR) or FORMAT_JSON_LINES
+    )
+
+    atexit.unregister(_tracer.close)
+
+    _tracer = Tracer(
+        enabled=enabled or bool(export_filename),
+        export_filename=export_filename,
+        export_format=export_format,
+    )
+
+    atexit.register(_tracer.close)
+    return _tracer
+
+
+# Records a span for each call of the decorated function, named after the
+# function unless a name is given
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    def decorator(f: F) -> F:
+        span_name = name or f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            tracer = _tracer
+
+            if not tracer.enabled:
+                return f(*args, **kwargs)
+
+            with tracer.span(span_name):
+                return f(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
@@ -1,22 +1,53 @@
+import difflib
 import logging
 import os
 import random
 import re
 import string
-import time
+import threading
 import urllib.parse
 from datetime import datetime
-from typing import Any, Optional, Tuple, cast
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, Tuple, cast
 
-import boto3
-import jsonpickle
 import questionary
-import yaml
-from botocore.exceptions import ClientError
-from jinja2 import Environment, PackageLoader
+import urllib3
 from questionary import Choice
 
-from .cloudreactor_api_client import CloudReactorApiClient
+from .aws_calls import AwsCallPolicy
+from .aws_listing import PagedListing
+from .cidr_allocator import (
+    DEFAULT_PREFIX_LENGTH,
+    CidrIndex,
+    split_vpc_cidr,
+    to_network,
+)
+from .cloudreactor_api_client import CloudReactorApiClient, make_pool_manager
+from .deployment_scheduler import DeploymentScheduler
+from .discovery import AwsDiscovery
+from .discovery_cache import DiscoveryCache
+from .stack_index import StackIndex, StackSummary, find_stack
+from .stack_progress import StackProgressTracker, StatusLine
+from .stack_updates import (
+    UPDATE_CANCELLED,
+    UPDATE_UNCHANGED,
+    StackUpdater,
+    StackUpdateResult,
+    make_template_hash,
+    make_template_hash_entry,
+)
+from .stack_waiter import CLOUDFORMATION_SUCCESSFUL_STATUSES, StackWaiter
+from .state_store import StateStore
+from .template_registry import render_vpc_template
+from .template_store import TemplateStore
+from .template_validation import TemplateValidationError, validate_template
+from .token_cache import TokenCache
+from .tracing import traced
+from .wizard_state import WizardState
+
+# boto3, jinja2 and yaml are imported when first used, since importing them
+# takes a large part of the startup time
+if TYPE_CHECKING:
+    import boto3
 
 SAVED_STATE_DIRECTORY = "./saved_state"
 SAVED_STATE_FILENAME = SAVED_STATE_DIRECTORY + "/saved_settings.json"
@@ -65,17 +96,9 @@ DEPLOYMENT_ENVIRONMENT_REGEX = re.compile(r"[a-zA-Z0-9]{1,255}")
 KEY_LENGTH = 32
 
 CLOUDFORMATION_STACK_NAME_REGEX = re.compile(r"[a-zA-Z][-a-zA-Z0-9]{0,127}")
-CLOUDFORMATION_IN_PROGRESS_STATUSES = set(
-    [
-        "CREATE_IN_PROGRESS",
-        "UPDATE_IN_PROGRESS",
-        "UPDATE_COMPLETE_CLEANUP_IN_PROGRESS",
-        "IMPORT_IN_PROGRESS",
-    ]
-)
-CLOUDFORMATION_SUCCESSFUL_STATUSES = set(
-    ["CREATE_COMPLETE", "UPDATE_COMPLETE", "IMPORT_COMPLETE"]
-)
+
+VPC_STACK_DEPLOYMENT = "vpc_stack"
+ROLE_STACK_DEPLOYMENT = "role_stack"
 
 
 class Wizard(object):
@@ -99,9 +122,19 @@ class Wizard(object):
         self,
         api_base_url: Optional[str] = None,
         cloudreactor_deployment_environment: Optional[str] = None,
+        max_list_pages: Optional[int] = None,
+        interactive: bool = True,
+        state_filename: Optional[str] = SAVED_STATE_FILENAME,
+        boto_session_factory: Optional[
+            Callable[[Optional[str]], "boto3.Session"]
+        ] = None,
+        aws_call_policy: Optional[AwsCallPolicy] = None,
     ) -> None:
         self.api_base_url = api_base_url
         self.cloudreactor_deployment_environment = cloudreactor_deployment_environment
+        self.max_list_pages = max_list_pages
+        # If False, nothing is asked, and steps that would need an answer fail
+        self.interactive = interactive
         self.aws_region: Optional[str] = None
         self.aws_access_key: Optional[str] = None
         self.aws_secret_key: Optional[str] = None
@@ -129,12 +162,48 @@ class Wizard(object):
         self.stack_upload_status_reason: Optional[str] = None
         self.saved_run_environment_uuid: Optional[str] = None
         self.saved_run_environment_name: Optional[str] = None
+        # Hashes of the templates and parameters last applied to each stack
+        self.stack_template_hashes: Optional[dict[str, dict[str, Optional[str]]]] = None
+        # Hashes of stack updates that haven't finished yet, with the hash of
+        # the template in the template store, and stacks found to be up to
+        # date that don't need to be waited for, by stack ID
+        self.pending_template_hashes: dict[str, Tuple[str, Optional[str]]] = {}
+        self.up_to_date_stacks: dict[str, dict[str, Any]] = {}
+        self.template_hashes_lock = threading.Lock()
         self.cloudreactor_credentials: Optional[Tuple[str, str]] = None
         self.cloudreactor_api_client: Optional[CloudReactorApiClient] = None
+        # Shared by all API clients, so connections are reused
+        self.cloudreactor_http: Optional[urllib3.PoolManager] = None
         self.cloudreactor_group: Optional[Tuple[int, str]] = None
+        self.boto_session: Optional["boto3.Session"] = None
+        self.boto_session_key: Optional[Tuple[Optional[str], Optional[str]]] = None
+        self.boto_clients: dict[str, Any] = {}
+        # If set, makes the boto3 Session for a region instead of the access key
+        self.boto_session_factory = boto_session_factory
+        # Retries, rate limits and metrics for every AWS API call
+        self.aws_call_policy = aws_call_policy or AwsCallPolicy()
+        self.aws_discoveries: dict[str, AwsDiscovery] = {}
+        # Installs stacks while the interview continues
+        self.deployment_scheduler = DeploymentScheduler()
+        # Bumped when the settings a deployment was started for are cleared,
+        # so the results of the old deployment are dropped
+        self.deployment_generations: dict[str, int] = {}
+        self.deployment_lock = threading.RLock()
+        self.stack_progress = StackProgressTracker()
+        # If no filename is given, the state is not saved
+        self.state_store: Optional[StateStore] = None
+        if state_filename:
+            self.state_store = StateStore(state_filename, self.encode_saved_state)
+
+        # Like the saved state, so nothing is left behind in batch mode
+        self.template_store: Optional[TemplateStore] = None
+        if self.state_store:
+            self.template_store = TemplateStore(SAVED_STATE_DIRECTORY)
 
         self.mode = Wizard.MODE_INTERVIEW
 
+        import yaml
+
         with open("wizard_config.yml") as f:
             config_dict = yaml.safe_load(f)
             self.role_template_major_version = config_dict[
@@ -145,6 +214,12 @@ class Wizard(object):
             f"Role template major version = {self.role_template_major_version}"
         )
 
+    def encode_saved_state(self) -> str:
+        return WizardState.capture(self).encode()
+
+    def restore_saved_state(self, state: WizardState) -> None:
+        state.apply_to(self)
+
     def reset(self) -> None:
         self.aws_region = None
         self.aws_access_key = None
@@ -160,7 +235,13 @@ class Wizard(object):
         self.mode = Wizard.MODE_INTERVIEW
         self.clear_aws_state()
 
-    def clear_aws_state(self) -> None:
+    def clear_aws_state(self, keep_discovery: bool = False) -> None:
+        self.abandon_deployment(VPC_STACK_DEPLOYMENT)
+
+        if not keep_discovery:
+            self.stop_aws_discovery()
+
+        self.clear_boto_clients()
         self.aws_account_id = None
         self.available_cluster_arns = None
         self.cluster_arn = None
@@ -172,6 +253,7 @@ class Wizard(object):
         self.clear_stack_upload_state()
 
     def clear_stack_upload_state(self) -> None:
+        self.abandon_deployment(ROLE_STACK_DEPLOYMENT)
         self.stack_name = None
         self.stack_id_to_update = None
         self.uploaded_stack_id = None
@@ -191,9 +273,11 @@ class Wizard(object):
         self,
         api_base_url: Optional[str] = None,
         cloudreactor_deployment_environment: Optional[str] = None,
+        max_list_pages: Optional[int] = None,
     ) -> None:
         self.api_base_url = api_base_url
         self.cloudreactor_deployment_environment = cloudreactor_deployment_environment
+        self.max_list_pages = max_list_pages
 
     def print_menu(self) -> None:
         for choice in self.make_property_choices():
@@ -232,6 +316,8 @@ class Wizard(object):
                 elif attr == "cloudreactor_group":
                     v = v[1]  # Group name
 
+            elif self.deployment_scheduler.is_property_pending(attr):
+                v = "(VPC stack is being installed)"
             elif attr in ["subnets", "security_groups"]:
                 v = self.list_to_string(v)
 
@@ -239,14 +325,22 @@ class Wizard(object):
         return choices
 
     def run(self) -> None:
+        if self.aws_account_id:
+            # Serve cached lists right away and refresh stale ones
+            self.start_aws_discovery()
+
+        if self.uploaded_stack_id and not self.stack_upload_finished_at:
+            # Keep watching the stack a previous run started
+            self.start_role_stack_deployment()
+
         finished = False
         first_run = True
         while not finished:
             rv = None
             if self.saved_run_environment_uuid:
                 rv = self.handle_run_environment_saved()
-            elif self.uploaded_stack_id and not self.stack_upload_finished_at:
-                rv = self.wait_for_role_stack_upload()
+            else:
+                self.handle_finished_deployments()
 
             if rv is None:
                 is_mode_interview = self.mode == Wizard.MODE_INTERVIEW
@@ -285,11 +379,18 @@ class Wizard(object):
             n = i + 1
             arr = Wizard.NUMBER_TO_PROPERTY[str(n)]
 
-            if self.__dict__[arr[0]] is None:
+            self.handle_finished_deployments()
+
+            if (self.__dict__[arr[0]] is None) and (
+                not self.deployment_scheduler.is_property_pending(arr[0])
+            ):
                 rv = self.edit_property(n)
                 if rv is None:
                     return None
 
+        if not self.wait_for_deployments():
+            return None
+
         # CHECKME
         if self.are_all_properties_set():
             self.handle_all_settings_entered()
@@ -308,6 +409,12 @@ class Wizard(object):
         return None
 
     def edit(self):
+        self.handle_finished_deployments()
+
+        status_line = self.stack_progress.format_status_line()
+        if status_line:
+            print(status_line + "\n")
+
         choices = self.make_property_choices()
 
         n = len(choices)
@@ -412,7 +519,9 @@ to access are located.
         print(f"Using AWS region {self.aws_region}.\n")
 
         if old_aws_region != self.aws_region:
-            self.clear_aws_state()
+            # Discovery results are kept per region, so switching back to a
+            # region doesn't need to list everything again
+            self.clear_aws_state(keep_discovery=True)
 
         self.save()
         return self.aws_region
@@ -602,6 +711,12 @@ The access key and secret key are not sent to CloudReactor.
             )
             return None
 
+        if self.deployment_scheduler.is_running(ROLE_STACK_DEPLOYMENT):
+            print(
+                "The CloudFormation stack is still being installed. Please wait for it to finish before installing another one.\n"
+            )
+            return None
+
         print(
             "To allow CloudReactor to run tasks on your behalf, you'll need to install an AWS CloudFormation stack that grants CloudReactor permissions to do so."
         )
@@ -648,15 +763,23 @@ The access key and secret key are not sent to CloudReactor.
                 return None
 
         if self.uploaded_stack_id and not self.stack_upload_finished_at:
-            rv = self.wait_for_role_stack_upload(cf_client=cf_client)
+            # Nothing after this depends on the stack until the Run
+            # Environment is saved, so the remaining questions can be
+            # answered while it is installed
+            self.start_role_stack_deployment(cf_client=cf_client)
+            print(
+                "The CloudFormation stack is being installed. You can continue while it finishes.\n"
+            )
 
-            if rv:
-                print("The CloudFormation stack installation was successful.")
-                return rv
+        return self.uploaded_stack_id
 
-            return None
-        else:
-            return self.uploaded_stack_id
+    def start_role_stack_deployment(self, cf_client=None) -> None:
+        self.start_stack_deployment(
+            ROLE_STACK_DEPLOYMENT,
+            f"Role stack '{self.stack_name}'",
+            self.wait_for_role_stack_upload,
+            cf_client=cf_client,
+        )
 
     def ask_for_stack_name(
         self,
@@ -675,11 +798,10 @@ The access key and secret key are not sent to CloudReactor.
             )
             return None
 
-        existing_stacks = self.list_stacks(cf_client=cf_client)
-        existing_stack_names = [stack["name"] for stack in (existing_stacks or [])]
+        stack_index = self.list_stacks(cf_client=cf_client)
 
         should_create = True
-        if len(existing_stack_names) > 0:
+        if stack_index:
             print()
 
             if create_or_update_message:
@@ -713,7 +835,7 @@ The access key and secret key are not sent to CloudReactor.
                     print(f"Reusing previously installed stack '{stack_name}'.")
                     good_stack_name = stack_name
                     reuse_stack = True
-                elif stack_name in existing_stack_names:
+                elif self.does_stack_exist(stack_name, stack_index, cf_client):
                     print(
                         f"The name '{stack_name}' conflicts with an existing stack name. Please choose another name."
                     )
@@ -727,24 +849,22 @@ The access key and secret key are not sent to CloudReactor.
 
             return stack_name, None, reuse_stack
         else:
+            stack_index = cast(StackIndex, stack_index)
             stack_name = questionary.select(
                 "Which CloudFormation stack do you want to update and use?",
-                choices=existing_stack_names,
+                choices=stack_index.names(),
             ).ask()
 
             if stack_name is None:
                 return None
 
-            selected_stack = None
-            for stack in existing_stacks:
-                if stack.get("name") == stack_name:
-                    selected_stack = stack
+            selected_stack = stack_index.get(stack_name)
 
             if selected_stack is None:
                 logging.error(f"Can't find existing stack '{stack_name}'!")
                 return None
 
-            existing_stack_status = selected_stack.get("status") or ""
+            existing_stack_status = selected_stack.status
 
             if existing_stack_status.find("PROGRESS") >= 0:
                 print(
@@ -753,7 +873,29 @@ The access key and secret key are not sent to CloudReactor.
                 self.uploaded_stack_id = None
                 return None
 
-            return stack_name, selected_stack["stack_id"], False
+            return stack_name, selected_stack.stack_id, False
+
+    def does_stack_exist(
+        self, stack_name: str, stack_index: Optional[StackIndex], cf_client
+    ) -> bool:
+        if stack_index is not None:
+            if stack_name in stack_index:
+                return True
+
+            if (not stack_index.truncated) and (
+                not self.get_aws_discovery().is_stale(AwsDiscovery.STACKS)
+            ):
+                return False
+
+        # Without a recent, complete listing, check the single name with
+        # CloudFormation
+        try:
+            return find_stack(cf_client, stack_name) is not None
+        except Exception:
+            logging.warning(
+                f"Can't check if stack '{stack_name}' exists", exc_info=True
+            )
+            return False
 
     def make_default_role_stack_name(self) -> str:
         name = "CloudReactor"
@@ -768,14 +910,10 @@ The access key and secret key are not sent to CloudReactor.
 
         return name
 
+    @traced()
     def save(self) -> None:
-        old_client = self.cloudreactor_api_client
-        self.cloudreactor_api_client = None
-
-        with open(SAVED_STATE_FILENAME, "w") as f:
-            f.write(jsonpickle.encode(self))
-
-        self.cloudreactor_api_client = old_client
+        if self.state_store:
+            self.state_store.request_save()
 
     def validate_aws_access(self) -> Optional[str]:
         sts = None
@@ -797,6 +935,7 @@ The access key and secret key are not sent to CloudReactor.
             print(
                 f"Your AWS credentials for AWS account {self.aws_account_id} are valid.\n"
             )
+            self.start_aws_discovery()
         except Exception:
             logging.warning("Failed to get caller identity from AWS", exc_info=True)
             print(
@@ -826,13 +965,12 @@ The access key and secret key are not sent to CloudReactor.
             )
             return None
 
-        self.available_cluster_arns = None
-        try:
-            resp = ecs_client.list_clusters(maxResults=100)
-            self.available_cluster_arns = resp["clusterArns"]
+        self.available_cluster_arns = self.get_aws_discovery().get(
+            AwsDiscovery.CLUSTER_ARNS, lambda: self.fetch_cluster_arns(ecs_client)
+        )
+
+        if self.available_cluster_arns is not None:
             self.save()
-        except ClientError:
-            logging.warning("Can't list clusters", exc_info=True)
 
         if (self.available_cluster_arns is None) or (
             len(self.available_cluster_arns) == 0
@@ -848,11 +986,27 @@ The access key and secret key are not sent to CloudReactor.
             self.save()
             return None
 
-        choices = self.available_cluster_arns + [CREATE_NEW_ECS_CLUSTER_CHOICE]
+        while True:
+            choices = self.available_cluster_arns + [CREATE_NEW_ECS_CLUSTER_CHOICE]
 
-        selection = questionary.select(
-            "Which ECS cluster do you want to use to run your tasks?", choices=choices
-        ).ask()
+            refresh_choice = self.make_discovery_refresh_choice(
+                AwsDiscovery.CLUSTER_ARNS, "ECS clusters"
+            )
+            if refresh_choice:
+                choices.append(refresh_choice)
+
+            selection = questionary.select(
+                "Which ECS cluster do you want to use to run your tasks?",
+                choices=choices,
+            ).ask()
+
+            if (selection is None) or (selection != refresh_choice):
+                break
+
+            self.available_cluster_arns = (
+                self.get_aws_discovery().refresh(AwsDiscovery.CLUSTER_ARNS) or []
+            )
+            self.save()
 
         if selection == CREATE_NEW_ECS_CLUSTER_CHOICE:
             return self.create_cluster(ecs_client)
@@ -887,7 +1041,9 @@ The access key and secret key are not sent to CloudReactor.
         self.save()
         return self.cluster_arn
 
-    def create_cluster(self, ecs_client=None) -> Optional[str]:
+    def create_cluster(
+        self, ecs_client=None, cluster_name: Optional[str] = None
+    ) -> Optional[str]:
         if ecs_client is None:
             ecs_client = self.make_boto_client("ecs")
 
@@ -895,7 +1051,13 @@ The access key and secret key are not sent to CloudReactor.
             print("You must set your AWS credentials before creating an ECS cluster.\n")
             return None
 
-        good_cluster_name = False
+        if cluster_name and (ECS_CLUSTER_NAME_REGEX.fullmatch(cluster_name) is None):
+            print(
+                f"'{cluster_name}' is not a valid ECS cluster name. cluster names can only contain alphanumeric characters and hyphens, no underscores."
+            )
+            return None
+
+        good_cluster_name = bool(cluster_name)
         while not good_cluster_name:
             cluster_name = questionary.text(
                 "What do you want to name the ECS cluster?"
@@ -924,6 +1086,9 @@ The access key and secret key are not sent to CloudReactor.
             self.available_cluster_arns = [self.cluster_arn] + (
                 self.available_cluster_arns or []
             )
+            self.get_aws_discovery().put(
+                AwsDiscovery.CLUSTER_ARNS, self.available_cluster_arns
+            )
 
             print(
                 f"Successfully created ECS cluster {self.cluster_arn} in region {self.aws_region}.\n"
@@ -953,14 +1118,15 @@ The access key and secret key are not sent to CloudReactor.
         self.stack_upload_started_at = datetime.now()
 
         try:
-            resp = None
             if self.stack_id_to_update:
                 logging.debug(f"{self.deployment_environment=}")
 
-                resp = cf_client.update_stack(
-                    StackName=self.stack_id_to_update,
-                    TemplateURL=template_url,
-                    Parameters=[
+                result = self.update_stack_with_change_set(
+                    self.stack_id_to_update,
+                    cast(str, self.stack_name),
+                    cf_client,
+                    template_url=template_url,
+                    parameters=[
                         {
                             "ParameterKey": "DeploymentEnvironment",
                             "ParameterValue": self.deployment_environment,
@@ -980,8 +1146,16 @@ The access key and secret key are not sent to CloudReactor.
                             "UsePreviousValue": True,
                         },
                     ],
-                    Capabilities=["CAPABILITY_NAMED_IAM"],
+                    capabilities=["CAPABILITY_NAMED_IAM"],
                 )
+
+                if result.status == UPDATE_CANCELLED:
+                    return None
+
+                self.uploaded_stack_id = result.stack_id
+
+                if result.status == UPDATE_UNCHANGED:
+                    return self.uploaded_stack_id
             else:
                 self.external_id = self.generate_random_key()
                 self.workflow_starter_access_key = self.generate_random_key()
@@ -1013,32 +1187,29 @@ The access key and secret key are not sent to CloudReactor.
                     ],
                     Capabilities=["CAPABILITY_NAMED_IAM"],
                 )
-
-            self.uploaded_stack_id = resp["StackId"]
-        except Exception as ex:
-            ex_str = str(ex)
-            if self.stack_id_to_update and (
-                ex_str.find("No updates are to be performed") >= 0
-            ):
-                print(
-                    f"No stack updates were necessary. Using existing stack name '{self.stack_name}'.\n"
+                self.uploaded_stack_id = resp["StackId"]
+
+            self.add_to_stack_index(
+                StackSummary(
+                    name=cast(str, self.stack_name),
+                    stack_id=self.uploaded_stack_id,
+                    status="UPDATE_IN_PROGRESS"
+                    if self.stack_id_to_update
+                    else "CREATE_IN_PROGRESS",
                 )
-                self.uploaded_stack_id = self.stack_id_to_update
-                return self.uploaded_stack_id
-            else:
-                logging.warning("Failed to install stack", exc_info=True)
-                print(f"Failed to install stack: {ex}\n")
+            )
+        except Exception as ex:
+            logging.warning("Failed to install stack", exc_info=True)
+            print(f"Failed to install stack: {ex}\n")
 
-                if ex_str.find("AlreadyExistsException") >= 0:
-                    rv = questionary.confirm(
-                        "That stack already exists. Delete it?"
-                    ).ask()
+            if self.interactive and (str(ex).find("AlreadyExistsException") >= 0):
+                rv = questionary.confirm("That stack already exists. Delete it?").ask()
 
-                    if rv:
-                        self.delete_role_stack(cf_client)
+                if rv:
+                    self.delete_role_stack(cf_client)
 
-                self.clear_stack_upload_state()
-                return None
+            self.clear_stack_upload_state()
+            return None
 
         self.save()
 
@@ -1047,7 +1218,12 @@ The access key and secret key are not sent to CloudReactor.
         )
         return self.uploaded_stack_id
 
-    def wait_for_role_stack_upload(self, cf_client=None):
+    def wait_for_role_stack_upload(
+        self,
+        cf_client=None,
+        report: Callable[[str], None] = print,
+        generation: Optional[int] = None,
+    ):
         if not self.uploaded_stack_id:
             logging.error(
                 "wait_for_role_stack_upload() called but, but no stack ID was saved."
@@ -1058,76 +1234,90 @@ The access key and secret key are not sent to CloudReactor.
             cf_client = self.make_boto_client("cloudformation")
 
         if not cf_client:
-            print(
+            report(
                 "Your AWS credentials are invalid. Please check them and try again.\n"
             )
             return None
 
         stack = self.wait_for_stack_upload(
-            self.uploaded_stack_id, self.stack_name, cf_client
+            self.uploaded_stack_id, cast(str, self.stack_name), cf_client, report=report
         )
 
         if stack is None:
             return None
 
-        self.stack_upload_finished_at = datetime.now()
-        self.stack_upload_status = stack["StackStatus"]
-
-        if self.stack_upload_status in CLOUDFORMATION_SUCCESSFUL_STATUSES:
-            outputs = stack["Outputs"] or []
-
-            for output in outputs:
-                output_key = output["OutputKey"]
-                output_value = output["OutputValue"]
-                if output_key == "CloudreactorRoleARN":
-                    self.assumable_role_arn = output_value
-                elif output_key == "TaskExecutionRoleARN":
-                    self.task_execution_role_arn = output_value
-                elif output_key == "WorkflowStarterARN":
-                    self.workflow_starter_arn = output_value
-                else:
-                    logging.warning(
-                        f"Got unknown output '{output_key}' with value '{output_value}'."
-                    )
-
-            params = stack["Parameters"] or []
-
-            for param in params:
-                param_key = param["ParameterKey"]
-                param_value = param["ParameterValue"]
+        with self.deployment_lock:
+            if not self.is_deployment_current(ROLE_STACK_DEPLOYMENT, generation):
+                logging.info("Ignoring the result of an abandoned role stack")
+                return None
 
-                if param_key == "ExternalID":
-                    self.external_id = param_value
-                elif param_key == "WorkflowStarterAccessKey":
-                    self.workflow_starter_access_key = param_value
+            self.stack_upload_finished_at = datetime.now()
+            self.stack_upload_status = stack["StackStatus"]
+
+            if self.stack_upload_status in CLOUDFORMATION_SUCCESSFUL_STATUSES:
+                outputs = stack["Outputs"] or []
+
+                for output in outputs:
+                    output_key = output["OutputKey"]
+                    output_value = output["OutputValue"]
+                    if output_key == "CloudreactorRoleARN":
+                        self.assumable_role_arn = output_value
+                    elif output_key == "TaskExecutionRoleARN":
+                        self.task_execution_role_arn = output_value
+                    elif output_key == "WorkflowStarterARN":
+                        self.workflow_starter_arn = output_value
+                    else:
+                        logging.warning(
+                            f"Got unknown output '{output_key}' with value '{output_value}'."
+                        )
+
+                params = stack["Parameters"] or []
+
+                for param in params:
+                    param_key = param["ParameterKey"]
+                    param_value = param["ParameterValue"]
+
+                    if param_key == "ExternalID":
+                        self.external_id = param_value
+                    elif param_key == "WorkflowStarterAccessKey":
+                        self.workflow_starter_access_key = param_value
+
+                if (
+                    self.external_id
+                    and self.workflow_starter_access_key
+                    and self.assumable_role_arn
+                    and self.task_execution_role_arn
+                    and self.workflow_starter_arn
+                ):
+                    self.stack_upload_succeeded = True
+                    self.save()
+                    return True
 
-            if (
-                self.external_id
-                and self.workflow_starter_access_key
-                and self.assumable_role_arn
-                and self.task_execution_role_arn
-                and self.workflow_starter_arn
-            ):
-                self.stack_upload_succeeded = True
+                report(
+                    "Something was missing from the stack output. "
+                    + HELP_MESSAGE
+                    + "\n"
+                )
+                self.stack_upload_succeeded = False
+                self.save()
+                return None
+            else:
+                self.stack_upload_status_reason = stack.get("StackStatusReason")
+                self.stack_upload_succeeded = False
                 self.save()
-                return True
-
-            print("Something was missing from the stack output. " + HELP_MESSAGE + "\n")
-            self.stack_upload_succeeded = False
-            self.save()
-            return None
-        else:
-            self.stack_upload_status_reason = stack.get("StackStatusReason")
-            self.stack_upload_succeeded = False
-            self.save()
 
-            print(
-                f"The CloudReactor permissions stack upload failed with status '{self.stack_upload_status}' and status reason '{self.stack_upload_status_reason}'."
-            )
-            return None
+                report(
+                    f"The CloudReactor permissions stack upload failed with status '{self.stack_upload_status}' and status reason '{self.stack_upload_status_reason}'."
+                )
+                return None
 
     def wait_for_vpc_stack_upload(
-        self, vpc_stack_id: str, vpc_stack_name: str, cf_client
+        self,
+        vpc_stack_id: str,
+        vpc_stack_name: str,
+        cf_client,
+        report: Callable[[str], None] = print,
+        generation: Optional[int] = None,
     ):
         if not vpc_stack_id:
             logging.error(
@@ -1135,86 +1325,195 @@ The access key and secret key are not sent to CloudReactor.
             )
             return False
 
-        stack = self.wait_for_stack_upload(vpc_stack_id, vpc_stack_name, cf_client)
+        stack = self.wait_for_stack_upload(
+            vpc_stack_id, vpc_stack_name, cf_client, report=report
+        )
 
         if stack is None:
             return None
 
-        stack_upload_status = stack["StackStatus"]
+        with self.deployment_lock:
+            if not self.is_deployment_current(VPC_STACK_DEPLOYMENT, generation):
+                logging.info("Ignoring the result of an abandoned VPC stack")
+                return None
 
-        if stack_upload_status in CLOUDFORMATION_SUCCESSFUL_STATUSES:
-            outputs = stack["Outputs"] or []
-            self.subnets = []
-            # TODO add security groups
-
-            for output in outputs:
-                output_key = output["OutputKey"]
-                output_value = output["OutputValue"]
-                if output_key == "VPC":
-                    self.vpc_id = output_value
-                    self.vpc_name = None
-                    logging.debug(f"Got VPC {self.vpc_id} from stack output")
-                elif output_key == "SubnetsPrivate":
-                    self.subnets = output_value.split(",")
-                    logging.debug(f"Got subnets {self.subnets} from stack output")
-                elif output_key == "DefaultTaskSecurityGroup":
-                    logging.debug(
-                        f"Got security group {output_value} from stack output"
-                    )
-                    self.security_groups = [output_value]
-                else:
-                    logging.debug(
-                        f"Got output '{output_key}' with value '{output_value}'."
-                    )
+            stack_upload_status = stack["StackStatus"]
+
+            if stack_upload_status in CLOUDFORMATION_SUCCESSFUL_STATUSES:
+                outputs = stack["Outputs"] or []
+                self.subnets = []
+                # TODO add security groups
+
+                for output in outputs:
+                    output_key = output["OutputKey"]
+                    output_value = output["OutputValue"]
+                    if output_key == "VPC":
+                        self.vpc_id = output_value
+                        self.vpc_name = None
+                        logging.debug(f"Got VPC {self.vpc_id} from stack output")
+                    elif output_key == "SubnetsPrivate":
+                        self.subnets = output_value.split(",")
+                        logging.debug(f"Got subnets {self.subnets} from stack output")
+                    elif output_key == "DefaultTaskSecurityGroup":
+                        logging.debug(
+                            f"Got security group {output_value} from stack output"
+                        )
+                        self.security_groups = [output_value]
+                    else:
+                        logging.debug(
+                            f"Got output '{output_key}' with value '{output_value}'."
+                        )
 
-            if self.vpc_id and self.subnets and self.security_groups:
-                self.was_vpc_created_by_wizard = True
-                self.save()
-                return self.vpc_id
+                if self.vpc_id and self.subnets and self.security_groups:
+                    self.was_vpc_created_by_wizard = True
+                    self.save()
+                    return self.vpc_id
 
-            print("Something was missing from the stack output. " + HELP_MESSAGE + "\n")
-            return None
-        else:
-            stack_upload_status_reason = stack["StackStatusReason"]
+                report(
+                    "Something was missing from the stack output. "
+                    + HELP_MESSAGE
+                    + "\n"
+                )
+                return None
+            else:
+                stack_upload_status_reason = stack["StackStatusReason"]
+                report(
+                    f"The VPC stack upload failed with status '{stack_upload_status}' and status reason '{stack_upload_status_reason}'."
+                )
+                return None
+
+    @traced()
+    def wait_for_stack_upload(
+        self,
+        stack_id: str,
+        stack_name: str,
+        cf_client,
+        report: Callable[[str], None] = print,
+    ) -> Optional[dict[str, Any]]:
+        with self.template_hashes_lock:
+            stack = self.up_to_date_stacks.pop(stack_id, None)
+
+        if stack is None:
+            waiter = StackWaiter(
+                cf_client=cf_client,
+                refresh_client=lambda: self.make_boto_client(
+                    "cloudformation", refresh=True
+                ),
+                report=report,
+            )
+            stack = waiter.wait(stack_id=stack_id, stack_name=stack_name)
+
+        if stack is not None:
+            self.save_template_hash(stack_id, stack)
+
+        return stack
+
+    # Updates a stack through a change set, showing the changes first. In
+    # interactive mode, the changes must be confirmed.
+    def update_stack_with_change_set(
+        self, stack_id: str, stack_name: str, cf_client, **kwargs: Any
+    ) -> StackUpdateResult:
+        def confirm_changes(changes: list[dict[str, Any]]) -> bool:
+            return bool(
+                questionary.confirm(
+                    f"Do you want to apply these changes to stack '{stack_name}'?"
+                ).ask()
+            )
+
+        confirm: Optional[Callable[[list[dict[str, Any]]], bool]] = None
+        if self.interactive:
+            confirm = confirm_changes
+
+        with self.template_hashes_lock:
+            template_hashes = dict(self.stack_template_hashes or {})
+
+        template_body_hash: Optional[str] = None
+        template_body = kwargs.get("template_body")
+        if template_body is not None:
+            template_body_hash = self.store_template(template_body)
+            self.print_template_diff(
+                (template_hashes.get(stack_id) or {}).get("template_body_hash"),
+                template_body,
+            )
+
+        updater = StackUpdater(
+            cf_client, template_hashes=template_hashes, confirm=confirm
+        )
+        result = updater.update(stack_id, **kwargs)
+
+        if result.status == UPDATE_CANCELLED:
+            print(f"Not updating stack '{stack_name}'.\n")
+            return result
+
+        with self.template_hashes_lock:
+            self.pending_template_hashes[result.stack_id] = (
+                result.template_hash,
+                template_body_hash,
+            )
+
+            if result.stack is not None:
+                self.up_to_date_stacks[result.stack_id] = result.stack
+
+        if result.status == UPDATE_UNCHANGED:
             print(
-                f"The VPC stack upload failed with status '{stack_upload_status}' and status reason '{stack_upload_status_reason}'."
+                f"No stack updates were necessary. Using existing stack name '{stack_name}'.\n"
             )
+
+        return result
+
+    def save_template_hash(self, stack_id: str, stack: dict[str, Any]) -> None:
+        with self.template_hashes_lock:
+            pending = self.pending_template_hashes.pop(stack_id, None)
+
+            if (pending is None) or (
+                stack["StackStatus"] not in CLOUDFORMATION_SUCCESSFUL_STATUSES
+            ):
+                return
+
+            # Replaced instead of changed, since the state may be being
+            # encoded in another thread
+            self.stack_template_hashes = {
+                **(self.stack_template_hashes or {}),
+                stack_id: make_template_hash_entry(pending[0], stack, pending[1]),
+            }
+
+        self.save()
+
+    def is_stack_up_to_date(self, stack_id: str) -> bool:
+        with self.template_hashes_lock:
+            return stack_id in self.up_to_date_stacks
+
+    def store_template(self, template_body: str) -> Optional[str]:
+        if self.template_store is None:
             return None
 
-    def wait_for_stack_upload(
-        self, stack_id: str, stack_name: str, cf_client
-    ) -> Optional[dict[str, Any]]:
-        while True:
-            resp = None
-            try:
-                resp = cf_client.describe_stacks(StackName=stack_id)
-            except Exception:
-                logging.warning(
-                    "Can't describe CloudFormation stacks, re-creating client ...",
-                    exc_info=True,
-                )
-                time.sleep(10)
-                cf_client = self.make_boto_client("cloudformation")
+        return self.template_store.put(template_body)
 
-            if resp:
-                stacks = resp["Stacks"]
+    # Shows how many lines of the template changed since it was last
+    # installed by the wizard, if that template was stored
+    def print_template_diff(
+        self, old_template_body_hash: Optional[str], template_body: str
+    ) -> None:
+        if (self.template_store is None) or (old_template_body_hash is None):
+            return
 
-                if len(stacks) == 0:
-                    print(
-                        f"CloudFormation stack '{stack_name}' was deleted, please check your settings and try again.\n"
-                    )
-                    return None
+        old_template_body = self.template_store.get(old_template_body_hash)
 
-                stack = stacks[0]
-                status = stack["StackStatus"]
+        if (old_template_body is None) or (old_template_body == template_body):
+            return
 
-                if status in CLOUDFORMATION_IN_PROGRESS_STATUSES:
-                    print(
-                        f"CloudFormation stack installation is still in progress ({status}). Waiting 10 seconds before checking again ..."
-                    )
-                    time.sleep(10)
-                else:
-                    return stack
+        added = removed = 0
+        for line in difflib.unified_diff(
+            old_template_body.splitlines(), template_body.splitlines(), lineterm="", n=0
+        ):
+            if line.startswith("+") and not line.startswith("+++"):
+                added += 1
+            elif line.startswith("-") and not line.startswith("---"):
+                removed += 1
+
+        print(
+            f"The template has {added} added and {removed} removed line(s) since it was last installed."
+        )
 
     def delete_stack(self, stack_id_or_name, cf_client=None) -> Optional[bool]:
         if not stack_id_or_name:
@@ -1363,6 +1662,10 @@ You must set your AWS credentials before selecting or creating subnets.
         if not rv:
             return None
 
+        if self.deployment_scheduler.is_property_pending("subnets"):
+            # Set when the VPC stack is installed
+            return []
+
         if is_create or self.was_vpc_created_by_wizard:
             return self.subnets
 
@@ -1449,6 +1752,10 @@ You must set your AWS credentials before creating or selecting security groups.
         if not rv:
             return None
 
+        if self.deployment_scheduler.is_property_pending("security_groups"):
+            # Set when the VPC stack is installed
+            return []
+
         if is_create or self.was_vpc_created_by_wizard:
             return self.security_groups
 
@@ -1457,7 +1764,8 @@ You must set your AWS credentials before creating or selecting security groups.
 
         return None
 
-    def ask_for_vpc(self, ec2_client) -> Optional[str]:
+    # Returns True if a VPC was selected, or created or is being created
+    def ask_for_vpc(self, ec2_client) -> Optional[bool]:
         vpcs = self.list_vpcs(ec2_client)
 
         if vpcs:
@@ -1491,6 +1799,12 @@ You must set your AWS credentials before creating or selecting security groups.
             create_choice = "Create a new VPC ..."
             choices.append(create_choice)
 
+            refresh_choice = self.make_discovery_refresh_choice(
+                AwsDiscovery.VPCS, "VPCs"
+            )
+            if refresh_choice:
+                choices.append(refresh_choice)
+
             selected_vpc_choice = questionary.select(
                 "Which VPC do you want to use?", choices=choices
             ).ask()
@@ -1498,13 +1812,19 @@ You must set your AWS credentials before creating or selecting security groups.
             if selected_vpc_choice is None:
                 return None
 
+            if selected_vpc_choice == refresh_choice:
+                self.get_aws_discovery().invalidate(AwsDiscovery.VPCS)
+                return self.ask_for_vpc(ec2_client)
+
             if selected_vpc_choice != create_choice:
                 if selected_vpc_choice != current_vpc_choice:
+                    # The VPC stack being installed would replace the choice
+                    self.abandon_deployment(VPC_STACK_DEPLOYMENT)
                     selected_vpc = vpc_choice_to_vpc[selected_vpc_choice]
                     self.vpc_id = selected_vpc["id"]
                     self.vpc_name = selected_vpc["name"]
                     self.save()
-                return vpc_id
+                return True
         else:
             rv = questionary.confirm("Create a new VPC?").ask()
 
@@ -1514,7 +1834,13 @@ You must set your AWS credentials before creating or selecting security groups.
         return self.create_or_update_vpc()
 
     # TODO: allow user to give the VPC a name
-    def create_or_update_vpc(self) -> Optional[str]:
+    def create_or_update_vpc(self) -> Optional[bool]:
+        if self.deployment_scheduler.is_running(VPC_STACK_DEPLOYMENT):
+            print(
+                "The VPC stack is still being installed. Please wait for it to finish before creating another VPC.\n"
+            )
+            return None
+
         print(
             """
 This wizard can create a VPC suitable for running ECS tasks, along with subnets and a security group.
@@ -1532,11 +1858,16 @@ this wizard will update it.
             print("You must set your AWS credentials before creating a VPC.\n")
             return None
 
-        az_response = ec2_client.describe_availability_zones(
-            Filters=[{"Name": "region-name", "Values": [self.aws_region]}]
+        azs = self.get_aws_discovery().get(
+            AwsDiscovery.AVAILABILITY_ZONES,
+            lambda: self.fetch_availability_zones(ec2_client),
         )
 
-        azs = az_response["AvailabilityZones"]
+        if azs is None:
+            print(
+                "We could not determine the Availability Zones in your region. Please check your AWS credentials and permissions.\n"
+            )
+            return None
 
         logging.debug(f"Got availability zones: {azs}")
 
@@ -1544,27 +1875,77 @@ this wizard will update it.
         for az in azs:
             az_name_to_id[az["ZoneName"]] = az["ZoneId"]
 
+        vpcs: list[dict[str, Any]] = []
+        cidr_index = CidrIndex()
+
+        vpcs_and_index = self.load_vpc_cidr_index(ec2_client)
+        if vpcs_and_index is None:
+            print(
+                "We could not list your existing VPCs, so we can't check the VPC CIDR block for conflicts with them.\n"
+            )
+        else:
+            vpcs, cidr_index = vpcs_and_index
+
+        # Suggest the first /16 in 10.0.0.0/8 that no VPC uses
+        free_cidr = cidr_index.find_free(prefix_length=DEFAULT_PREFIX_LENGTH)
+        default_second_octet = (
+            0 if free_cidr is None else free_cidr.network_address.packed[1]
+        )
+
         done = False
         while not done:
             rv = questionary.text(
-                "The subnets will be in the range 10.[n].0.0/16. What should n be? [0]"
+                f"The subnets will be in the range 10.[n].0.0/16. What should n be? You can also enter another CIDR block, like 10.0.0.0/20. [{default_second_octet}]"
             ).ask()
 
             if rv is None:
                 return None
 
-            if rv:
+            rv = rv.strip()
+
+            if "/" in rv:
                 try:
-                    second_octet = int(rv)
-                except ValueError:
-                    print("n should be between 0 and 255.")
+                    vpc_cidr = str(to_network(rv))
+                    split_vpc_cidr(vpc_cidr, len(azs))
+                except ValueError as ex:
+                    print(f"{rv} can't be used: {ex}")
                     continue
+            else:
+                if rv:
+                    try:
+                        second_octet = int(rv)
+                    except ValueError:
+                        print("n should be between 0 and 255.")
+                        continue
+
+                    if second_octet < 0 or second_octet > 255:
+                        print("n should be between 0 and 255.")
+                        continue
+                else:
+                    second_octet = default_second_octet
+
+                vpc_cidr = f"10.{second_octet}.0.0/16"
+
+            if cidr_index.overlaps(vpc_cidr):
+                print(f"{vpc_cidr} overlaps the CIDR blocks of these existing VPC(s):")
+                vpc_network = to_network(vpc_cidr)
+                for vpc in vpcs:
+                    cidrs = [
+                        c for c in vpc["cidrs"] if to_network(c).overlaps(vpc_network)
+                    ]
+                    if cidrs:
+                        print(
+                            f"  {vpc['id']} [{vpc['name'] or ''}]: {', '.join(cidrs)}"
+                        )
 
-                if second_octet < 0 or second_octet > 255:
-                    print("n should be between 0 and 255.")
+                print(
+                    """VPCs with overlapping CIDR blocks can't be peered or attached to the
+same Transit Gateway. If you are updating a VPC this wizard created, its own
+CIDR block is expected to be listed."""
+                )
+
+                if not questionary.confirm(f"Use {vpc_cidr} anyway?").ask():
                     continue
-            else:
-                second_octet = 0
 
             done = True
 
@@ -1734,13 +2115,20 @@ per month per private subnet.
             selected_vpc_endpoints.append("S3")
             selected_vpc_endpoints.append("DynamoDB")
 
-        vpc_template = self.make_vpc_template(
-            public_azs=selected_public_azs,
-            private_azs=selected_private_azs,
-            private_azs_with_nat=selected_private_azs_with_nat,
-            second_octet=second_octet,
-            vpc_endpoints=selected_vpc_endpoints,
-        )
+        try:
+            vpc_template = self.make_vpc_template(
+                public_azs=selected_public_azs,
+                private_azs=selected_private_azs,
+                private_azs_with_nat=selected_private_azs_with_nat,
+                vpc_cidr=vpc_cidr,
+                vpc_endpoints=selected_vpc_endpoints,
+            )
+        except TemplateValidationError as ex:
+            print("The VPC template can't be installed:")
+            for problem in ex.problems:
+                print(f"  {problem}")
+            print(f"{HELP_MESSAGE}\n")
+            return None
 
         logging.debug("vpc_template = ")
         logging.debug(vpc_template)
@@ -1768,26 +2156,82 @@ per month per private subnet.
 
         vpc_stack_name, vpc_stack_id_to_update, reuse_stack = rv
 
+        if vpc_stack_id_to_update and not reuse_stack:
+            rv = questionary.confirm(
+                f"Are you sure you want to update the stack '{vpc_stack_name}' with VPC resources?"
+            ).ask()
+            if not rv:
+                print("Not updating the stack with VPC. Returning to the menu.")
+                return None
+
+        return self.install_vpc_stack(
+            vpc_stack_name=vpc_stack_name,
+            vpc_stack_id_to_update=vpc_stack_id_to_update,
+            vpc_template=vpc_template,
+            reuse_stack=reuse_stack,
+            cf_client=cf_client,
+            in_background=self.interactive,
+        )
+
+    # Returns True if the VPC stack was installed, and vpc_id, subnets and
+    # security_groups were set from its outputs. In the background, True only
+    # means the installation started, and they are set once it finishes.
+    def install_vpc_stack(
+        self,
+        vpc_stack_name: str,
+        vpc_stack_id_to_update: Optional[str],
+        vpc_template: str,
+        reuse_stack: bool = False,
+        cf_client=None,
+        in_background: bool = False,
+    ) -> bool:
+        if not cf_client:
+            cf_client = self.make_boto_client("cloudformation")
+
         vpc_stack_id = vpc_stack_id_to_update
         if not reuse_stack:
-            if vpc_stack_id:
-                rv = questionary.confirm(
-                    f"Are you sure you want to update the stack '{vpc_stack_name}' with VPC resources?"
-                ).ask()
-                if not rv:
-                    print("Not updating the stack with VPC. Returning to the menu.")
-                    return None
-
             rv = self.start_vpc_cloudformation_template_upload(
                 vpc_stack_name, vpc_stack_id_to_update, vpc_template, cf_client
             )
 
             if rv is None:
                 print("Can't create or update VPC CloudFormation stack.\n")
-                return None
+                return False
 
             vpc_stack_id = rv
 
+        # An up-to-date stack's outputs are already known, so there's nothing
+        # to wait for
+        if (
+            vpc_stack_id
+            and in_background
+            and not self.is_stack_up_to_date(vpc_stack_id)
+        ):
+            # The stack sets these when it is installed
+            self.subnets = None
+            self.security_groups = None
+            self.start_stack_deployment(
+                VPC_STACK_DEPLOYMENT,
+                f"VPC stack '{vpc_stack_name}'",
+                self.wait_for_vpc_stack_upload,
+                vpc_stack_id,
+                vpc_stack_name,
+                cf_client,
+                properties=["vpc_id", "subnets", "security_groups"],
+            )
+            print(
+                "The VPC stack is being installed. You can continue while it finishes.\n"
+            )
+            return True
+
+        return (
+            self.finish_vpc_stack_install(vpc_stack_id, vpc_stack_name, cf_client)
+            is not None
+        )
+
+    def finish_vpc_stack_install(
+        self, vpc_stack_id: Optional[str], vpc_stack_name: str, cf_client
+    ) -> Optional[str]:
         if vpc_stack_id:
             vpc_id = self.wait_for_vpc_stack_upload(
                 vpc_stack_id, vpc_stack_name, cf_client
@@ -1806,44 +2250,166 @@ per month per private subnet.
 
         return self.vpc_id
 
+    # Waits for a stack in the background. Its progress goes to the status
+    # line instead of being printed, and the outcome is printed by
+    # handle_deployment_finished() once the main thread picks it up. The wait
+    # function gets the generation of the deployment, and must only set
+    # properties while it is current.
+    def start_stack_deployment(
+        self,
+        name: str,
+        label: str,
+        wait: Callable[..., Any],
+        *args: Any,
+        properties: Iterable[str] = (),
+        **kwargs: Any,
+    ) -> None:
+        if self.deployment_scheduler.is_running(name):
+            logging.warning(f"Not starting deployment '{name}', it is still running")
+            return
+
+        with self.deployment_lock:
+            generation = self.deployment_generations.get(name, 0)
+
+        progress_report = self.stack_progress.start(name, label)
+
+        # An abandoned deployment keeps running, but doesn't touch the
+        # progress of the deployment that replaced it
+        def report(message: str) -> None:
+            with self.deployment_lock:
+                if self.is_deployment_current(name, generation):
+                    progress_report(message)
+
+        def deploy() -> Any:
+            try:
+                return wait(*args, report=report, generation=generation, **kwargs)
+            finally:
+                with self.deployment_lock:
+                    if self.is_deployment_current(name, generation):
+                        self.stack_progress.finish(name)
+
+        self.deployment_scheduler.start(name, deploy, properties=properties)
+
+    # Drops the results of a deployment, when the settings it was started for
+    # are cleared. AWS keeps installing the stack.
+    def abandon_deployment(self, name: str) -> None:
+        with self.deployment_lock:
+            self.deployment_generations[name] = (
+                self.deployment_generations.get(name, 0) + 1
+            )
+
+        self.deployment_scheduler.abandon(name)
+        self.stack_progress.pop_message(name)
+
+    # Must be called with deployment_lock held. Waits in the foreground have
+    # no generation, and are always current.
+    def is_deployment_current(self, name: str, generation: Optional[int]) -> bool:
+        return (generation is None) or (
+            generation == self.deployment_generations.get(name, 0)
+        )
+
+    def handle_finished_deployments(self) -> bool:
+        succeeded = True
+
+        for name, result in self.deployment_scheduler.pop_completed():
+            if not self.handle_deployment_finished(name, result):
+                succeeded = False
+
+        return succeeded
+
+    def handle_deployment_finished(self, name: str, result: Any) -> bool:
+        message = self.stack_progress.pop_message(name)
+
+        if name == VPC_STACK_DEPLOYMENT:
+            if result:
+                print(
+                    f"Successfully created VPC {self.vpc_id} in region {self.aws_region}.\n"
+                )
+                return True
+
+            if message:
+                print(message)
+
+            print(
+                f"Something was wrong with the VPC CloudFormation stack. {HELP_MESSAGE}\n"
+            )
+            return False
+
+        if result:
+            print("The CloudFormation stack installation was successful.\n")
+            return True
+
+        if self.stack_upload_finished_at:
+            # Prints why the stack failed, and offers to delete it
+            self.handle_role_stack_upload_finished()
+        elif message:
+            print(message)
+
+        return False
+
+    # Waits for the stacks being installed in the background, showing their
+    # progress. Returns False if any of them failed, or if the wait was
+    # stopped with Ctrl-C.
+    def wait_for_deployments(self) -> bool:
+        scheduler = self.deployment_scheduler
+
+        if not scheduler.has_deployments():
+            return True
+
+        if scheduler.is_any_running():
+            print(
+                "Waiting for the CloudFormation stacks to finish installing. Press Ctrl-C to stop waiting.\n"
+            )
+
+            try:
+                with StatusLine(self.stack_progress.format_status_line):
+                    scheduler.wait_all()
+            except KeyboardInterrupt:
+                print(
+                    "\nStopped waiting. AWS keeps installing the stacks, and you can keep editing settings in the meantime.\n"
+                )
+                return False
+
+        return self.handle_finished_deployments()
+
+    # Raises TemplateValidationError if the template has problems that
+    # CloudFormation would only find after trying to install it, or
+    # ValueError if the VPC CIDR block is too small for the AZs
+    @traced()
     def make_vpc_template(
         self,
         public_azs: list[str],
         private_azs: list[str],
         private_azs_with_nat: list[str],
-        second_octet: int,
+        vpc_cidr: str,
         vpc_endpoints: list[str],
     ) -> str:
 
-        public_az_letters = [az[-1].upper() for az in public_azs]
-        private_az_letters = [az[-1].upper() for az in private_azs]
-        private_az_with_nat_letters = [az[-1].upper() for az in private_azs_with_nat]
-
-        all_az_letters = list(dict.fromkeys(public_az_letters + private_az_letters))
-
-        all_az_letters.sort()
-
-        env = Environment(
-            loader=PackageLoader("cloudreactor_aws_setup_wizard", "templates")
+        def to_az_letters(azs: list[str]) -> tuple[str, ...]:
+            return tuple(sorted(set(az[-1].upper() for az in azs)))
+
+        public_az_letters = to_az_letters(public_azs)
+        private_az_letters = to_az_letters(private_azs)
+        all_az_letters = tuple(sorted(set(public_az_letters + private_az_letters)))
+        vpc_cidr = str(to_network(vpc_cidr))
+
+        vpc_template = render_vpc_template(
+            all_az_letters=all_az_letters,
+            public_az_letters=public_az_letters,
+            private_az_letters=private_az_letters,
+            private_az_with_nat_letters=to_az_letters(private_azs_with_nat),
+            vpc_cidr=vpc_cidr,
+            subnet_cidrs=tuple(split_vpc_cidr(vpc_cidr, len(all_az_letters))),
+            vpc_endpoints=tuple(sorted(set(vpc_endpoints))),
         )
 
-        template = env.get_template("vpc.yml.j2")
-
-        data = {
-            "all_az_letters": all_az_letters,
-            "public_az_letters": public_az_letters,
-            "private_az_letters": private_az_letters,
-            "private_az_with_nat_letters": private_az_with_nat_letters,
-            "second_octet": second_octet,
-            "vpc_endpoints": vpc_endpoints,
-        }
-
-        return template.render(data)
+        validate_template(vpc_template)
+        return vpc_template
 
     def start_vpc_cloudformation_template_upload(
         self,
         vpc_stack_name: str,
-        vpc_stack_id_to_update: str,
+        vpc_stack_id_to_update: Optional[str],
         vpc_template: str,
         cf_client=None,
     ) -> Optional[str]:
@@ -1857,40 +2423,59 @@ per month per private subnet.
             return None
 
         try:
-            resp = None
-
             if vpc_stack_id_to_update:
-                resp = cf_client.update_stack(
-                    StackName=vpc_stack_id_to_update, TemplateBody=vpc_template
+                result = self.update_stack_with_change_set(
+                    vpc_stack_id_to_update,
+                    vpc_stack_name,
+                    cf_client,
+                    template_body=vpc_template,
                 )
+
+                if result.status == UPDATE_CANCELLED:
+                    return None
+
+                if result.status == UPDATE_UNCHANGED:
+                    return result.stack_id
+
+                vpc_stack_id = result.stack_id
             else:
                 resp = cf_client.create_stack(
                     StackName=vpc_stack_name, TemplateBody=vpc_template
                 )
 
-            logging.debug("Got stack response:")
-            logging.debug(resp)
+                logging.debug("Got stack response:")
+                logging.debug(resp)
+
+                vpc_stack_id = resp["StackId"]
+
+                # Saved when the stack is installed, so running the wizard
+                # again with the same template doesn't update it
+                template_body_hash = self.store_template(vpc_template)
+                with self.template_hashes_lock:
+                    self.pending_template_hashes[vpc_stack_id] = (
+                        make_template_hash(template_body=vpc_template),
+                        template_body_hash,
+                    )
 
-            vpc_stack_id = resp["StackId"]
+            self.add_to_stack_index(
+                StackSummary(
+                    name=vpc_stack_name,
+                    stack_id=vpc_stack_id,
+                    status="UPDATE_IN_PROGRESS"
+                    if vpc_stack_id_to_update
+                    else "CREATE_IN_PROGRESS",
+                )
+            )
+            self.get_aws_discovery().invalidate(AwsDiscovery.VPCS)
             print(
                 f"Started CloudFormation VPC template installation for VPC stack '{vpc_stack_name}', stack ID is {vpc_stack_id}."
             )
             return vpc_stack_id
         except Exception as ex:
-            ex_str = str(ex)
-
-            if vpc_stack_id_to_update and (
-                ex_str.find("No updates are to be performed") >= 0
-            ):
-                print(
-                    f"No stack updates were necessary. Using existing stack name '{vpc_stack_name}'.\n"
-                )
-                return vpc_stack_id_to_update
-
             logging.warning("Failed to install stack", exc_info=True)
             print(f"Failed to install stack: {ex}")
 
-            if ex_str.find("AlreadyExistsException") >= 0:
+            if self.interactive and (str(ex).find("AlreadyExistsException") >= 0):
                 rv = questionary.confirm("That stack already exists. Delete it?").ask()
                 if rv:
                     self.delete_stack(vpc_stack_name, cf_client)
@@ -2053,17 +2638,30 @@ which allows outbound access to the public internet.
                 print("Skipping CloudReactor credentials for now.")
                 return None
 
+        print()
+
+        return self.validate_cloudreactor_credentials(username, password)
+
+    def validate_cloudreactor_credentials(
+        self, username: str, password: str
+    ) -> Optional[Tuple[str, str]]:
         cloudreactor_api_client = CloudReactorApiClient(
             username=username,
             password=password,
             api_base_url=self.api_base_url,
             cloudreactor_deployment_environment=self.cloudreactor_deployment_environment,
+            http=self.get_cloudreactor_http(),
+            token_cache=self.make_token_cache(),
         )
 
-        print()
-
         try:
-            cloudreactor_api_client.list_groups()
+            groups = list(cloudreactor_api_client.iterate_groups())
+
+            if self.cloudreactor_credentials != (username, password):
+                discovery = self.get_aws_discovery()
+                discovery.invalidate_prefix(AwsDiscovery.RUN_ENVIRONMENTS)
+                discovery.put(AwsDiscovery.GROUPS, groups)
+
             self.cloudreactor_credentials = (username, password)
             self.cloudreactor_api_client = cloudreactor_api_client
 
@@ -2084,7 +2682,15 @@ which allows outbound access to the public internet.
             print("CloudReactor credentials were not set, please set them.")
             return None
 
-        existing_groups = cr_api_client.list_groups()["results"]
+        existing_groups = self.get_aws_discovery().get(
+            AwsDiscovery.GROUPS, lambda: list(cr_api_client.iterate_groups())
+        )
+
+        if existing_groups is None:
+            print(
+                "We could not list your CloudReactor Groups. Please check your CloudReactor credentials.\n"
+            )
+            return None
 
         create_new_choice = "Create a new Group ..."
         group_id: Optional[int] = None
@@ -2120,9 +2726,43 @@ which allows outbound access to the public internet.
         if group_name is None:
             return None
 
+        return self.create_cloudreactor_group(group_name)
+
+    def use_cloudreactor_group(self, group_name: str) -> Optional[Tuple[int, str]]:
+        cr_api_client = self.get_or_create_cloudreactor_api_client()
+
+        if not cr_api_client:
+            print("CloudReactor credentials were not set, please set them.")
+            return None
+
+        # Only the Group with the given name is fetched
+        try:
+            group = cr_api_client.find_group_by_name(group_name)
+        except Exception:
+            logging.warning("Failed to find CloudReactor Group", exc_info=True)
+            print(
+                "We could not list your CloudReactor Groups. Please check your CloudReactor credentials.\n"
+            )
+            return None
+
+        if group:
+            self.cloudreactor_group = (group["id"], group["name"])
+            self.save()
+            return self.cloudreactor_group
+
+        return self.create_cloudreactor_group(group_name)
+
+    def create_cloudreactor_group(self, group_name: str) -> Optional[Tuple[int, str]]:
+        cr_api_client = self.get_or_create_cloudreactor_api_client()
+
+        if not cr_api_client:
+            print("CloudReactor credentials were not set, please set them.")
+            return None
+
         data = {"name": group_name}
         try:
             saved_group = cr_api_client.create_group(data=data)
+            self.get_aws_discovery().invalidate(AwsDiscovery.GROUPS)
             self.cloudreactor_group = (saved_group["id"], saved_group["name"])
             self.save()
             return self.cloudreactor_group
@@ -2140,10 +2780,25 @@ which allows outbound access to the public internet.
                     password=self.cloudreactor_credentials[1],
                     api_base_url=self.api_base_url,
                     cloudreactor_deployment_environment=self.cloudreactor_deployment_environment,
+                    http=self.get_cloudreactor_http(),
+                    token_cache=self.make_token_cache(),
                 )
 
         return None
 
+    def make_token_cache(self) -> Optional[TokenCache]:
+        # Like the saved state, so nothing is left behind in batch mode
+        if self.state_store is None:
+            return None
+
+        return TokenCache(SAVED_STATE_DIRECTORY)
+
+    def get_cloudreactor_http(self) -> urllib3.PoolManager:
+        if self.cloudreactor_http is None:
+            self.cloudreactor_http = make_pool_manager()
+
+        return self.cloudreactor_http
+
     def make_default_run_environment_name(self) -> str:
         if self.deployment_environment:
             return self.deployment_environment
@@ -2157,7 +2812,12 @@ which allows outbound access to the public internet.
 
         return DEFAULT_RUN_ENVIRONMENT_NAME
 
-    def create_or_update_run_environment(self) -> Optional[bool]:
+    def create_or_update_run_environment(
+        self, run_environment_name: Optional[str] = None
+    ) -> Optional[bool]:
+        if not self.wait_for_deployments():
+            return None
+
         print(
             "The CloudReactor permissions CloudFormation stack has been uploaded successfully."
         )
@@ -2177,39 +2837,70 @@ which allows outbound access to the public internet.
                 return None
 
         cloudreactor_group = cast(Tuple[int, str], self.cloudreactor_group)
-        existing_run_environments = cr_api_client.list_run_environments(
-            group_id=cloudreactor_group[0]
-        )["results"]
-
         default_run_environment_name = self.make_default_run_environment_name()
         create_new_choice = "Create a new Run Environment"
         run_environment_uuid: Optional[str] = None
-        run_environment_name: Optional[str] = None
-        if existing_run_environments:
-            choices = [
-                run_environment["name"] for run_environment in existing_run_environments
-            ]
-            choices.append(create_new_choice)
+        cannot_list_message = "We could not list your CloudReactor Run Environments. Please check your CloudReactor credentials.\n"
+        run_environments_key = AwsDiscovery.make_key(
+            AwsDiscovery.RUN_ENVIRONMENTS, cloudreactor_group[0]
+        )
 
-            # Move default to the top
-            if default_run_environment_name in choices:
-                choices.remove(default_run_environment_name)
-                choices.insert(0, default_run_environment_name)
+        if run_environment_name:
+            # Update the Run Environment with the given name, or create it.
+            # Only that Run Environment is fetched.
+            try:
+                existing_run_environment = cr_api_client.find_run_environment_by_name(
+                    group_id=cloudreactor_group[0], name=run_environment_name
+                )
+            except Exception:
+                logging.warning("Failed to find Run Environment", exc_info=True)
+                print(cannot_list_message)
+                return None
 
-            run_environment_name = questionary.select(
-                "Which Run Environment do you want to update?", choices=choices
-            ).ask()
-            if run_environment_name is None:
+            if existing_run_environment:
+                run_environment_uuid = existing_run_environment["uuid"]
+        else:
+            existing_run_environments = self.get_aws_discovery().get(
+                run_environments_key,
+                lambda: list(
+                    cr_api_client.iterate_run_environments(
+                        group_id=cloudreactor_group[0]
+                    )
+                ),
+            )
+
+            if existing_run_environments is None:
+                print(cannot_list_message)
                 return None
 
-            if run_environment_name != create_new_choice:
-                run_environment_uuid = [
-                    run_environment["uuid"]
+            if existing_run_environments:
+                choices = [
+                    run_environment["name"]
                     for run_environment in existing_run_environments
-                    if run_environment["name"] == run_environment_name
-                ][0]
+                ]
+                choices.append(create_new_choice)
 
-        if not run_environment_uuid:
+                # Move default to the top
+                if default_run_environment_name in choices:
+                    choices.remove(default_run_environment_name)
+                    choices.insert(0, default_run_environment_name)
+
+                run_environment_name = questionary.select(
+                    "Which Run Environment do you want to update?", choices=choices
+                ).ask()
+                if run_environment_name is None:
+                    return None
+
+                if run_environment_name == create_new_choice:
+                    run_environment_name = None
+                else:
+                    run_environment_uuid = [
+                        run_environment["uuid"]
+                        for run_environment in existing_run_environments
+                        if run_environment["name"] == run_environment_name
+                    ][0]
+
+        if not (run_environment_uuid or run_environment_name):
             q = "What do you want to name your Run Environment? "
 
             if default_run_environment_name:
@@ -2290,6 +2981,7 @@ which allows outbound access to the public internet.
                 print(f"Creating Run Environment '{run_environment_name}'.\n")
                 saved_run_environment = cr_api_client.create_run_environment(data=data)
 
+            self.get_aws_discovery().invalidate(run_environments_key)
             self.saved_run_environment_uuid = saved_run_environment.get("uuid")
 
             if not self.saved_run_environment_uuid:
@@ -2363,6 +3055,7 @@ CloudReactor/{self.deployment_environment}/common/cloudreactor_api_key
             self.saved_run_environment_name = None
             self.saved_run_environment_uuid = None
             self.cluster_arn = None
+            self.abandon_deployment(VPC_STACK_DEPLOYMENT)
             self.vpc_id = None
             self.vpc_name = None
             self.subnets = None
@@ -2423,24 +3116,60 @@ CloudReactor/{self.deployment_environment}/common/cloudreactor_api_key
             + ".json"
         )
 
-    def make_boto_client(self, service_name: str):
-        if (
+    @traced()
+    def make_boto_client(self, service_name: str, refresh: bool = False):
+        has_access_key = bool(
             self.aws_access_key
             and (self.aws_access_key != NO_ACCESS_KEY)
             and self.aws_secret_key
             and (self.aws_secret_key != NO_ACCESS_KEY)
-        ):
-            return boto3.client(
-                service_name=service_name,
-                region_name=self.aws_region,
-                aws_access_key_id=self.aws_access_key,
-                aws_secret_access_key=self.aws_secret_key,
-            )
+        )
 
-        try:
-            return boto3.client(service_name=service_name, region_name=self.aws_region)
-        except Exception:
-            return None
+        session_key = (
+            self.aws_region,
+            self.aws_access_key if has_access_key else None,
+        )
+
+        if (self.boto_session is None) or (self.boto_session_key != session_key):
+            import boto3
+
+            self.clear_boto_clients()
+
+            if self.boto_session_factory:
+                self.boto_session = self.boto_session_factory(self.aws_region)
+            elif has_access_key:
+                self.boto_session = boto3.Session(
+                    region_name=self.aws_region,
+                    aws_access_key_id=self.aws_access_key,
+                    aws_secret_access_key=self.aws_secret_key,
+                )
+            else:
+                self.boto_session = boto3.Session(region_name=self.aws_region)
+
+            self.aws_call_policy.attach_to_session(self.boto_session)
+            self.boto_session_key = session_key
+        elif not refresh:
+            client = self.boto_clients.get(service_name)
+            if client is not None:
+                return client
+
+        session = cast("boto3.Session", self.boto_session)
+
+        if has_access_key:
+            client = self.aws_call_policy.make_client(session, service_name)
+        else:
+            try:
+                client = self.aws_call_policy.make_client(session, service_name)
+            except Exception:
+                return None
+
+        self.boto_clients[service_name] = client
+        return client
+
+    def clear_boto_clients(self) -> None:
+        self.boto_session = None
+        self.boto_session_key = None
+        self.boto_clients = {}
 
     def generate_random_key(self) -> str:
         return "".join(
@@ -2459,7 +3188,7 @@ CloudReactor/{self.deployment_environment}/common/cloudreactor_api_key
 
         return "(" + ", ".join(arr) + ")"
 
-    def list_stacks(self, cf_client=None):
+    def list_stacks(self, cf_client=None) -> Optional[StackIndex]:
         print(
             f"Looking for existing CloudFormation stacks in region {self.aws_region} ..."
         )
@@ -2473,64 +3202,209 @@ CloudReactor/{self.deployment_environment}/common/cloudreactor_api_key
             )
             return None
 
-        resp = None
-        try:
-            resp = cf_client.list_stacks()
-        except Exception as ex:
-            logging.warning(f"Failed to list stacks: {ex}")
+        stack_index = self.get_aws_discovery().get(
+            AwsDiscovery.STACKS, lambda: self.fetch_stacks(cf_client)
+        )
+
+        if stack_index is None:
             print(
                 "We could not determine your existing CloudFormation stacks. Please check your AWS credentials and permissions."
             )
             return None
 
-        existing_stacks = []
-        stack_summaries = resp.get("StackSummaries") or []
-
-        for summary in stack_summaries:
-            stack_id = summary.get("StackId")
-            name = summary.get("StackName")
-            status = summary.get("StackStatus")
-
-            if (
-                stack_id
-                and name
-                and status
-                and (status != "DELETE_COMPLETE")
-                and (status != "DELETE_FAILED")
-            ):
-                existing_stacks.append(
-                    {"stack_id": stack_id, "name": name, "status": status}
-                )
-
         print(
-            f"Found {len(existing_stacks)} existing CloudFormation stack(s) in region {self.aws_region}:"
+            f"Found {len(stack_index)} existing CloudFormation stack(s) in region {self.aws_region}:"
         )
 
-        for stack in existing_stacks:
-            print(f"{stack['name']}: {stack['status']}")
+        for stack in stack_index:
+            print(f"{stack.name}: {stack.status}")
+
+        return stack_index
 
-        return existing_stacks
+    def fetch_stacks(self, cf_client) -> StackIndex:
+        return StackIndex.load(cf_client, max_pages=self.max_list_pages)
 
     def list_vpcs(self, ec2_client) -> Optional[list[dict[str, Any]]]:
         print(f"Looking for existing VPCs in region {self.aws_region} ...")
 
-        resp = None
-        try:
-            resp = ec2_client.describe_vpcs(MaxResults=100)
-        except Exception as ex:
-            logging.warning(f"Failed to list VPCs: {ex}")
+        vpcs = self.get_aws_discovery().get(
+            AwsDiscovery.VPCS, lambda: self.fetch_vpcs(ec2_client)
+        )
+
+        if vpcs is None:
             print(
                 "We could not determine your existing VPCs. Please check your AWS credentials and permissions."
             )
             return None
 
-        vpcs = resp["Vpcs"]
         print(f"Found {len(vpcs)} VPC(s) in region {self.aws_region}.")
+        return vpcs
+
+    def fetch_vpcs(self, ec2_client, all_pages: bool = False) -> list[dict[str, Any]]:
+        vpcs = PagedListing(
+            ec2_client,
+            "describe_vpcs",
+            "Vpcs",
+            max_pages=None if all_pages else self.max_list_pages,
+        )
+
         return [
-            {"id": vpc["VpcId"], "name": self.find_name_in_tags(vpc.get("Tags"))}
+            {
+                "id": vpc["VpcId"],
+                "name": self.find_name_in_tags(vpc.get("Tags")),
+                "cidrs": self.find_vpc_cidrs(vpc),
+            }
             for vpc in vpcs
         ]
 
+    # Returns the IPv4 CIDR blocks of a VPC, including secondary ones
+    def find_vpc_cidrs(self, vpc: dict[str, Any]) -> list[str]:
+        cidrs = [
+            association["CidrBlock"]
+            for association in vpc.get("CidrBlockAssociationSet") or []
+            if (association.get("CidrBlockState") or {}).get("State")
+            in ["associating", "associated"]
+        ]
+
+        if vpc.get("CidrBlock") and (vpc["CidrBlock"] not in cidrs):
+            cidrs.insert(0, vpc["CidrBlock"])
+
+        return cidrs
+
+    # Returns the VPCs in the region, along with an index of their CIDR blocks,
+    # or None if the VPCs can't be listed. The VPCs are always listed again,
+    # and without the page limit, since a block allocated from a cached or
+    # partial list could overlap a VPC that isn't in it.
+    def load_vpc_cidr_index(
+        self, ec2_client
+    ) -> Optional[tuple[list[dict[str, Any]], CidrIndex]]:
+        try:
+            vpcs = self.fetch_vpcs(ec2_client, all_pages=True)
+        except Exception:
+            logging.warning("Failed to list VPCs", exc_info=True)
+            return None
+
+        self.get_aws_discovery().put(AwsDiscovery.VPCS, vpcs)
+
+        return vpcs, CidrIndex(cidr for vpc in vpcs for cidr in vpc["cidrs"])
+
+    def fetch_vpc_resources(
+        self, ec2_client, operation_name: str, result_key: str, vpc_id: str
+    ) -> dict[str, Any]:
+        listing = PagedListing(
+            ec2_client,
+            operation_name,
+            result_key,
+            max_pages=self.max_list_pages,
+            Filters=[
+                {
+                    "Name": "vpc-id",
+                    "Values": [
+                        vpc_id,
+                    ],
+                },
+            ],
+        )
+
+        items = list(listing)
+        return {"items": items, "truncated": listing.truncated}
+
+    def fetch_cluster_arns(self, ecs_client) -> list[str]:
+        return list(
+            PagedListing(
+                ecs_client,
+                "list_clusters",
+                "clusterArns",
+                max_pages=self.max_list_pages,
+                page_size=100,
+            )
+        )
+
+    def fetch_availability_zones(self, ec2_client) -> list[dict[str, Any]]:
+        az_response = ec2_client.describe_availability_zones(
+            Filters=[{"Name": "region-name", "Values": [self.aws_region]}]
+        )
+
+        azs = az_response["AvailabilityZones"]
+        logging.debug(f"Got availability zones: {azs}")
+        return azs
+
+    def get_aws_discovery(self) -> AwsDiscovery:
+        region = self.aws_region or ""
+        discovery = self.aws_discoveries.get(region)
+
+        if discovery is None:
+            discovery = AwsDiscovery()
+            self.aws_discoveries[region] = discovery
+
+        # Like the saved state, so batch mode doesn't read or leave behind
+        # cached lists
+        if (
+            (discovery.cache is None)
+            and self.state_store
+            and self.aws_account_id
+            and self.aws_region
+        ):
+            discovery.attach_cache(
+                DiscoveryCache(
+                    directory=SAVED_STATE_DIRECTORY,
+                    account_id=self.aws_account_id,
+                    region=self.aws_region,
+                )
+            )
+
+        return discovery
+
+    def start_aws_discovery(self) -> None:
+        ecs_client = self.make_boto_client("ecs")
+        cf_client = self.make_boto_client("cloudformation")
+        ec2_client = self.make_boto_client("ec2")
+
+        # Clients are created here rather than in the worker threads, since
+        # creating clients from a shared boto3 Session is not thread-safe.
+        fetchers: dict[str, Callable[[], Any]] = {}
+
+        if ecs_client:
+            fetchers[AwsDiscovery.CLUSTER_ARNS] = lambda: self.fetch_cluster_arns(
+                ecs_client
+            )
+
+        if cf_client:
+            fetchers[AwsDiscovery.STACKS] = lambda: self.fetch_stacks(cf_client)
+
+        if ec2_client:
+            fetchers[AwsDiscovery.VPCS] = lambda: self.fetch_vpcs(ec2_client)
+            fetchers[
+                AwsDiscovery.AVAILABILITY_ZONES
+            ] = lambda: self.fetch_availability_zones(ec2_client)
+
+        self.get_aws_discovery().prefetch(fetchers)
+
+    def stop_aws_discovery(self) -> None:
+        for discovery in self.aws_discoveries.values():
+            discovery.shutdown()
+
+        self.aws_discoveries = {}
+
+    def add_to_stack_index(self, summary: StackSummary) -> None:
+        discovery = self.get_aws_discovery()
+        stack_index = discovery.peek(AwsDiscovery.STACKS)
+
+        if stack_index is not None:
+            stack_index.add(summary)
+            discovery.put(AwsDiscovery.STACKS, stack_index)
+
+    def make_discovery_refresh_choice(
+        self, key: str, description: str
+    ) -> Optional[str]:
+        discovery = self.get_aws_discovery()
+
+        if not discovery.is_stale(key):
+            return None
+
+        age_minutes = round((discovery.age(key) or 0) / 60)
+        return f"Refresh the list of {description} (last updated {age_minutes} minute(s) ago) ..."
+
     def find_name_in_tags(self, tags: Optional[list[dict[str, str]]]) -> Optional[str]:
         if not tags:
             return None
@@ -2548,34 +3422,30 @@ CloudReactor/{self.deployment_environment}/common/cloudreactor_api_key
 
         print(f"Looking for existing subnets in VPC {self.vpc_id} ...")
 
-        resp = None
-        try:
-            resp = ec2_client.describe_subnets(
-                Filters=[
-                    {
-                        "Name": "vpc-id",
-                        "Values": [
-                            self.vpc_id,
-                        ],
-                    },
-                ],
-                MaxResults=100,
-            )
-        except Exception as ex:
-            logging.warning(f"Failed to list subnets: {ex}")
+        vpc_id = self.vpc_id
+        listing = self.get_aws_discovery().get(
+            AwsDiscovery.make_key(AwsDiscovery.SUBNETS, vpc_id),
+            lambda: self.fetch_vpc_resources(
+                ec2_client, "describe_subnets", "Subnets", vpc_id
+            ),
+        )
+
+        if listing is None:
             print(
                 "We could not determine your existing subnets. Please check your AWS credentials and permissions."
             )
             return None
 
-        logging.debug(f"subnets response = {resp}")
+        subnets = listing["items"]
+        logging.debug(f"subnets = {subnets}")
 
-        subnets = resp["Subnets"]
         subnet_count = len(subnets)
         print(f"Found {subnet_count} subnet(s) in VPC {self.vpc_id}.")
 
-        if subnet_count == 100:
-            print("Warning: more than 100 subnets found, only listing the first 100.")
+        if listing["truncated"]:
+            print(
+                f"Warning: more subnets exist, only listing the first {subnet_count}."
+            )
 
         return subnets
 
@@ -2586,33 +3456,27 @@ CloudReactor/{self.deployment_environment}/common/cloudreactor_api_key
 
         print(f"Looking for existing security groups in VPC {self.vpc_id} ...")
 
-        resp = None
-        try:
-            resp = ec2_client.describe_security_groups(
-                Filters=[
-                    {
-                        "Name": "vpc-id",
-                        "Values": [
-                            self.vpc_id,
-                        ],
-                    },
-                ],
-                MaxResults=100,
-            )
-        except Exception as ex:
-            logging.warning(f"Failed to list security groups: {ex}")
+        vpc_id = self.vpc_id
+        listing = self.get_aws_discovery().get(
+            AwsDiscovery.make_key(AwsDiscovery.SECURITY_GROUPS, vpc_id),
+            lambda: self.fetch_vpc_resources(
+                ec2_client, "describe_security_groups", "SecurityGroups", vpc_id
+            ),
+        )
+
+        if listing is None:
             print(
                 "We could not determine your existing security groups. Please check your AWS credentials and permissions."
             )
             return None
 
-        security_groups = resp["SecurityGroups"]
+        security_groups = listing["items"]
         security_group_count = len(security_groups)
         print(f"Found {security_group_count} security group(s) in VPC {self.vpc_id}.")
 
-        if security_group_count == 100:
+        if listing["truncated"]:
             print(
-                "Warning: more than 100 security groups found, only listing the first 100."
+                f"Warning: more security groups exist, only listing the first {security_group_count}."
             )
 
         # Return the raw response data
@@ -0,0 +1,184 @@
+import base64
+import json
+import logging
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Callable, Optional, Tuple
+
+SCHEMA_VERSION = 1
+
+
+# The settings and progress of the wizard that are kept between sessions.
+# Command-line options and session objects like clients are not included.
+@dataclass(slots=True)
+class WizardState:
+    aws_region: Optional[str] = None
+    aws_access_key: Optional[str] = None
+    aws_secret_key: Optional[str] = None
+    aws_account_id: Optional[str] = None
+    available_cluster_arns: Optional[list[str]] = None
+    cluster_arn: Optional[str] = None
+    vpc_id: Optional[str] = None
+    vpc_name: Optional[str] = None
+    was_vpc_created_by_wizard: Optional[bool] = None
+    subnets: Optional[list[str]] = None
+    security_groups: Optional[list[str]] = None
+    deployment_environment: Optional[str] = None
+    stack_name: Optional[str] = None
+    stack_id_to_update: Optional[str] = None
+    external_id: Optional[str] = None
+    workflow_starter_access_key: Optional[str] = None
+    uploaded_stack_id: Optional[str] = None
+    assumable_role_arn: Optional[str] = None
+    task_execution_role_arn: Optional[str] = None
+    workflow_starter_arn: Optional[str] = None
+    stack_upload_started_at: Optional[datetime] = None
+    stack_upload_succeeded: Optional[bool] = None
+    stack_upload_finished_at: Optional[datetime] = None
+    stack_upload_status: Optional[str] = None
+    stack_upload_status_reason: Optional[str] = None
+    saved_run_environment_uuid: Optional[str] = None
+    saved_run_environment_name: Optional[str] = None
+    stack_template_hashes: Optional[dict[str, dict[str, Optional[str]]]] = None
+    cloudreactor_credentials: Optional[Tuple[str, str]] = None
+    cloudreactor_group: Optional[Tuple[int, str]] = None
+    mode: str = "interview"
+
+    DATETIME_FIELDS = frozenset(["stack_upload_started_at", "stack_upload_finished_at"])
+    TUPLE_FIELDS = frozenset(["cloudreactor_credentials", "cloudreactor_group"])
+
+    @classmethod
+    def field_names(cls) -> list[str]:
+        return [f.name for f in fields(cls)]
+
+    @classmethod
+    def capture(cls, source: Any) -> "WizardState":
+        return cls(**{name: getattr(source, name) for name in cls.field_names()})
+
+    def apply_to(self, target: Any) -> None:
+        for name in WizardState.field_names():
+            setattr(target, name, getattr(self, name))
+
+    def to_dict(self) -> dict[str, Any]:
+        state: dict[str, Any] = {}
+
+        for name in WizardState.field_names():
+            v = getattr(self, name)
+
+            if (v is not None) and (name in WizardState.DATETIME_FIELDS):
+                v = v.isoformat()
+
+            state[name] = v
+
+        return state
+
+    @classmethod
+    def from_dict(cls, state: dict[str, Any]) -> "WizardState":
+        kwargs: dict[str, Any] = {}
+
+        # Unknown names are ignored and missing ones keep their defaults, so
+        # adding or removing a field does not require a migration
+        for name in cls.field_names():
+            if name not in state:
+                continue
+
+            v = state[name]
+
+            if v is not None:
+                if name in cls.DATETIME_FIELDS:
+                    v = datetime.fromisoformat(v)
+                elif name in cls.TUPLE_FIELDS:
+                    v = tuple(v)
+
+            kwargs[name] = v
+
+        return cls(**kwargs)
+
+    def encode(self) -> str:
+        return json.dumps({"version": SCHEMA_VERSION, "state": self.to_dict()})
+
+    @classmethod
+    def decode(cls, text: str) -> "WizardState":
+        data = json.loads(text)
+        version = data.get("version", 0) if isinstance(data, dict) else None
+
+        if not isinstance(version, int) or (version > SCHEMA_VERSION):
+            raise ValueError(f"Unsupported saved state version {version}")
+
+        while version < SCHEMA_VERSION:
+            data = MIGRATIONS[version](data)
+            version = data["version"]
+
+        return cls.from_dict(data["state"])
+
+
+# Decodes a value from a v0 save file. Only the jsonpickle tags that the saved
+# fields were encoded with are understood, so no class named in the file is
+# ever instantiated; other tagged values raise ValueError.
+def restore_v0_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return [restore_v0_value(v) for v in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    if "py/tuple" in value:
+        return tuple(restore_v0_value(v) for v in value["py/tuple"])
+
+    if value.get("py/object") == "datetime.datetime":
+        return restore_v0_datetime(value)
+
+    tags = [k for k in value if k.startswith("py/")]
+    if tags:
+        raise ValueError(f"Unsupported jsonpickle tag '{tags[0]}'")
+
+    return {k: restore_v0_value(v) for k, v in value.items()}
+
+
+# jsonpickle encodes naive datetimes by their pickle state, the base64 encoded
+# bytes that the datetime constructor accepts
+def restore_v0_datetime(value: dict[str, Any]) -> datetime:
+    reduce = value.get("__reduce__")
+
+    if not (
+        isinstance(reduce, list)
+        and (len(reduce) == 2)
+        and (reduce[0] == {"py/type": "datetime.datetime"})
+        and isinstance(reduce[1], list)
+        and (len(reduce[1]) == 1)
+        and isinstance(reduce[1][0], str)
+    ):
+        raise ValueError("Unsupported encoding of a datetime")
+
+    return datetime(base64.b64decode(reduce[1][0]))  # type: ignore[arg-type, call-arg]
+
+
+# Save files from earlier versions of the wizard are jsonpickle encodings of the
+# whole Wizard object. Only the values of the saved fields are restored, so
+# renamed classes don't prevent loading.
+def migrate_v0_to_v1(data: dict[str, Any]) -> dict[str, Any]:
+    # Newer versions of jsonpickle put the object's __getstate__() in py/state
+    pickled_state = data.get("py/state", data)
+    state: dict[str, Any] = {}
+
+    for name in WizardState.field_names():
+        if name not in pickled_state:
+            continue
+
+        try:
+            v = restore_v0_value(pickled_state[name])
+        except Exception:
+            logging.warning(f"Can't restore saved value of '{name}'", exc_info=True)
+            continue
+
+        if isinstance(v, datetime):
+            v = v.isoformat()
+
+        state[name] = v
+
+    return {"version": 1, "state": state}
+
+
+MIGRATIONS: dict[int, Callable[[dict[str, Any]], dict[str, Any]]] = {
+    0: migrate_v0_to_v1,
+}
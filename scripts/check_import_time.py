@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# Fails if importing the wizard takes longer than a budget, or if modules that
+# should only be imported when first used are imported at startup.
+#
+# Usage: python scripts/check_import_time.py [--budget-ms N] [--runs N]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODULE_NAME = "cloudreactor_aws_setup_wizard.__main__"
+DEFAULT_BUDGET_MS = 400.0
+DEFAULT_RUNS = 5
+
+DEFERRED_MODULE_NAMES = ["boto3", "botocore", "jinja2", "jsonpickle", "yaml"]
+
+
+def measure_import_ms() -> float:
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE_NAME}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+
+    # Lines look like "import time: self [us] | cumulative | imported package"
+    for line in output.splitlines():
+        parts = line.split("|")
+        if (len(parts) == 3) and (parts[2].strip() == MODULE_NAME):
+            return int(parts[1]) / 1000.0
+
+    raise RuntimeError(f"No import time reported for {MODULE_NAME}")
+
+
+def find_loaded_deferred_modules() -> list[str]:
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import json, sys; import {MODULE_NAME}; "
+            + f"print(json.dumps([m for m in {DEFERRED_MODULE_NAMES!r} if m in sys.modules]))",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+    return json.loads(output)
+
+
+def run() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(
+            os.environ.get("WIZARD_IMPORT_TIME_BUDGET_MS", DEFAULT_BUDGET_MS)
+        ),
+        help=f"Maximum import time in milliseconds. Defaults to {DEFAULT_BUDGET_MS}.",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=DEFAULT_RUNS,
+        help=f"Number of imports to measure; the fastest is used. Defaults to {DEFAULT_RUNS}.",
+    )
+    args = parser.parse_args()
+
+    loaded_deferred_modules = find_loaded_deferred_modules()
+    if loaded_deferred_modules:
+        print(
+            f"Modules that should be imported on first use were imported at startup: {', '.join(loaded_deferred_modules)}"
+        )
+        return 1
+
+    # A warm-up run writes bytecode caches so they don't count against the budget
+    measure_import_ms()
+    import_ms = min(measure_import_ms() for _ in range(args.runs))
+
+    print(
+        f"Importing {MODULE_NAME} took {import_ms:.1f} ms (budget {args.budget_ms:.1f} ms)"
+    )
+
+    if import_ms > args.budget_ms:
+        print("Import time is over budget")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
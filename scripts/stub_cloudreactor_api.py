@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# Serves the parts of the CloudReactor API that the wizard uses, keeping
+# Groups and Run Environments in memory, so API clients can be tried out,
+# tested and benchmarked offline. Any username and password are accepted.
+#
+# Usage: python scripts/stub_cloudreactor_api.py [--port N] [--latency-ms N]
+#            [--benchmark N] [--max-concurrency N]
+#
+# With --benchmark, N Run Environments are created with the synchronous
+# client, then with the async client, and the times are compared. Otherwise
+# the server runs until interrupted; point the wizard at it by setting
+# CLOUDREACTOR_API_BASE_URL to http://localhost:<port>. Set WIZARD_TIMING=1
+# to also see the time spent per API call.
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cloudreactor_aws_setup_wizard.async_cloudreactor_api_client import (  # noqa: E402
+    DEFAULT_MAX_CONCURRENCY,
+    AsyncCloudReactorApiClient,
+)
+from cloudreactor_aws_setup_wizard.cloudreactor_api_client import (  # noqa: E402
+    CloudReactorApiClient,
+)
+from cloudreactor_aws_setup_wizard.tracing import configure_tracing  # noqa: E402
+
+DEFAULT_PORT = 8008
+DEFAULT_LATENCY_MS = 50.0
+PAGE_SIZE = 50
+ACCESS_TOKEN_LIFETIME_SECONDS = 300
+
+
+def make_token(token_type: str, lifetime_seconds: int) -> str:
+    def encode(value: dict[str, Any]) -> str:
+        return (
+            base64.urlsafe_b64encode(json.dumps(value).encode("utf-8"))
+            .decode("ascii")
+            .rstrip("=")
+        )
+
+    payload = {
+        "token_type": token_type,
+        "exp": int(time.time()) + lifetime_seconds,
+        "jti": uuid.uuid4().hex,
+    }
+
+    return f"{encode({'alg': 'none'})}.{encode(payload)}.stub"
+
+
+class StubApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, latency_ms: float) -> None:
+        super().__init__(("127.0.0.1", port), StubApiRequestHandler)
+        self.latency_seconds = latency_ms / 1000.0
+        self.groups: list[dict[str, Any]] = []
+        self.run_environments: list[dict[str, Any]] = []
+        # Access tokens that are answered with 401, as if they were revoked
+        self.rejected_tokens: set[str] = set()
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubApiRequestHandler(BaseHTTPRequestHandler):
+    server: StubApiServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.handle_api_request("GET")
+
+    def do_POST(self) -> None:
+        self.handle_api_request("POST")
+
+    def do_PATCH(self) -> None:
+        self.handle_api_request("PATCH")
+
+    def handle_api_request(self, method: str) -> None:
+        time.sleep(self.server.latency_seconds)
+
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length)) if length else {}
+
+        with self.server.lock:
+            self.server.request_count += 1
+
+        if url.path in ["/auth/jwt/create/", "/auth/jwt/refresh/"]:
+            self.send_json(
+                200,
+                {
+                    "access": make_token("access", ACCESS_TOKEN_LIFETIME_SECONDS),
+                    "refresh": make_token("refresh", 24 * 60 * 60),
+                },
+            )
+            return
+
+        authorization = self.headers.get("Authorization") or ""
+        if not authorization.startswith("JWT "):
+            self.send_json(
+                401, {"detail": "Authentication credentials were not provided."}
+            )
+            return
+
+        if authorization.removeprefix("JWT ") in self.server.rejected_tokens:
+            self.send_json(401, {"detail": "Given token not valid for any token type"})
+            return
+
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts[:2] != ["api", "v1"] or len(parts) not in [3, 4]:
+            self.send_json(404, {"detail": "Not found."})
+            return
+
+        with self.server.lock:
+            if parts[2] == "groups":
+                self.handle_collection(method, self.server.groups, parts, query, data)
+            elif parts[2] == "run_environments":
+                self.handle_collection(
+                    method, self.server.run_environments, parts, query, data
+                )
+            else:
+                self.send_json(404, {"detail": "Not found."})
+
+    def handle_collection(
+        self,
+        method: str,
+        items: list[dict[str, Any]],
+        parts: list[str],
+        query: dict[str, str],
+        data: dict[str, Any],
+    ) -> None:
+        if len(parts) == 4:
+            item = next((i for i in items if str(i.get("uuid")) == parts[3]), None)
+
+            if item is None:
+                self.send_json(404, {"detail": "Not found."})
+            elif method == "PATCH":
+                item.update(data)
+                self.send_json(200, item)
+            else:
+                self.send_json(200, item)
+            return
+
+        if method == "POST":
+            item = {**data, "id": len(items) + 1, "uuid": str(uuid.uuid4())}
+            items.append(item)
+            self.send_json(201, item)
+            return
+
+        offset = int(query.pop("offset", 0))
+        matches = [item for item in items if self.matches(item, query)]
+        next_url: Optional[str] = None
+
+        if offset + PAGE_SIZE < len(matches):
+            next_query = urlencode({**query, "offset": offset + PAGE_SIZE})
+            next_url = f"{self.server.base_url}{urlparse(self.path).path}?{next_query}"
+
+        self.send_json(
+            200,
+            {
+                "count": len(matches),
+                "next": next_url,
+                "results": matches[offset : offset + PAGE_SIZE],
+            },
+        )
+
+    def matches(self, item: dict[str, Any], query: dict[str, str]) -> bool:
+        if ("name" in query) and (item.get("name") != query["name"]):
+            return False
+
+        if "created_by_group__id" in query:
+            group = item.get("created_by_group") or {}
+            if str(group.get("id")) != query["created_by_group__id"]:
+                return False
+
+        return True
+
+    def send_json(self, status: int, body: Any) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def make_run_environment_data(group_id: int, i: int) -> dict[str, Any]:
+    return {
+        "name": f"benchmark-{i}",
+        "created_by_group": {"id": group_id},
+        "infrastructure_settings": {},
+    }
+
+
+def benchmark(server: StubApiServer, count: int, max_concurrency: int) -> None:
+    client = CloudReactorApiClient(
+        username="benchmark", password="benchmark", api_base_url=server.base_url
+    )
+    group_id = client.create_group({"name": "Benchmark"})["id"]
+
+    started_at = time.monotonic()
+    for i in range(count):
+        client.create_run_environment(make_run_environment_data(group_id, i))
+    sync_seconds = time.monotonic() - started_at
+
+    print(
+        f"Synchronous client: created {count} Run Environments in {sync_seconds:.2f}s"
+    )
+
+    async def create_all() -> None:
+        async with AsyncCloudReactorApiClient(
+            username="benchmark",
+            password="benchmark",
+            api_base_url=server.base_url,
+            max_concurrency=max_concurrency,
+        ) as async_client:
+            await asyncio.gather(
+                *[
+                    async_client.create_run_environment(
+                        make_run_environment_data(group_id, count + i)
+                    )
+                    for i in range(count)
+                ]
+            )
+
+    started_at = time.monotonic()
+    asyncio.run(create_all())
+    async_seconds = time.monotonic() - started_at
+
+    print(
+        f"Async client ({max_concurrency} at once): created {count} Run Environments in {async_seconds:.2f}s"
+    )
+
+    listed_count = sum(1 for _ in client.iterate_run_environments(group_id))
+    print(f"Listed {listed_count} Run Environments")
+
+
+def run() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"Port to listen on, or 0 for any free port. Defaults to {DEFAULT_PORT}.",
+    )
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=DEFAULT_LATENCY_MS,
+        help=f"Delay added to every response. Defaults to {DEFAULT_LATENCY_MS}.",
+    )
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        metavar="N",
+        help="Create N Run Environments with each client, then exit.",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help=f"Requests the async client sends at once. Defaults to {DEFAULT_MAX_CONCURRENCY}.",
+    )
+    args = parser.parse_args()
+
+    port = 0 if args.benchmark else args.port
+    server = StubApiServer(port, args.latency_ms)
+
+    if args.benchmark:
+        # Prints the time spent per API call at exit if WIZARD_TIMING is set
+        configure_tracing()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        benchmark(server, args.benchmark, args.max_concurrency)
+        print(f"The server handled {server.request_count} requests")
+        server.shutdown()
+        return 0
+
+    print(f"Serving a stub CloudReactor API at {server.base_url}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,34 @@
+import importlib.util
+import os
+import threading
+from typing import Any, Iterator
+
+import pytest
+
+STUB_API_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "scripts", "stub_cloudreactor_api.py"
+)
+
+
+def load_stub_api_module() -> Any:
+    spec = importlib.util.spec_from_file_location(
+        "stub_cloudreactor_api", STUB_API_PATH
+    )
+    assert (spec is not None) and (spec.loader is not None)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# A stub CloudReactor API server on a free port, without added latency
+@pytest.fixture
+def stub_api_server() -> Iterator[Any]:
+    server = load_stub_api_module().StubApiServer(0, 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from botocore.credentials import RefreshableCredentials
+
+from cloudreactor_aws_setup_wizard.assumed_roles import AssumedRoleSessions
+
+
+def make_metadata(access_key: str) -> dict[str, str]:
+    return {
+        "access_key": access_key,
+        "secret_key": "secret",
+        "token": "token",
+        "expiry_time": (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat(),
+    }
+
+
+def test_sessions_use_the_assumed_role_credentials(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "SOURCE")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "source-secret")
+
+    sessions = AssumedRoleSessions(
+        source_session_factory=boto3.Session, role_name="Role"
+    )
+    credentials = RefreshableCredentials.create_from_metadata(
+        metadata=make_metadata("ASSUMED"),
+        refresh_using=lambda: make_metadata("REFRESHED"),
+        method="sts-assume-role",
+    )
+    sessions.account_id_to_credentials["123456789012"] = credentials
+
+    session = sessions.make_session("123456789012", "us-west-2")
+
+    assert session.get_credentials() is credentials
+    assert session.get_credentials().access_key == "ASSUMED"
+    assert session.region_name == "us-west-2"
@@ -0,0 +1,85 @@
+import asyncio
+
+from cloudreactor_aws_setup_wizard.async_cloudreactor_api_client import (
+    AsyncCloudReactorApiClient,
+)
+from cloudreactor_aws_setup_wizard.cloudreactor_api_client import CloudReactorApiClient
+
+
+def make_client(server) -> CloudReactorApiClient:
+    return CloudReactorApiClient(
+        username="user", password="password", api_base_url=server.base_url
+    )
+
+
+def test_async_client_creates_updates_and_lists(stub_api_server):
+    async def run():
+        async with AsyncCloudReactorApiClient(
+            username="user",
+            password="password",
+            api_base_url=stub_api_server.base_url,
+            max_concurrency=4,
+        ) as client:
+            group = await client.create_group({"name": "Group"})
+            created = await asyncio.gather(
+                *[
+                    client.create_run_environment(
+                        {"name": f"env-{i}", "created_by_group": {"id": group["id"]}}
+                    )
+                    for i in range(10)
+                ]
+            )
+            updated = await client.update_run_environment(
+                created[0]["uuid"], {"name": "renamed"}
+            )
+            listed = await client.list_run_environments(group["id"])
+            return created, updated, listed
+
+    created, updated, listed = asyncio.run(run())
+
+    assert sorted(r["name"] for r in created) == sorted(f"env-{i}" for i in range(10))
+    assert updated["uuid"] == created[0]["uuid"]
+    assert updated["name"] == "renamed"
+    assert listed["count"] == 10
+    assert "renamed" in [r["name"] for r in listed["results"]]
+
+
+def test_iterate_run_environments_follows_pages(stub_api_server):
+    client = make_client(stub_api_server)
+    group_id = client.create_group({"name": "Group"})["id"]
+    other_group_id = client.create_group({"name": "Other"})["id"]
+
+    for i in range(120):
+        stub_api_server.run_environments.append(
+            {
+                "uuid": f"uuid-{i}",
+                "name": f"env-{i}",
+                "created_by_group": {"id": group_id},
+            }
+        )
+
+    stub_api_server.run_environments.append(
+        {"uuid": "other", "name": "other", "created_by_group": {"id": other_group_id}}
+    )
+
+    for prefetch in [True, False]:
+        names = [
+            r["name"]
+            for r in client.iterate_run_environments(group_id, prefetch=prefetch)
+        ]
+        assert names == [f"env-{i}" for i in range(120)]
+
+
+def test_rejected_access_token_is_renewed_and_request_retried(stub_api_server):
+    client = make_client(stub_api_server)
+    client.create_group({"name": "Group"})
+    old_access_token = client.access_token
+    stub_api_server.rejected_tokens.add(old_access_token)
+    request_count = stub_api_server.request_count
+
+    groups = client.list_groups()
+
+    assert [group["name"] for group in groups["results"]] == ["Group"]
+    assert client.access_token != old_access_token
+    # The rejected request, the token refresh, and the retried request
+    assert stub_api_server.request_count == request_count + 3
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from cloudreactor_aws_setup_wizard.discovery import AwsDiscovery
+from cloudreactor_aws_setup_wizard.discovery_cache import DiscoveryCache
+from cloudreactor_aws_setup_wizard.stack_index import StackIndex, StackSummary
+from cloudreactor_aws_setup_wizard.wizard import Wizard
+
+STACK_ID = "arn:aws:cloudformation:us-west-2:123456789012:stack/Other/1"
+
+
+@pytest.fixture
+def cf_client():
+    return boto3.client(
+        "cloudformation",
+        region_name="us-west-2",
+        aws_access_key_id="AKIDEXAMPLE",
+        aws_secret_access_key="secret",
+    )
+
+
+def make_summary(name: str) -> dict:
+    return {
+        "StackId": f"arn:aws:cloudformation:us-west-2:123456789012:stack/{name}/1",
+        "StackName": name,
+        "CreationTime": datetime(2024, 1, 1),
+        "StackStatus": "CREATE_COMPLETE",
+    }
+
+
+def test_load_records_truncation(cf_client):
+    with Stubber(cf_client) as stubber:
+        stubber.add_response(
+            "list_stacks",
+            {"StackSummaries": [make_summary("First")], "NextToken": "page-2"},
+            {"StackStatusFilter": ANY},
+        )
+
+        stack_index = StackIndex.load(cf_client, max_pages=1)
+
+    assert stack_index.names() == ["First"]
+    assert stack_index.truncated
+
+
+def test_truncated_index_falls_back_to_describe_stacks(cf_client):
+    wizard = Wizard(interactive=False, state_filename=None)
+    wizard.aws_account_id = "123456789012"
+    wizard.aws_region = "us-west-2"
+    stack_index = StackIndex(truncated=True)
+    wizard.get_aws_discovery().put(AwsDiscovery.STACKS, stack_index)
+
+    with Stubber(cf_client) as stubber:
+        stubber.add_response(
+            "describe_stacks",
+            {
+                "Stacks": [
+                    {
+                        "StackId": STACK_ID,
+                        "StackName": "Other",
+                        "CreationTime": datetime(2024, 1, 1),
+                        "StackStatus": "CREATE_COMPLETE",
+                    }
+                ]
+            },
+            {"StackName": "Other"},
+        )
+
+        assert wizard.does_stack_exist("Other", stack_index, cf_client)
+
+        stubber.assert_no_pending_responses()
+
+
+def test_cache_keeps_truncation(tmp_path):
+    cache = DiscoveryCache(str(tmp_path), "123456789012", "us-west-2")
+    summary = StackSummary(name="First", stack_id=STACK_ID, status="CREATE_COMPLETE")
+    cache.store(AwsDiscovery.STACKS, StackIndex([summary], truncated=True), 1.0)
+
+    loaded = DiscoveryCache(str(tmp_path), "123456789012", "us-west-2").load()
+    stack_index, fetched_at = loaded[AwsDiscovery.STACKS]
+
+    assert stack_index.names() == ["First"]
+    assert stack_index.truncated
+    assert fetched_at == 1.0
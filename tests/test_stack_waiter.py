@@ -0,0 +1,248 @@
+from datetime import datetime
+from typing import Any, Optional
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from cloudreactor_aws_setup_wizard.stack_waiter import PollingSchedule, StackWaiter
+
+STACK_ID = "arn:aws:cloudformation:us-west-2:123456789012:stack/test-stack/1"
+STACK_NAME = "test-stack"
+
+
+class FakeClock(object):
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_event(
+    event_id: str,
+    logical_resource_id: str = "Role",
+    resource_type: str = "AWS::IAM::Role",
+    resource_status: str = "CREATE_IN_PROGRESS",
+    physical_resource_id: Optional[str] = None,
+) -> dict[str, Any]:
+    return {
+        "StackId": STACK_ID,
+        "EventId": event_id,
+        "StackName": STACK_NAME,
+        "LogicalResourceId": logical_resource_id,
+        "PhysicalResourceId": physical_resource_id or logical_resource_id,
+        "ResourceType": resource_type,
+        "Timestamp": datetime(2024, 1, 1),
+        "ResourceStatus": resource_status,
+    }
+
+
+def make_stack_event(event_id: str, resource_status: str) -> dict[str, Any]:
+    return make_event(
+        event_id,
+        logical_resource_id=STACK_NAME,
+        resource_type="AWS::CloudFormation::Stack",
+        resource_status=resource_status,
+        physical_resource_id=STACK_ID,
+    )
+
+
+def make_stack(status: str) -> dict[str, Any]:
+    return {
+        "StackId": STACK_ID,
+        "StackName": STACK_NAME,
+        "CreationTime": datetime(2024, 1, 1),
+        "StackStatus": status,
+    }
+
+
+@pytest.fixture
+def cf_client():
+    return boto3.client(
+        "cloudformation",
+        region_name="us-west-2",
+        aws_access_key_id="AKIDEXAMPLE",
+        aws_secret_access_key="secret",
+    )
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+def make_waiter(
+    cf_client, clock: FakeClock, **kwargs: Any
+) -> tuple[StackWaiter, list[str]]:
+    reports: list[str] = []
+    waiter = StackWaiter(
+        cf_client=cf_client,
+        schedule=PollingSchedule(initial_delay=2.0, multiplier=1.0, jitter=0.0),
+        report=reports.append,
+        clock=clock,
+        sleep=clock.sleep,
+        **kwargs,
+    )
+    return waiter, reports
+
+
+def add_events(stubber: Stubber, events: list[dict[str, Any]]) -> None:
+    stubber.add_response(
+        "describe_stack_events", {"StackEvents": events}, {"StackName": STACK_ID}
+    )
+
+
+def add_stack(stubber: Stubber, status: str) -> None:
+    stubber.add_response(
+        "describe_stacks", {"Stacks": [make_stack(status)]}, {"StackName": STACK_ID}
+    )
+
+
+def test_baseline_event_is_fetched_before_the_stack(cf_client, clock):
+    waiter, reports = make_waiter(cf_client, clock)
+
+    with Stubber(cf_client) as stubber:
+        add_events(stubber, [make_event("old")])
+        add_stack(stubber, "CREATE_COMPLETE")
+
+        stack = waiter.wait(stack_id=STACK_ID, stack_name=STACK_NAME)
+
+        stubber.assert_no_pending_responses()
+
+    assert stack["StackStatus"] == "CREATE_COMPLETE"
+    assert clock.sleeps == []
+    assert reports == []
+
+
+def test_only_new_events_are_reported(cf_client, clock):
+    waiter, reports = make_waiter(cf_client, clock)
+
+    with Stubber(cf_client) as stubber:
+        add_events(stubber, [make_event("e1")])
+        add_stack(stubber, "CREATE_IN_PROGRESS")
+        # Newest first
+        add_events(
+            stubber,
+            [
+                make_event("e3", resource_status="CREATE_COMPLETE"),
+                make_event("e2"),
+                make_event("e1"),
+            ],
+        )
+        add_events(
+            stubber,
+            [
+                make_stack_event("e4", "CREATE_COMPLETE"),
+                make_event("e3", resource_status="CREATE_COMPLETE"),
+            ],
+        )
+        add_stack(stubber, "CREATE_COMPLETE")
+
+        stack = waiter.wait(stack_id=STACK_ID, stack_name=STACK_NAME)
+
+        stubber.assert_no_pending_responses()
+
+    assert stack["StackStatus"] == "CREATE_COMPLETE"
+    assert reports[1:] == [
+        "  Role (AWS::IAM::Role): CREATE_IN_PROGRESS",
+        "  Role (AWS::IAM::Role): CREATE_COMPLETE",
+        f"  {STACK_NAME} (AWS::CloudFormation::Stack): CREATE_COMPLETE",
+    ]
+
+
+def test_stack_is_described_after_stack_level_terminal_event(cf_client, clock):
+    waiter, reports = make_waiter(cf_client, clock, max_polls_between_checks=100)
+
+    with Stubber(cf_client) as stubber:
+        add_events(stubber, [])
+        add_stack(stubber, "UPDATE_IN_PROGRESS")
+        add_events(stubber, [make_event("e1", resource_status="UPDATE_COMPLETE")])
+        add_events(stubber, [make_stack_event("e2", "UPDATE_ROLLBACK_COMPLETE")])
+        add_stack(stubber, "UPDATE_ROLLBACK_COMPLETE")
+
+        stack = waiter.wait(stack_id=STACK_ID, stack_name=STACK_NAME)
+
+        stubber.assert_no_pending_responses()
+
+    assert stack["StackStatus"] == "UPDATE_ROLLBACK_COMPLETE"
+    assert clock.sleeps == [2.0, 2.0]
+
+
+def test_timeout(cf_client, clock):
+    waiter, reports = make_waiter(cf_client, clock, timeout=5.0)
+
+    with Stubber(cf_client) as stubber:
+        add_events(stubber, [])
+        add_stack(stubber, "CREATE_IN_PROGRESS")
+        add_events(stubber, [])
+        add_events(stubber, [])
+
+        stack = waiter.wait(stack_id=STACK_ID, stack_name=STACK_NAME)
+
+        stubber.assert_no_pending_responses()
+
+    assert stack is None
+    assert clock.now == 4.0
+    assert reports[-1].startswith(
+        f"Timed out waiting for CloudFormation stack '{STACK_NAME}'"
+    )
+
+
+def test_fatal_error_stops_waiting(cf_client, clock):
+    refreshed: list[bool] = []
+    waiter, reports = make_waiter(
+        cf_client, clock, refresh_client=lambda: refreshed.append(True)
+    )
+
+    with Stubber(cf_client) as stubber:
+        add_events(stubber, [])
+        stubber.add_client_error(
+            "describe_stacks",
+            service_error_code="ValidationError",
+            service_message=f"Stack with id {STACK_ID} does not exist",
+        )
+
+        stack = waiter.wait(stack_id=STACK_ID, stack_name=STACK_NAME)
+
+        stubber.assert_no_pending_responses()
+
+    assert stack is None
+    assert refreshed == []
+    assert clock.sleeps == []
+    assert reports[-1].startswith(
+        f"Can't check the status of CloudFormation stack '{STACK_NAME}'"
+    )
+
+
+def test_throttling_error_keeps_waiting_with_the_same_client(cf_client, clock):
+    refreshed: list[bool] = []
+    waiter, reports = make_waiter(
+        cf_client,
+        clock,
+        refresh_client=lambda: refreshed.append(True),
+        max_polls_between_checks=1,
+    )
+
+    with Stubber(cf_client) as stubber:
+        add_events(stubber, [])
+        stubber.add_client_error(
+            "describe_stacks",
+            service_error_code="Throttling",
+            service_message="Rate exceeded",
+        )
+        add_events(stubber, [])
+        add_stack(stubber, "CREATE_COMPLETE")
+
+        stack = waiter.wait(stack_id=STACK_ID, stack_name=STACK_NAME)
+
+        stubber.assert_no_pending_responses()
+
+    assert stack["StackStatus"] == "CREATE_COMPLETE"
+    assert refreshed == []
+    assert clock.sleeps == [2.0]
@@ -0,0 +1,59 @@
+from typing import Any, Optional
+
+import pytest
+
+from cloudreactor_aws_setup_wizard.wizard import Wizard
+
+GROUP_ID = 7
+
+
+class FakeApiClient(object):
+    def __init__(self, existing: Optional[dict[str, Any]] = None) -> None:
+        self.existing = existing
+        self.created: list[dict[str, Any]] = []
+        self.updated: list[tuple[str, dict[str, Any]]] = []
+
+    def find_run_environment_by_name(
+        self, group_id: int, name: str
+    ) -> Optional[dict[str, Any]]:
+        assert group_id == GROUP_ID
+        return self.existing
+
+    def create_run_environment(self, data: dict[str, Any]) -> dict[str, Any]:
+        self.created.append(data)
+        return {"uuid": "new-uuid", "name": data["name"]}
+
+    def update_run_environment(self, uuid: str, data: dict[str, Any]) -> dict[str, Any]:
+        self.updated.append((uuid, data))
+        return {"uuid": uuid, "name": data["name"]}
+
+
+def make_wizard(api_client: FakeApiClient) -> Wizard:
+    wizard = Wizard(interactive=False, state_filename=None)
+    wizard.aws_account_id = "123456789012"
+    wizard.aws_region = "us-west-2"
+    wizard.cloudreactor_credentials = ("user", "password")
+    wizard.cloudreactor_api_client = api_client  # type: ignore[assignment]
+    wizard.cloudreactor_group = (GROUP_ID, "Group")
+    return wizard
+
+
+@pytest.mark.parametrize(
+    "existing, expected_uuid",
+    [(None, "new-uuid"), ({"uuid": "old-uuid", "name": "staging"}, "old-uuid")],
+)
+def test_run_environment_with_given_name(existing, expected_uuid):
+    api_client = FakeApiClient(existing=existing)
+    wizard = make_wizard(api_client)
+
+    assert wizard.create_or_update_run_environment(run_environment_name="staging")
+    assert wizard.saved_run_environment_uuid == expected_uuid
+    assert wizard.saved_run_environment_name == "staging"
+
+    if existing:
+        assert [uuid for uuid, _ in api_client.updated] == ["old-uuid"]
+        assert api_client.created == []
+    else:
+        assert [data["name"] for data in api_client.created] == ["staging"]
+        assert api_client.created[0]["created_by_group"] == {"id": GROUP_ID}
+        assert api_client.updated == []
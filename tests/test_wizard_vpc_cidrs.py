@@ -0,0 +1,39 @@
+import boto3
+from botocore.stub import Stubber
+
+from cloudreactor_aws_setup_wizard.wizard import Wizard
+
+
+def test_cidr_index_includes_vpcs_past_the_page_limit():
+    ec2_client = boto3.client(
+        "ec2",
+        region_name="us-west-2",
+        aws_access_key_id="AKIDEXAMPLE",
+        aws_secret_access_key="secret",
+    )
+    wizard = Wizard(interactive=False, state_filename=None, max_list_pages=1)
+    wizard.aws_account_id = "123456789012"
+    wizard.aws_region = "us-west-2"
+
+    with Stubber(ec2_client) as stubber:
+        stubber.add_response(
+            "describe_vpcs",
+            {
+                "Vpcs": [{"VpcId": "vpc-1", "CidrBlock": "10.0.0.0/16"}],
+                "NextToken": "page-2",
+            },
+        )
+        stubber.add_response(
+            "describe_vpcs",
+            {"Vpcs": [{"VpcId": "vpc-2", "CidrBlock": "10.1.0.0/16"}]},
+            {"NextToken": "page-2"},
+        )
+
+        rv = wizard.load_vpc_cidr_index(ec2_client)
+
+        stubber.assert_no_pending_responses()
+
+    assert rv is not None
+    vpcs, cidr_index = rv
+    assert [vpc["id"] for vpc in vpcs] == ["vpc-1", "vpc-2"]
+    assert str(cidr_index.find_free()) == "10.2.0.0/16"